@@ -0,0 +1,66 @@
+"""Throughput of the decoding of the calldata of the transactions of the smart contract : the generic decoder of web3 (decode_function_input) against decode_update_txtid.
+
+The calldata are calls of updateTxtid formatted as the roots sent by SendTree, both decoders must give the same values. A call of transferOwnership shows the cost of the fallback to web3.
+
+Run from the horodocs_api folder with : python -m benchmarks.calldata_decoding [nb_transactions ...]
+"""
+
+import sys
+from functools import partial
+from time import perf_counter
+
+from web3 import Web3
+
+from smart_contract.eth_interface import Eth, decode_contract_input, decode_update_txtid
+from smart_contract.transaction_sync import FakeEtherscan
+
+#: Compiled smart contract, whose ABI decodes the inputs of the transactions
+CONTRACT_PATH = "smart_contract/artifacts/contracts/horodatage.sol/Horodatage.json"
+
+
+def measure(function, inputs):
+    """Decode all the inputs.
+
+    :return: Transactions per second, values decoded
+    :rtype: float, List[str]
+    """
+    start = perf_counter()
+    values = [function(input) for input in inputs]
+    return len(inputs) / (perf_counter() - start), values
+
+
+def main(sizes):
+    contract = Web3().eth.contract(abi=Eth.load_abi(CONTRACT_PATH))
+    transfer_ownership = contract.encodeABI("transferOwnership", ["0x" + "11" * 20])
+    decoders = (
+        (
+            "web3",
+            lambda input: contract.decode_function_input(input)[1]["newTxtid"],
+        ),
+        ("decode_update_txtid", decode_update_txtid),
+        (
+            "decode_contract_input",
+            lambda input: decode_contract_input(contract, input)[1]["newTxtid"],
+        ),
+    )
+    print(f"{'txs':>8} | {'decoder':>22} | {'txs/s':>10} | {'speedup':>8}")
+    for nb_transactions in sizes:
+        inputs = [tx["input"] for tx in FakeEtherscan(nb_transactions).transactions]
+        reference_rate, reference = measure(decoders[0][1], inputs)
+        for name, decoder in decoders:
+            rate, values = measure(decoder, inputs)
+            assert values == reference, f"{name} does not decode as web3"
+            print(
+                f"{nb_transactions:>8} | {name:>22} | {rate:>10.0f} | {rate / reference_rate:>7.1f}x"
+            )
+        rate, _ = measure(
+            partial(decode_contract_input, contract),
+            [transfer_ownership] * nb_transactions,
+        )
+        print(
+            f"{nb_transactions:>8} | {'fallback to web3':>22} | {rate:>10.0f} | {rate / reference_rate:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10**4, 10**5])
@@ -0,0 +1,66 @@
+"""Comparison between the former full download of the transactions of the smart contract and the incremental TransactionSync, against a FakeEtherscan.
+
+For each history size, the first synchronisation, a refresh after a few new transactions and a refresh without new transaction are measured, with the number of requests and of transactions received.
+The former full download is a single request, truncated by Etherscan above 10000 transactions.
+
+Run from the horodocs_api folder with : python -m benchmarks.etherscan_sync [nb_transactions ...]
+"""
+
+import os
+import sys
+import tempfile
+from functools import partial
+from time import perf_counter
+
+from web3 import Web3
+
+from smart_contract.eth_interface import Eth, decode_contract_input
+from smart_contract.transaction_store import TransactionStore
+from smart_contract.transaction_sync import FakeEtherscan, TransactionSync
+
+#: Number of transactions added between the first synchronisation and the refresh.
+NB_NEW_TRANSACTIONS = 10
+
+#: Compiled smart contract, whose ABI decodes the inputs of the transactions
+CONTRACT_PATH = "smart_contract/artifacts/contracts/horodatage.sol/Horodatage.json"
+
+
+def measure(function, etherscan):
+    """Call the function, returning its duration and the number of requests it made."""
+    requests = etherscan.requests
+    start = perf_counter()
+    result = function()
+    return perf_counter() - start, etherscan.requests - requests, result
+
+
+def main(sizes):
+    print(
+        f"{'history':>8} | {'method':>20} | {'seconds':>8} | {'requests':>8} | {'received':>8} | {'known':>8}"
+    )
+    for nb_transactions in sizes:
+        etherscan = FakeEtherscan(nb_transactions, transactions_per_block=3)
+        duration, nb_requests, txs = measure(
+            lambda: etherscan.get_contract_transactions(0, 1, 10000), etherscan
+        )
+        print(
+            f"{nb_transactions:>8} | {'full download':>20} | {duration:>8.3f} | {nb_requests:>8} | {len(txs):>8} | {len(txs):>8}"
+        )
+        with tempfile.TemporaryDirectory() as folder:
+            store = TransactionStore(os.path.join(folder, "transactions.db"))
+            contract = Web3().eth.contract(abi=Eth.load_abi(CONTRACT_PATH))
+            transaction_sync = TransactionSync(
+                etherscan, store, partial(decode_contract_input, contract)
+            )
+            for name in ("first sync", "refresh, new txs", "refresh, no new tx"):
+                if name == "refresh, new txs":
+                    etherscan.add_transactions(NB_NEW_TRANSACTIONS)
+                duration, nb_requests, nb_added = measure(
+                    transaction_sync.sync, etherscan
+                )
+                print(
+                    f"{nb_transactions:>8} | {name:>20} | {duration:>8.3f} | {nb_requests:>8} | {nb_added:>8} | {len(store):>8}"
+                )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10**4, 10**5])
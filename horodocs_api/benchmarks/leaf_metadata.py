@@ -0,0 +1,77 @@
+"""Memory used per leaf by the metadata kept until the receipts are sent : the former dict of LeafInfos against the LeafRecord store.
+
+Run from the horodocs_api folder with : python -m benchmarks.leaf_metadata [nb_leaves ...]
+"""
+
+import os
+import sys
+import tracemalloc
+
+from tree_logic.tree import LeafInfos, LeafRecord
+
+
+def submitted_leaves(nb_leaves):
+    """Leaves as submitted by the api, each one with its own LeafInfos parsed from the request."""
+    for i in range(nb_leaves):
+        md5, sha256 = os.urandom(16).hex(), os.urandom(32).hex()
+        leaf_infos = LeafInfos(
+            md5_value=md5,
+            sha256_value=sha256,
+            case_number=f"case-{i % 100}",
+            file_id=f"file-{i}",
+            investigator="investigator",
+            email_user="user@example.com",
+            comments="",
+            want_ancrage_informations=False,
+            language="fr",
+            password=None,
+        )
+        date_readable = "2023-01-01 12:00:00 (CET+0100)"
+        file_infos = (
+            os.urandom(32).hex(),
+            "2023-01-0112000(CET+0100)",
+            md5,
+            sha256,
+            date_readable,
+        )
+        yield os.urandom(32), leaf_infos, f"Q-{i}", file_infos
+
+
+def dict_store(leaves):
+    """Former storage : email_leaf_association[leaf] = (email, leaf_infos, file_infos, quittance)"""
+    return {
+        element: (leaf_infos.email_user, leaf_infos, file_infos, quittance)
+        for element, leaf_infos, quittance, file_infos in leaves
+    }
+
+
+def record_store(leaves):
+    """LeafRecord storage, indexed by the position of the leaf."""
+    return [
+        LeafRecord(leaf_infos, quittance, file_infos)
+        for _, leaf_infos, quittance, file_infos in leaves
+    ]
+
+
+def measure(store, nb_leaves):
+    """Memory still allocated once the store is built. The NodeStore holding the digests of the leaves is not measured."""
+    tracemalloc.start()
+    stored = store(submitted_leaves(nb_leaves))
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del stored
+    return memory
+
+
+def main(sizes):
+    print(f"{'leaves':>9} | {'storage':>10} | {'memory (MB)':>11} | {'bytes/leaf':>10}")
+    for nb_leaves in sizes:
+        for name, store in (("dict", dict_store), ("LeafRecord", record_store)):
+            memory = measure(store, nb_leaves)
+            print(
+                f"{nb_leaves:>9} | {name:>10} | {memory / 2**20:>11.2f} | {memory / nb_leaves:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10**4, 10**5])
@@ -0,0 +1,61 @@
+"""Latency of the hashing of one level of the tree, serially and with the pools of LevelHasher, to choose TREE_HASH_MIN_PAIRS.
+
+Run from the horodocs_api folder with : python -m benchmarks.level_hashing [nb_workers]
+"""
+
+import os
+import sys
+from time import perf_counter
+
+from tree_logic.level_hasher import PAIR_SIZE, LevelHasher, hash_pairs
+
+#: Number of pairs of the hashed levels
+SIZES = [2**n for n in range(8, 21, 2)]
+
+#: Number of times each level is hashed, the best time is kept
+NB_RUNS = 3
+
+
+def best_time(function, children):
+    """Run the hashing NB_RUNS times and return the best time."""
+    times = []
+    for _ in range(NB_RUNS):
+        start = perf_counter()
+        function(children)
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main(workers):
+    hasher = LevelHasher()
+    hasher.workers = workers
+    hasher.min_pairs = 0
+    print(f"{workers} workers")
+    print(
+        f"{'pairs':>9} | {'serial (ms)':>11} | {'thread (ms)':>11} | {'process (ms)':>12}"
+    )
+    crossover = {}
+    for nb_pairs in SIZES:
+        children = os.urandom(nb_pairs * PAIR_SIZE)
+        times = {"serial": best_time(hash_pairs, children)}
+        for mode in ("thread", "process"):
+            hasher.shutdown()
+            hasher.mode = mode
+            # the first call starts the workers, which is not part of the hashing time.
+            hasher.hash_level(children[: workers * PAIR_SIZE])
+            times[mode] = best_time(hasher.hash_level, children)
+            if mode not in crossover and times[mode] < times["serial"]:
+                crossover[mode] = nb_pairs
+        print(
+            f"{nb_pairs:>9} | {times['serial'] * 1e3:>11.2f} | {times['thread'] * 1e3:>11.2f} | {times['process'] * 1e3:>12.2f}"
+        )
+    hasher.shutdown()
+    for mode in ("thread", "process"):
+        if mode in crossover:
+            print(f"{mode} pool faster from {crossover[mode]} pairs")
+        else:
+            print(f"{mode} pool never faster")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1)
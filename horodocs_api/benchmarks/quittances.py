@@ -0,0 +1,49 @@
+"""Throughput of the creation of the quittances and salts of the leaves, and number of distinct quittances created within a single second : the former quittance of the date only against the quittance of the date, the process and a counter.
+
+The salts are taken from the EntropyPool, from its memory or from os.urandom when the true random generator can't keep up.
+
+Run from the horodocs_api folder with : python -m benchmarks.quittances [nb_leaves ...]
+"""
+
+import struct
+import sys
+from time import perf_counter
+
+from tree_logic.functions import create_quittance, create_salts, hash_sha256
+
+
+def former_quittance(time):
+    """Former quittance : SHA256 of the date only."""
+    hashed_quitt_id = list(hash_sha256([struct.pack(">d", time)]))
+    for i in (2, 8, 15, 22, 29):
+        hashed_quitt_id[i] = "-"
+    return "".join(hashed_quitt_id[:32]).upper()
+
+
+def measure(function, nb_leaves):
+    """Call the function once per leaf for the same second.
+
+    :return: Leaves per second, number of distinct results
+    :rtype: float, int
+    """
+    start = perf_counter()
+    results = [function(1700000000) for _ in range(nb_leaves)]
+    duration = perf_counter() - start
+    return nb_leaves / duration, len(set(results))
+
+
+def main(sizes):
+    print(f"{'leaves':>9} | {'function':>16} | {'leaves/s':>12} | {'distinct':>9}")
+    functions = (
+        ("former quittance", former_quittance),
+        ("quittance", create_quittance),
+        ("salt", lambda time: create_salts(1)[0]),
+    )
+    for nb_leaves in sizes:
+        for name, function in functions:
+            rate, distinct = measure(function, nb_leaves)
+            print(f"{nb_leaves:>9} | {name:>16} | {rate:>12.0f} | {distinct:>9}")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10**4, 10**5])
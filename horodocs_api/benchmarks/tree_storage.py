@@ -0,0 +1,105 @@
+"""Memory and latency comparison between the former dict based storage of the tree and the NodeStore.
+
+Run from the horodocs_api folder with : python -m benchmarks.tree_storage [nb_leaves ...]
+"""
+
+import hashlib
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+from tree_logic.functions import find_next_power_of_2
+from tree_logic.node_store import NodeStore
+
+#: Number of leaves for which the branches are extracted during the latency measure.
+NB_PROOFS = 1000
+
+
+class DictTree:
+    """Former storage of TreeBuilder : a dict keyed by (level, index) holding hexdigests."""
+
+    def __init__(self):
+        self.parts = {}
+        self.nb_elements = 0
+
+    def add(self, element):
+        i, j = 0, self.nb_elements
+        self.parts[(0, j)] = element
+        while (j % 2) == 1:
+            self.parts[(i + 1, (j - 1) // 2)] = hashlib.sha256(
+                bytes.fromhex(self.parts[(i, j - 1)])
+                + bytes.fromhex(self.parts[(i, j)])
+            ).hexdigest()
+            j = (j - 1) // 2
+            i = i + 1
+        self.nb_elements += 1
+
+    def branches(self, n, depth):
+        vals = []
+        j = n
+        for i in range(depth):
+            vals.append((i, j ^ 1, self.parts[(i, j ^ 1)]))
+            j = j // 2
+        return vals
+
+
+class StoreTree:
+    """Storage of TreeBuilder based on the NodeStore."""
+
+    def __init__(self):
+        self.parts = NodeStore()
+        self.nb_elements = 0
+
+    def add(self, element):
+        i, j = 0, self.nb_elements
+        self.parts.append(0, bytes.fromhex(element))
+        while (j % 2) == 1:
+            self.parts.append(
+                i + 1,
+                hashlib.sha256(self.parts.get_pair(i, j - 1)).digest(),
+            )
+            j = (j - 1) // 2
+            i = i + 1
+        self.nb_elements += 1
+
+    def branches(self, n, depth):
+        return self.parts.get_siblings_hex(n, depth)
+
+
+def measure(tree_class, leaves):
+    """Build a tree and extract branches, returning the memory used and the timings."""
+    tracemalloc.start()
+    start = perf_counter()
+    tree = tree_class()
+    for leaf in leaves:
+        tree.add(leaf)
+    build_time = perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    depth = len(leaves).bit_length() - 1
+    step = max(1, len(leaves) // NB_PROOFS)
+    start = perf_counter()
+    for n in range(0, len(leaves), step):
+        tree.branches(n, depth)
+    proof_time = (perf_counter() - start) / len(range(0, len(leaves), step))
+    return memory, build_time, proof_time
+
+
+def main(sizes):
+    print(
+        f"{'leaves':>9} | {'storage':>9} | {'memory (MB)':>11} | {'build (s)':>9} | {'proof (us)':>10}"
+    )
+    for nb_leaves in sizes:
+        # both storages hold a tree completed to 2^n leaves, as finalize_tree does up to version 2
+        leaves = [os.urandom(32).hex() for _ in range(find_next_power_of_2(nb_leaves))]
+        for name, tree_class in (("dict", DictTree), ("NodeStore", StoreTree)):
+            memory, build_time, proof_time = measure(tree_class, leaves)
+            print(
+                f"{len(leaves):>9} | {name:>9} | {memory / 2**20:>11.2f} | {build_time:>9.2f} | {proof_time * 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [2**10, 2**17, 2**20])
@@ -5,6 +5,9 @@ import datetime
 class EtherscanAPIException(Exception):
     pass
 
+class EtherscanRateLimitException(EtherscanAPIException):
+    pass
+
 class ContractCommunicationException(Exception):
     pass
 
@@ -1,26 +1,43 @@
 import ast
-import json
+import asyncio
 import random
 import string
+from functools import partial
 from logging.config import dictConfig
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI, HTTPException, Security, status
+from fastapi import Depends, FastAPI, HTTPException, Request, Security, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from api_security import get_admin_api_key, get_api_key, CheckWebsiteHealth
+from ndjson_stream import NDJSONStreamingResponse
 from smart_contract.eth_interface import (
     Eth,
     GetAllContractTransactions,
     deactivate_horodating,
 )
+from smart_contract.finality_tracker import FinalityTracker
+from smart_contract.transaction_store import get_transaction_store
 from sql_db import db_utils, models, schemas
 from sql_db.database import engine, get_db
 from tree_logic.functions import *
-from tree_logic.tree import LeafInfos, SendTree, TreeBuilder, tree_mutex
-
-from cachetools import TTLCache
-from settings import LOG_CONFIG
+from tree_logic.clock import ClockService
+from tree_logic.entropy_pool import EntropyPool
+from tree_logic.metrics import Metrics
+from tree_logic.tree import LeafInfos, SendTree, TreeBuilder, TreeManager
+from tree_logic.tree_archive import TreeArchive
+
+from typing import List
+
+from cachetools import LRUCache, TTLCache
+from settings import (
+    ACTUAL_VERSION,
+    ARCHIVE_CACHE_SIZE,
+    ARCHIVE_DIR,
+    LOG_CONFIG,
+    MAX_LEAVES_PER_BATCH,
+)
 
 dictConfig(LOG_CONFIG)
 
@@ -29,12 +46,21 @@ API_KEY_LENGTH = 32
 #: Cache for the requests so we don't need to calculate every request if we already have done it.
 cache = TTLCache(maxsize=100, ttl=60)
 
+#: Archives of trees kept open to find the proofs, see TreeArchive.
+archives = LRUCache(maxsize=ARCHIVE_CACHE_SIZE)
+
 # Load the database
 models.Base.metadata.create_all(bind=engine)
 
 # Load FastAPI
 app = FastAPI(debug=True)
 
+# Start the synchronisation of the clock with the ntp servers
+ClockService()
+
+# Restore the tree and start the leaf writer, before the requests and the SendTree daemon use it
+tree_manager = TreeManager()
+
 # Start the SendTree daemon
 t = SendTree()
 t.daemon = True
@@ -48,6 +74,9 @@ c.start()
 # Init the smart contract logic to communicate with
 bc = Eth()
 
+# Start the polling of the finalized block
+FinalityTracker()
+
 # Start the website Health check daemon
 health_thread = CheckWebsiteHealth("http://127.0.0.1:8000/ht/")
 health_thread.daemon = True
@@ -98,15 +127,7 @@ async def get_transactions(timestamp: int, api_key: str = Security(get_api_key))
     t1 = timestamp - 3600
     t2 = timestamp + 3600
 
-    with open("contract_transactions.json", "r") as openfile:
-        txs = json.load(openfile)
-    txs = list(
-        filter(
-            lambda x: int(x["timeStamp"]) > t1 and int(x["timeStamp"]) < t2,
-            txs["result"],
-        )
-    )
-    return txs
+    return get_transaction_store().get_range(t1, t2)
 
 
 @app.get("/check_transaction/{transaction_hash}")
@@ -120,7 +141,7 @@ async def get_transactions(transaction_hash: str, api_key: str = Security(get_ap
     :return: State of the transaction
     :rtype: int
     """
-    return bc.check_transaction_validation(transaction_hash)
+    return FinalityTracker().check_transaction_validation(transaction_hash)
 
 
 @app.put("/update_config/")
@@ -152,6 +173,23 @@ async def update_config(
         )
 
 
+@app.get("/metrics/")
+async def get_metrics(api_key: str = Security(get_admin_api_key)):
+    """Get the counters and summaries of the api, as the sizes of the trees, the time the leaves waited for the close of their tree and the reasons of the closes. Needs admin privileges.
+
+    :param api_key: API Key, defaults to Security(get_admin_api_key)
+    :type api_key: str, optional
+    :return: Counters and summaries (count, sum, min, max, last and mean) by name, the part of the random bytes given by the true random generator (see EntropyPool.get_qrng_ratio), the state of the clock (see ClockService.get_status) and the state of the finality tracker (see FinalityTracker.get_status)
+    :rtype: Dict[str, Dict]
+    """
+    return dict(
+        Metrics().get_all(),
+        entropy_qrng_ratio=EntropyPool().get_qrng_ratio(),
+        clock=ClockService().get_status(),
+        finality=FinalityTracker().get_status(),
+    )
+
+
 @app.put("/reactivate_horodating/")
 async def reactivate_horodating(api_key: str = Security(get_admin_api_key)):
     """Reactivate the horodating functionality. Needs admin privileges.
@@ -193,74 +231,100 @@ async def create_api_key(
     return db_utils.create_api_key_db(db=db, api_key=key)
 
 
+@app.put("/set_express_api_key/")
+async def set_express_api_key(
+    express_key: schemas.ExpressAPIKeyItem,
+    db: Session = Depends(get_db),
+    api_key: str = Security(get_admin_api_key),
+):
+    """Allow or forbid an API key to submit leaves in the express lane (see LeafInfos.express). Needs admin privileges.
+
+    :param express_key: API key value and whether it can use the express lane
+    :type express_key: schemas.ExpressAPIKeyItem
+    :param db: Database, defaults to Depends(get_db)
+    :type db: Session, optional
+    :param api_key: API Key, defaults to Security(get_admin_api_key)
+    :type api_key: str, optional
+    :raises HTTPException: if the API key does not exist
+    :return: Success message
+    :rtype: Dict[str,str]
+    """
+    key = db_utils.set_express_api_key(
+        db=db, api_key=express_key.value, is_express=express_key.is_express
+    )
+    if key:
+        return {"message": "Success"}
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid API key"
+        )
+
+
+def check_express(leaves_infos, api_key, db):
+    """Check that an API key is allowed to use the express lane if one of the files asks for it.
+
+    :param leaves_infos: Informations of the files
+    :type leaves_infos: List[LeafInfos]
+    :param api_key: API Key of the request
+    :type api_key: models.APIKeys
+    :param db: Database
+    :type db: Session
+    :raises HTTPException: if a file is express and the API key can't use the express lane
+    """
+    if any(leaf_infos.express for leaf_infos in leaves_infos):
+        if not db_utils.is_express_api_key(db, api_key.value):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="This API key can't use the express lane.",
+            )
+
+
+async def submit_leaves(leaves):
+    """Submit leaves to the leaf writer and wait until they are written to the log of the tree, so they survive a restart of the api.
+
+    :param leaves: Leaves to add, see TreeManager.submit_leaves
+    :type leaves: List[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+    :raises HTTPException: if the leaves could not be written
+    """
+    written = await run_in_threadpool(tree_manager.submit_leaves, leaves)
+    try:
+        await asyncio.wrap_future(written)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The leaves could not be saved, try again later.",
+        )
+
+
 @app.post("/add_leaf_tree/")
-async def add_leaf_tree(leaf_infos: LeafInfos, api_key: str = Security(get_api_key)):
-    """Adds a new leaf in the current tree. If the tree is locked, adds the leaf in the waiting list.
+async def add_leaf_tree(
+    leaf_infos: LeafInfos,
+    db: Session = Depends(get_db),
+    api_key: str = Security(get_api_key),
+):
+    """Adds a new leaf in the current tree. The leaf is queued and added by the leaf writer with the other leaves of its batch, the success is returned once it is written to the log of the tree.
 
     :param leaf_infos: Informations of the new leaf to add
     :type leaf_infos: LeafInfos
+    :param db: Database, defaults to Depends(get_db)
+    :type db: Session, optional
     :param api_key: API Key, defaults to Security(get_api_key)
     :type api_key: str, optional
-    :raises HTTPException: if horodating is not activated. Meaning this functionality is deactivated
+    :raises HTTPException: if horodating is not activated. Meaning this functionality is deactivated, if the API key can't use the express lane or if the leaf could not be saved
     :return: Success message
     :rtype: Dict[str,str]
     """
     if not deactivate_horodating.is_set():
+        check_express([leaf_infos], api_key, db)
         if is_valid_md5(leaf_infos.md5_value) and is_valid_sha256(
             leaf_infos.sha256_value
         ):
             ts, tz = get_now_time()
-            now_date_readable = f'{ts.strftime("%Y-%m-%d %H:%M:%S")} ({tz})'
-            now_date_filename = now_date_readable.replace(" ", "").replace(":", "")
-            ts = int(ts.timestamp())
-            salt, quittance = create_salt_and_quittance(ts)
-
-            hash_signature = hash_sha256(
-                [
-                    convert_hexstring_to_binary(salt),
-                    struct.pack(">d", ts),
-                    convert_hexstring_to_binary(leaf_infos.md5_value),
-                    convert_hexstring_to_binary(leaf_infos.sha256_value),
-                ]
+            salt, quittance = create_salt_and_quittance(int(ts.timestamp()))
+            hash_signature, file_data = create_leaf(
+                leaf_infos.md5_value, leaf_infos.sha256_value, ts, tz, salt
             )
-            file_data = (
-                salt,
-                now_date_filename,
-                leaf_infos.md5_value,
-                leaf_infos.sha256_value,
-                now_date_readable,
-            )
-            tree = TreeBuilder()
-            if (
-                tree_mutex.locked()
-            ):  # if the tree is finalizing we put the new leaf in the waiting list.
-                tree.add_waiting_elem(
-                    hash_signature,
-                    leaf_infos.email_user,
-                    leaf_infos,
-                    quittance,
-                    file_data,
-                )
-            else:
-                tree_mutex.acquire()
-                try:
-                    tree.add_elem(
-                        hash_signature,
-                        leaf_infos.email_user,
-                        leaf_infos,
-                        quittance,
-                        file_data,
-                    )
-                    if leaf_infos.want_ancrage_informations:
-                        tree.add_mail_ancrage(
-                            leaf_infos.email_user,
-                            quittance,
-                            leaf_infos.case_number,
-                            leaf_infos.file_id,
-                            leaf_infos.language,
-                        )
-                finally:
-                    tree_mutex.release()
+            await submit_leaves([(hash_signature, leaf_infos, quittance, file_data)])
             return {"message": "Success"}
         else:
             raise HTTPException(
@@ -274,6 +338,199 @@ async def add_leaf_tree(leaf_infos: LeafInfos, api_key: str = Security(get_api_k
         )
 
 
+def create_batch_leaves(leaves_infos):
+    """Check the files of a batch and calculate their leaves. All the files share the same submission date, each one has its own quittance.
+
+    :param leaves_infos: Informations of the files
+    :type leaves_infos: List[LeafInfos]
+    :return: The leaves of the valid files (see TreeManager.submit_leaves) and, for each file in the same order, its quittance or the error that prevented to add it
+    :rtype: List[Tuple[bytes, LeafInfos, str, tuple]], List[Dict[str,str]]
+    """
+    valid_leaves = [
+        is_valid_md5(leaf_infos.md5_value) and is_valid_sha256(leaf_infos.sha256_value)
+        for leaf_infos in leaves_infos
+    ]
+    ts, tz = get_now_time()
+    nb_valid = valid_leaves.count(True)
+    quittances = iter(create_quittances(int(ts.timestamp()), nb_valid))
+    salts = iter(create_salts(nb_valid))
+    leaves = []
+    results = []
+    for leaf_infos, valid in zip(leaves_infos, valid_leaves):
+        if valid:
+            hash_signature, file_data = create_leaf(
+                leaf_infos.md5_value, leaf_infos.sha256_value, ts, tz, next(salts)
+            )
+            quittance = next(quittances)
+            leaves.append((hash_signature, leaf_infos, quittance, file_data))
+            results.append({"quittance": quittance})
+        else:
+            results.append({"error": "MD5 and/or SHA256 incorrect."})
+    return leaves, results
+
+
+@app.post("/add_leaf_tree_batch/")
+async def add_leaf_tree_batch(
+    leaves_infos: List[LeafInfos],
+    db: Session = Depends(get_db),
+    api_key: str = Security(get_api_key),
+):
+    """Adds several leaves in the current tree at once. All the leaves share the same submission date and are added together by the leaf writer.
+
+    :param leaves_infos: Informations of the new leaves to add
+    :type leaves_infos: List[LeafInfos]
+    :param db: Database, defaults to Depends(get_db)
+    :type db: Session, optional
+    :param api_key: API Key, defaults to Security(get_api_key)
+    :type api_key: str, optional
+    :raises HTTPException: if horodating is not activated, if there are too many leaves or if the API key can't use the express lane
+    :return: For each leaf, in the same order, its quittance or the error that prevented to add it
+    :rtype: List[Dict[str,str]]
+    """
+    if deactivate_horodating.is_set():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Horodating not available for the moment.",
+        )
+    if len(leaves_infos) > MAX_LEAVES_PER_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can't contain more than {MAX_LEAVES_PER_BATCH} leaves.",
+        )
+    check_express(leaves_infos, api_key, db)
+    leaves, results = create_batch_leaves(leaves_infos)
+    if len(leaves) > 0:
+        await submit_leaves(leaves)
+    return results
+
+
+@app.post("/add_leaf_subtree/")
+async def add_leaf_subtree(
+    leaves_infos: List[LeafInfos],
+    db: Session = Depends(get_db),
+    api_key: str = Security(get_api_key),
+):
+    """Adds several files in the current tree as a single leaf. A sub-tree is built over the files and only its root becomes a leaf of the tree.
+
+    The receipt of each file contains its branches in the sub-tree followed by the branches of the sub-tree root in the tree (see :ref:`ACTUAL_VERSION <constants>`).
+
+    :param leaves_infos: Informations of the files to add
+    :type leaves_infos: List[LeafInfos]
+    :param db: Database, defaults to Depends(get_db)
+    :type db: Session, optional
+    :param api_key: API Key, defaults to Security(get_api_key)
+    :type api_key: str, optional
+    :raises HTTPException: if horodating is not activated, if there are too many files or if the API key can't use the express lane
+    :return: For each file, in the same order, its quittance or the error that prevented to add it
+    :rtype: List[Dict[str,str]]
+    """
+    if deactivate_horodating.is_set():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Horodating not available for the moment.",
+        )
+    if len(leaves_infos) > MAX_LEAVES_PER_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can't contain more than {MAX_LEAVES_PER_BATCH} leaves.",
+        )
+    check_express(leaves_infos, api_key, db)
+    leaves, results = create_batch_leaves(leaves_infos)
+    if len(leaves) > 0:
+        subtree = TreeBuilder()
+        subtree.add_leaves(leaves)
+        subtree.finalize_tree()
+        await submit_leaves([subtree])
+    return results
+
+
+@app.post("/add_leaf_tree_stream/")
+async def add_leaf_tree_stream(
+    request: Request,
+    db: Session = Depends(get_db),
+    api_key: str = Security(get_api_key),
+):
+    """Adds leaves in the current tree from a stream of newline-delimited JSON LeafInfos. The leaves are added as they arrive and each line is acknowledged in the streamed response.
+
+    Only the line being read is kept in memory. When the leaf writer can't keep up, the reading of the request waits for it.
+
+    :param request: Request whose body is the stream of LeafInfos, one per line
+    :type request: Request
+    :param db: Database, defaults to Depends(get_db)
+    :type db: Session, optional
+    :param api_key: API Key, defaults to Security(get_api_key)
+    :type api_key: str, optional
+    :raises HTTPException: if horodating is not activated
+    :return: Stream of newline-delimited JSON, for each non-empty line : its number (starting at 1) and its quittance or the error that prevented to add it. The express lines are refused if the API key can't use the express lane.
+    :rtype: NDJSONStreamingResponse
+    """
+    if deactivate_horodating.is_set():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Horodating not available for the moment.",
+        )
+    express_allowed = db_utils.is_express_api_key(db, api_key.value)
+    return NDJSONStreamingResponse(
+        request, partial(submit_ndjson_lines, express_allowed=express_allowed)
+    )
+
+
+async def submit_ndjson_lines(lines, line_number, express_allowed):
+    """Parse and submit lines of LeafInfos. All the lines share the same submission date, each one has its own quittance.
+
+    :param lines: JSON LeafInfos, empty lines are ignored
+    :type lines: List[bytes]
+    :param line_number: Number of lines read before those ones
+    :type line_number: int
+    :param express_allowed: Whether the express lines can be submitted
+    :type express_allowed: bool
+    :return: Acknowledgement of each non-empty line
+    :rtype: List[Dict]
+    """
+    acks = []
+    leaves_infos = []
+    for i, line in enumerate(lines, start=line_number + 1):
+        if not line.strip():
+            continue
+        try:
+            leaf_infos = LeafInfos.parse_raw(line)
+        except ValueError:
+            acks.append({"line": i, "error": "Invalid LeafInfos."})
+            continue
+        if leaf_infos.express and not express_allowed:
+            acks.append(
+                {"line": i, "error": "This API key can't use the express lane."}
+            )
+            continue
+        if is_valid_md5(leaf_infos.md5_value) and is_valid_sha256(
+            leaf_infos.sha256_value
+        ):
+            acks.append({"line": i})
+            leaves_infos.append((leaf_infos, acks[-1]))
+        else:
+            acks.append({"line": i, "error": "MD5 and/or SHA256 incorrect."})
+    if len(leaves_infos) == 0:
+        return acks
+    ts, tz = get_now_time()
+    quittances = create_quittances(int(ts.timestamp()), len(leaves_infos))
+    salts = create_salts(len(leaves_infos))
+    leaves = []
+    for (leaf_infos, _), quittance, salt in zip(leaves_infos, quittances, salts):
+        hash_signature, file_data = create_leaf(
+            leaf_infos.md5_value, leaf_infos.sha256_value, ts, tz, salt
+        )
+        leaves.append((hash_signature, leaf_infos, quittance, file_data))
+    try:
+        await submit_leaves(leaves)
+    except HTTPException as e:
+        for _, ack in leaves_infos:
+            ack["error"] = e.detail
+        return acks
+    for (_, ack), quittance in zip(leaves_infos, quittances):
+        ack["quittance"] = quittance
+    return acks
+
+
 @app.get("/verify_receipt/")
 async def verify_receipt(
     salt: str,
@@ -300,7 +557,7 @@ async def verify_receipt(
     :type anterior_branches: str
     :param posterior_branches: the posterior branches
     :type posterior_branches: str
-    :param version: Version to work with
+    :param version: Version to work with. Since version 2, the branches can go through a sub-tree before the tree, the calculation of the root stays the same. Since version 3, the tree is not completed with random nodes and the side of each branch is given by its index, see calc_tree_root.
     :type version: int
     :param api_key: APIKey, defaults to Security(get_api_key)
     :type api_key: str, optional
@@ -309,6 +566,11 @@ async def verify_receipt(
     :rtype: dict[str]
     """
 
+    if version < 1 or version > ACTUAL_VERSION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown version."
+        )
+
     # check if we already treated this receipt in the last minute
     result = cache.get(salt)
     if result is not None:
@@ -322,7 +584,7 @@ async def verify_receipt(
         datetime.strptime(dt[0] + dtimezone, "%Y-%m-%d %H:%M:%S%Z%z")
     )
 
-    file_value = hash_sha256(
+    file_value = hash_sha256_digest(
         [
             convert_hexstring_to_binary(salt),
             struct.pack(">d", int(timestamp)),
@@ -352,57 +614,31 @@ async def verify_receipt(
 
     # now we can calculate the root of the tree
     tree_root, explanation_text = calc_tree_root(
-        leaves_sorted, file_value, tree_position, language
+        leaves_sorted, file_value, tree_position, language, version
     )
     hg, hd = get_hg_hd(tree_root)
 
-    found_tx = None
-    date_transaction = None
-
-    # we check all the transactions in a 2 day interval so we don't need to check all of them (it's faster).
-
-    t1 = timestamp - 86400
-    t2 = timestamp + 86400
-
-    with open("contract_transactions.json", "r") as openfile:
-        txs = json.load(openfile)
-    txs = list(
-        filter(
-            lambda x: int(x["timeStamp"]) > t1 and int(x["timeStamp"]) < t2,
-            txs["result"],
-        )
-    )
-
-    # for each transaction we check if the value corresponds to the receipt (calculated) values
-    for tx in txs:
-        decoded_value = bc.decode_input_tx(tx["input"])[1]["newTxtid"].split(",")
-        if len(decoded_value) > 2:
-            cipher = decoded_value[0]
-            hd_blockchain = decoded_value[1]
-            if hd == hd_blockchain:
-                date_validation_arbre = decoded_value[2]
-                hgg, hgd = get_hg_hd(hg)
-                cipher_text = bytes_xor(
-                    convert_hexstring_to_binary(hgg), convert_hexstring_to_binary(hgd)
-                )
-                lid_decrypted = bytes_xor(
-                    cipher_text, convert_hexstring_to_binary(cipher)
-                ).hex()
-                lid_decrypted = "-".join(
-                    lid_decrypted[i : i + 4] for i in range(0, len(lid_decrypted), 4)
-                )
-                found_tx = tx
-                validation = bc.check_transaction_validation(tx["hash"])
-                date_transaction = datetime.fromtimestamp(
-                    int(tx["timeStamp"])
-                ).strftime("%Y-%m-%d %H:%M:%S")
-                break
-            else:
-                hd_blockchain = None
-    if not found_tx:
+    # the transactions are indexed by the right part of the root they anchor.
+    anchored_tree = get_transaction_store().find_by_hd(hd.hex())
+    if anchored_tree is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Transaction not found."
         )
+    found_tx = anchored_tree.transaction
+    hd_blockchain = anchored_tree.hd
+    date_validation_arbre = anchored_tree.tree_date
+    hgg, hgd = get_hg_hd(hg)
+    cipher_text = bytes_xor(hgg, hgd)
+    lid_decrypted = bytes_xor(
+        cipher_text, convert_hexstring_to_binary(anchored_tree.cipher)
+    ).hex()
+    lid_decrypted = "-".join(
+        lid_decrypted[i : i + 4] for i in range(0, len(lid_decrypted), 4)
+    )
+    validation = FinalityTracker().check_transaction_validation(found_tx["hash"])
+    date_transaction = datetime.fromtimestamp(int(found_tx["timeStamp"])).strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
     dotenv_path = ".env"
     load_dotenv(dotenv_path)
     documentation_address = os.environ.get("HORODOCS_URL_DOCS")
@@ -411,8 +647,8 @@ async def verify_receipt(
         "date": date,
         "md5": md5,
         "sha256": sha256,
-        "file_value": file_value,
-        "tree_root": tree_root,
+        "file_value": file_value.hex(),
+        "tree_root": tree_root.hex(),
         "tree_date": date_validation_arbre,
         "found_tx": found_tx,
         "validation": validation,
@@ -428,3 +664,33 @@ async def verify_receipt(
     if validation == 1:
         cache[salt] = context
     return context
+
+
+@app.get("/proof/{quittance}")
+async def get_proof(
+    quittance: str,
+    db: Session = Depends(get_db),
+    api_key: str = Security(get_api_key),
+):
+    """Get again the proofs of the files of a quittance, from the archives of the closed trees.
+
+    :param quittance: Quittance of the files
+    :type quittance: str
+    :param db: Database, defaults to Depends(get_db)
+    :type db: Session, optional
+    :param api_key: API Key, defaults to Security(get_api_key)
+    :type api_key: str, optional
+    :raises HTTPException: if no archived file has this quittance
+    :return: For each file, the arguments of its QR code (salt, md5, sha256, date, anterior_branches, posterior_branches and version) and the closing time of its tree
+    :rtype: List[Dict]
+    """
+    proofs = []
+    for filename in db_utils.get_archives_of_quittance(db, quittance):
+        if filename not in archives:
+            archives[filename] = TreeArchive(os.path.join(ARCHIVE_DIR, filename))
+        proofs += archives[filename].find_by_quittance(quittance)
+    if len(proofs) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Quittance not found."
+        )
+    return proofs
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+from settings import MAX_NDJSON_LINE_SIZE, NDJSON_MAX_PENDING_CHUNKS
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """Acknowledgements of the lines of a newline-delimited JSON body, streamed while the body is read.
+
+    The StreamingResponse of Starlette listens for the disconnection of the client by calling receive while the response is sent. Reading the body at the same time makes two readers of receive : each message is given to only one of them, so the body is cut and the request fails with ClientDisconnect.
+    Here a single task reads the body and is the only caller of receive. It gives the chunks to stream_ndjson_lines through a queue of :ref:`NDJSON_MAX_PENDING_CHUNKS <constants>` chunks, so the reading waits for the submission of the lines when it can't keep up. A disconnection of the client ends the body as its end does.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, request: Request, submit_lines) -> None:
+        """
+        :param request: Request whose body is the stream of JSON lines
+        :type request: Request
+        :param submit_lines: Coroutine function submitting lines, see stream_ndjson_lines
+        :type submit_lines: Callable
+        """
+        self.request = request
+        #: Chunks read and not yet split into lines, None at the end of the body
+        self.chunks = asyncio.Queue(NDJSON_MAX_PENDING_CHUNKS)
+        super().__init__(stream_ndjson_lines(self.__iter_chunks(), submit_lines))
+
+    async def __read_body(self):
+        """Read the body of the request into the queue, ending it with None."""
+        try:
+            async for chunk in self.request.stream():
+                if chunk:
+                    await self.chunks.put(chunk)
+        except ClientDisconnect:
+            pass
+        await self.chunks.put(None)
+
+    async def __iter_chunks(self):
+        """Yield the chunks of the body, as they are read."""
+        while True:
+            chunk = await self.chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    async def __call__(self, scope, receive, send) -> None:
+        reader = asyncio.create_task(self.__read_body())
+        try:
+            await self.stream_response(send)
+        finally:
+            # the response may fail before the end of the body
+            reader.cancel()
+        if self.background is not None:
+            await self.background()
+
+
+async def stream_ndjson_lines(chunks, submit_lines):
+    """Split chunks of newline-delimited JSON into lines, submit them chunk by chunk and yield the acknowledgement of each line.
+
+    Only the line being read is kept in memory : a line above :ref:`MAX_NDJSON_LINE_SIZE <constants>` bytes is acknowledged with an error and skipped.
+
+    :param chunks: Chunks of the body
+    :type chunks: AsyncIterator[bytes]
+    :param submit_lines: Coroutine function submitting lines, taking the lines and the number of lines read before them and returning the acknowledgement of each non-empty line, see submit_ndjson_lines
+    :type submit_lines: Callable
+    :yield: Acknowledgement of a line, as a JSON line
+    :rtype: str
+    """
+    line_number = 0
+    pending_line = b""
+    skip_line = False
+    async for chunk in chunks:
+        lines = (pending_line + chunk).split(b"\n")
+        pending_line = lines.pop()
+        if skip_line and len(lines) > 0:
+            # end of a line too long, already acknowledged
+            lines.pop(0)
+            skip_line = False
+        for ack in await submit_complete_lines(lines, line_number, submit_lines):
+            yield json.dumps(ack) + "\n"
+        line_number += len(lines)
+        if not skip_line and len(pending_line) > MAX_NDJSON_LINE_SIZE:
+            line_number += 1
+            skip_line = True
+            yield json.dumps({"line": line_number, "error": "Line too long."}) + "\n"
+        if skip_line:
+            pending_line = b""
+    if not skip_line and pending_line.strip():
+        for ack in await submit_complete_lines(
+            [pending_line], line_number, submit_lines
+        ):
+            yield json.dumps(ack) + "\n"
+
+
+async def submit_complete_lines(lines, line_number, submit_lines):
+    """Submit complete lines, the lines above :ref:`MAX_NDJSON_LINE_SIZE <constants>` bytes being acknowledged with an error, as when they are cut across chunks.
+
+    :param lines: Complete lines
+    :type lines: List[bytes]
+    :param line_number: Number of lines read before those ones
+    :type line_number: int
+    :param submit_lines: Coroutine function submitting lines, see stream_ndjson_lines
+    :type submit_lines: Callable
+    :return: Acknowledgement of each non-empty line
+    :rtype: List[Dict]
+    """
+    acks = []
+    first = 0
+    for i, line in enumerate(lines):
+        if len(line) > MAX_NDJSON_LINE_SIZE:
+            acks += await submit_lines(lines[first:i], line_number + first)
+            acks.append({"line": line_number + i + 1, "error": "Line too long."})
+            first = i + 1
+    acks += await submit_lines(lines[first:], line_number + first)
+    return acks
@@ -34,8 +34,8 @@ BUF_SIZE = 65536
 #: URL of the header img used in the pdf.
 HORODOCS_HEADER_IMG_URL = f"{os.getcwd()}/static/img/Poster-header_2.png"
 
-#: Actual version of the system
-ACTUAL_VERSION = 1
+#: Actual version of the system. Since version 2, the branches of a file submitted in a sub-tree go through the sub-tree then the tree, the levels of the tree being shifted by the depth of the sub-tree. Since version 3, the trees are not completed with random nodes, the last node of an odd level is promoted to the next level.
+ACTUAL_VERSION = 3
 
 #: Contact email for the pdf
 CONTACT_EMAIL = "horodatage@unil.ch"
@@ -55,6 +55,96 @@ TRANSACTION_VERIFIER_TIMING = 30
 #: Refresh the transactions linked to the smart contract (in seconds)
 REFRESH_JSON_TRANSACTIONS_TIMING = 300
 
+#: Maximum number of leaves accepted by a single request to /add_leaf_tree_batch/
+MAX_LEAVES_PER_BATCH = 10000
+
+#: Maximum number of submissions waiting for the leaf writer. When reached, new submissions wait for free space.
+LEAF_QUEUE_MAX_SIZE = 10000
+
+#: Maximum size (in bytes) of one line sent to /add_leaf_tree_stream/
+MAX_NDJSON_LINE_SIZE = 65536
+
+#: Maximum number of chunks of a /add_leaf_tree_stream/ body read ahead of the submission of their lines
+NDJSON_MAX_PENDING_CHUNKS = 16
+
+#: Maximum number of leaves added to the tree at once by the leaf writer
+LEAF_WRITER_MAX_BATCH = 1024
+
+#: Maximum time (in seconds) the leaf writer waits for more leaves before adding a batch to the tree
+LEAF_WRITER_FLUSH_INTERVAL = 0.05
+
+#: Folder of the logs of the leaves accepted by the trees, used to restore them after a restart
+TREE_LOG_DIR = f'{os.getcwd()}/data/tree_log/'
+
+#: Number of leaves written to the log of the tree between two checkpoints of its levels
+TREE_CHECKPOINT_INTERVAL = 65536
+
+#: Folder of the archives of the closed trees, used to find the proof of a file again
+ARCHIVE_DIR = f'{os.getcwd()}/data/archives/'
+
+#: Number of archives kept open to answer the requests of proofs
+ARCHIVE_CACHE_SIZE = 32
+
+#: Number of leaves of a tree above which their metadata are moved from the memory to a temporary database on disk
+LEAF_METADATA_SPILL_THRESHOLD = 100000
+
+#: Pool used to hash the big levels of the tree : "process", "thread" or None to always hash serially. hashlib keeps the GIL for the 64 bytes pairs of nodes, so "thread" only helps without GIL.
+TREE_HASH_POOL = "process"
+
+#: Number of workers hashing a level of the tree
+TREE_HASH_WORKERS = os.cpu_count() or 1
+
+#: Minimum number of pairs of nodes in a level to hash it with the pool (see python -m benchmarks.level_hashing). The levels of the leaf writer batches and of the sub-trees stay below it, it is reached when a big tree is rebuilt from its log.
+TREE_HASH_MIN_PAIRS = 65536
+
+#: Number of leaves at which a tree is closed without waiting for its maximum age (day_config, night_config or weekend_config)
+TREE_CLOSE_MAX_LEAVES = 1000000
+
+#: Target time in seconds between the submission of a leaf and the sending of its receipt. A tree is closed early when its oldest leaf would wait longer. None to disable it. It is ignored when it is not below the maximum age of the trees (day_config, night_config or weekend_config), so it never shortens the longer night and weekend trees.
+TREE_CLOSE_TARGET_LATENCY = None
+
+#: Interval in seconds between two checks of the tree close conditions
+TREE_SCHEDULER_POLL_INTERVAL = 1
+
+#: Maximum number of trees closed early for express leaves per hour
+EXPRESS_CLOSES_PER_HOUR = 6
+
+#: Number of random bytes prefetched from the true random generator for the salts and the LIDs, the pool is filled again when it is below half
+ENTROPY_POOL_SIZE = 65536
+
+#: Seconds between two requests to the true random generator while it does not respond
+ENTROPY_QRNG_RETRY_DELAY = 60
+
+#: NTP servers queried by the clock of the api, the median of their times is kept
+NTP_SERVERS = ["0.ch.pool.ntp.org", "1.ch.pool.ntp.org", "2.ch.pool.ntp.org", "3.ch.pool.ntp.org"]
+
+#: Seconds between two synchronisations of the clock with the NTP servers
+NTP_SYNC_INTERVAL = 64
+
+#: Seconds to wait for the response of each NTP server
+NTP_TIMEOUT = 1
+
+#: Maximum correction of the clock per second when it is slewed (500 ppm, as ntpd), so the time never goes back
+CLOCK_MAX_SLEW = 0.0005
+
+#: Corrections of the clock larger than this number of seconds are applied at once instead of being slewed
+CLOCK_STEP_THRESHOLD = 0.128
+
+#: Number of transactions requested per page to the Etherscan API (at most 10000, Etherscan does not give more than 10000 results for a query)
+ETHERSCAN_PAGE_SIZE = 1000
+
+#: Number of attempts of a request to the Etherscan API when it is rate limited or does not respond
+ETHERSCAN_RETRY_TRIES = 6
+
+#: Seconds before the first new attempt of a request to the Etherscan API, doubled at each attempt
+ETHERSCAN_RETRY_DELAY = 1
+
+#: Maximum seconds between two attempts of a request to the Etherscan API
+ETHERSCAN_RETRY_MAX_DELAY = 60
+
+#: Seconds between two requests of the head and finalized block numbers by the FinalityTracker (an ethereum slot lasts 12 seconds)
+FINALITY_POLL_INTERVAL = 12
+
 #: Minimum ethereum in the wallet before warning the admin to put more funds in it
 MIN_ETHEREUM = 1
 
@@ -1,5 +1,6 @@
 import sys
 from web3 import Web3, exceptions
+from eth_utils import function_signature_to_4byte_selector
 from dotenv import load_dotenv
 import json, os
 from pathlib import Path
@@ -8,14 +9,79 @@ import requests
 from threading import Thread, Event
 from time import sleep
 import json
-from settings import REFRESH_JSON_TRANSACTIONS_TIMING, WARN_ADMIN, MIN_ETHEREUM
+from settings import (
+    REFRESH_JSON_TRANSACTIONS_TIMING,
+    WARN_ADMIN,
+    MIN_ETHEREUM,
+    ETHERSCAN_PAGE_SIZE,
+)
 from retry import retry
-from exceptions import EtherscanAPIException, warn_admin, ContractCommunicationException
+from exceptions import (
+    EtherscanAPIException,
+    EtherscanRateLimitException,
+    warn_admin,
+    ContractCommunicationException,
+)
 import logging
+from .transaction_store import get_transaction_store
+from .transaction_sync import TransactionSync
 
 deactivate_horodating = Event()
 logger = logging.getLogger("smart-contract-logger")
 
+#: Selector of the updateTxtid(string) function of the smart contract, the first 4 bytes of its calldata
+UPDATE_TXTID_SELECTOR = function_signature_to_4byte_selector("updateTxtid(string)")
+
+
+def decode_update_txtid(input):
+    """Decode the value sent by a call of updateTxtid directly from its calldata, without the generic decoder of web3.
+
+    The calldata of updateTxtid(string) is the selector, the offset of the string (always 32), its length and its UTF-8 bytes padded with zeros to 32 bytes.
+
+    :param input: Input of the transaction, as hexadecimal or bytes
+    :type input: str or bytes
+    :return: Value sent to the smart contract, None if the input is not a call of updateTxtid with this layout
+    :rtype: str
+    """
+    try:
+        if isinstance(input, str):
+            data = bytes.fromhex(input[2:] if input.startswith("0x") else input)
+        else:
+            data = bytes(input)
+    except ValueError:
+        return None
+    if len(data) < 68 or data[:4] != UPDATE_TXTID_SELECTOR:
+        return None
+    if int.from_bytes(data[4:36], "big") != 32:
+        return None
+    length = int.from_bytes(data[36:68], "big")
+    end = 68 + length
+    padded_length = -(-length // 32) * 32
+    # some encoders give the empty string a word of zeros
+    if len(data) - 68 not in (padded_length, max(padded_length, 32)) or any(data[end:]):
+        return None
+    try:
+        return data[68:end].decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def decode_contract_input(contract, input):
+    """Decode the input of a transaction to the smart contract. The calls of updateTxtid are decoded by decode_update_txtid, the other inputs by the decoder of web3.
+
+    :param contract: Smart contract
+    :type contract: web3.contract.Contract
+    :param input: Input to decode
+    :type input: str
+    :return: Function called and its parameters
+    :rtype: Tuple[ContractFunction, Dict]
+    :raises ValueError: if the input is not a call of a function of the smart contract
+    """
+    value = decode_update_txtid(input)
+    if value is not None:
+        return contract.functions.updateTxtid, {"newTxtid": value}
+    return contract.decode_function_input(input)
+
 
 class Eth:
     """
@@ -116,7 +182,7 @@ class Eth:
         :rtype: str
         """
         transac = self.w3.eth.get_transaction(transac_id)
-        func_obj, func_params = self.contract.decode_function_input(transac["input"])
+        func_obj, func_params = self.decode_input_tx(transac["input"])
         return func_params["newTxtid"]
 
     def get_transac_timestamp(self, transac_id):
@@ -197,16 +263,29 @@ class Eth:
 
         return info_json["abi"]
 
-    def get_all_contract_transactions(self):
-        """Get all the transactions made to the smart contract
-
-        :return: All transactions
-        :rtype: JSON
+    def get_contract_transactions(
+        self, start_block=0, page=1, offset=ETHERSCAN_PAGE_SIZE
+    ):
+        """Get a page of the transactions made to the smart contract from a block
+
+        :param start_block: First block of the transactions, defaults to 0
+        :type start_block: int, optional
+        :param page: Number of the page, from 1, defaults to 1
+        :type page: int, optional
+        :param offset: Number of transactions per page, defaults to ETHERSCAN_PAGE_SIZE
+        :type offset: int, optional
+        :return: Transactions, sorted by block
+        :rtype: List[Dict]
+        :raises EtherscanRateLimitException: if the Etherscan API rate limits the request
+        :raises EtherscanAPIException: if the Etherscan API returns an error
         """
         params = {
             "module": "account",
             "action": "txlist",
             "address": self.contract_address,
+            "startblock": start_block,
+            "page": page,
+            "offset": offset,
             "sort": "asc",
             "apikey": os.environ.get("ETHERSCAN_API_KEY"),
         }
@@ -227,46 +306,47 @@ class Eth:
             logging.debug(r)
             raise e
         if int(data["status"]) == 1:
-            return data
+            return data["result"]
+        elif data["message"] == "No transactions found":
+            return []
+        elif "rate limit" in str(data["result"]).lower():
+            raise EtherscanRateLimitException(data["result"])
         else:
             raise EtherscanAPIException(
                 "An error occured when communicating with Etherscan API."
             )
 
     def decode_input_tx(self, input):
-        """Decode the input thanks to the decode function of the smart contract
+        """Decode the input thanks to the decode function of the smart contract, see decode_contract_input
 
         :param input: Input to decode
         :type input: str
         :return: Input decoded
         :rtype: str
         """
-        decoded_input = self.contract.decode_function_input(input)
+        decoded_input = decode_contract_input(self.contract, input)
         return decoded_input
 
 
 class GetAllContractTransactions(Thread):
-    """Threading class that periodically retrieve all the smart contract transactions."""
+    """Threading class that periodically retrieve the new smart contract transactions.
+
+    The transactions are synchronised incrementally by a TransactionSync into the TransactionStore read by the api.
+    """
 
     def run(self):
         bc = Eth(verifiy_balance=True)
-        error = False
+        store = get_transaction_store()
+        store.import_json(bc.decode_input_tx)
+        transaction_sync = TransactionSync(bc, store, bc.decode_input_tx)
         while True:
             try:
-                transactions = bc.get_all_contract_transactions()
-            except requests.exceptions.ReadTimeout:
-                logging.warning(
-                    "The connection to the Etherscan API timed out. Retrying."
-                )
-                continue
-            except (requests.exceptions.JSONDecodeError, EtherscanAPIException) as e:
+                transaction_sync.sync()
+            except (
+                requests.exceptions.RequestException,
+                EtherscanAPIException,
+            ) as e:
                 logging.error(e)
                 if WARN_ADMIN:
                     warn_admin(e)
-                error = True
-            if not error:
-                j = json.dumps(transactions, indent=4)
-                with open("contract_transactions.json", "w") as f:
-                    f.write(j)
-            error = False
             sleep(REFRESH_JSON_TRANSACTIONS_TIMING)
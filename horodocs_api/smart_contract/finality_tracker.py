@@ -0,0 +1,135 @@
+import logging
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from web3 import exceptions
+
+from settings import FINALITY_POLL_INTERVAL
+from tree_logic.metrics import Metrics
+from tree_logic.singleton import Singleton
+
+from .eth_interface import Eth
+from .transaction_store import get_transaction_store
+
+logger = logging.getLogger("smart-contract-logger")
+
+
+class FinalityTracker(metaclass=Singleton):
+    """Finality of the transactions, answered from memory. This class must be a Singleton to work correctly.
+
+    A background thread requests the head and the finalized block numbers every :ref:`FINALITY_POLL_INTERVAL <constants>` seconds, and the block number of each transaction is kept once it is known.
+    The block of a transaction is taken from the TransactionStore when it is synchronised, from the node otherwise, so the requests to the node no longer grow with the verifications nor with the transactions to verify.
+    The requests made to the node are counted in the Metrics (finality_rpc_requests).
+    """
+
+    def __init__(self, client=None) -> None:
+        """
+        Class initialisation. Will start the thread polling the finalized block.
+
+        :param client: Client of the ethereum node, defaults to an Eth
+        :type client: Eth, optional
+        """
+        self.__client = client if client is not None else Eth()
+        #: Last head block number known, None before the first poll
+        self.head_block = None
+        #: Last finalized block number known, None before the first poll
+        self.finalized_block = None
+        #: Monotonic time of the last poll, None before the first one
+        self.__last_poll = None
+        #: Block number by transaction hash, only for the transactions already in a block
+        self.__blocks = {}
+        #: Protects the poll, so the first callers don't all request the finalized block
+        self.__poll_lock = Lock()
+
+        self.__poller = Thread(target=self.__run, daemon=True)
+        self.__poller.start()
+
+    def poll(self):
+        """Request the head and the finalized block numbers."""
+        with self.__poll_lock:
+            self.__poll()
+
+    def __poll(self):
+        """Request the head and the finalized block numbers, the poll lock being held."""
+        head_block = self.__client.get_last_ethereum_block_number()
+        finalized_block = self.__client.get_last_finalized_block_number()
+        Metrics().increment("finality_rpc_requests", 2)
+        self.head_block = head_block
+        self.finalized_block = finalized_block
+        self.__last_poll = monotonic()
+
+    def get_finalized_block(self):
+        """Get the last finalized block number, requested at once if it was never polled.
+
+        :return: Last finalized block number
+        :rtype: int
+        """
+        if self.finalized_block is None:
+            with self.__poll_lock:
+                if self.finalized_block is None:
+                    self.__poll()
+        return self.finalized_block
+
+    def get_block_number(self, transac_id):
+        """Get the block number of a transaction, requested once.
+
+        :param transac_id: Transaction's hash
+        :type transac_id: str
+        :return: Number of the block containing the transaction, None if it is still pending
+        :rtype: int
+        :raises web3.exceptions.TransactionNotFound: if the node does not know the transaction
+        """
+        block = self.__blocks.get(transac_id)
+        if block is not None:
+            return block
+        block = get_transaction_store().get_block_number(transac_id)
+        if block is None:
+            Metrics().increment("finality_rpc_requests")
+            block = self.__client.get_transac_block_number(transac_id)
+        if block is not None:
+            self.__blocks[transac_id] = block
+        return block
+
+    def check_transaction_validation(self, transac_id):
+        """Check if the block containing the transaction has been validated and if finalized, as Eth.check_transaction_validation but from memory
+
+        :param transac_id: Transaction's hash to check
+        :type transac_id: str
+        :return: Four value int (0,1,2,-1) representing 4 states (Not valid, valid, validation in progress, error)
+        :rtype: int
+        """
+        last_eth_finalized_block_nb = self.get_finalized_block()
+        try:
+            transaction_block_number = self.get_block_number(transac_id)
+        except exceptions.TransactionNotFound:
+            return 0
+        try:
+            if last_eth_finalized_block_nb > transaction_block_number:
+                return 1
+            else:
+                return 2
+        except TypeError:
+            return -1
+
+    def get_status(self):
+        """Get the state of the tracker.
+
+        :return: head and finalized block numbers, seconds since the last poll (None before the first one) and number of transactions whose block is known
+        :rtype: Dict
+        """
+        last_poll = self.__last_poll
+        return {
+            "head_block": self.head_block,
+            "finalized_block": self.finalized_block,
+            "last_poll_age": monotonic() - last_poll if last_poll is not None else None,
+            "known_transactions": len(self.__blocks),
+        }
+
+    def __run(self):
+        """Poll the finalized block every :ref:`FINALITY_POLL_INTERVAL <constants>` seconds."""
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"The finalized block could not be requested : {e}")
+            sleep(FINALITY_POLL_INTERVAL)
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from web3 import Web3
+
+from smart_contract.eth_interface import Eth, decode_contract_input, decode_update_txtid
+from smart_contract.transaction_sync import FakeEtherscan
+
+#: Compiled smart contract, whose ABI decodes the inputs of the transactions
+CONTRACT_PATH = os.path.join(
+    os.path.dirname(__file__), "artifacts/contracts/horodatage.sol/Horodatage.json"
+)
+
+
+@pytest.fixture(scope="module")
+def contract():
+    return Web3().eth.contract(abi=Eth.load_abi(CONTRACT_PATH))
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "",
+        "a" * 32,
+        "a" * 33,
+        "8f2b1c3d4e5f6a7b,00000000000000000000000000000001, 2023-11-14 22:13:20 (Europe/Zurich : CET+0100)",
+        "clé, ünïcødé",
+    ],
+)
+def test_decode_update_txtid_as_web3(contract, value):
+    input = contract.encodeABI("updateTxtid", [value])
+    assert decode_update_txtid(input) == value
+    assert decode_update_txtid(bytes.fromhex(input[2:])) == value
+    assert contract.decode_function_input(input)[1]["newTxtid"] == value
+    function, params = decode_contract_input(contract, input)
+    assert function.fn_name == "updateTxtid"
+    assert params == {"newTxtid": value}
+
+
+def test_decode_update_txtid_of_empty_string_without_padding(contract):
+    input = contract.encodeABI("updateTxtid", [""])
+    # only the length of the string, as solidity encodes it
+    assert decode_update_txtid(input[: 2 + 2 * 68]) == ""
+
+
+def test_decode_update_txtid_of_fake_etherscan(contract):
+    for tx in FakeEtherscan(5).transactions:
+        assert (
+            decode_update_txtid(tx["input"])
+            == contract.decode_function_input(tx["input"])[1]["newTxtid"]
+        )
+
+
+def test_decode_update_txtid_rejects_other_layouts(contract):
+    input = bytes.fromhex(contract.encodeABI("updateTxtid", ["abc"])[2:])
+    # another function
+    assert decode_update_txtid("0x" + "00" * 68) is None
+    assert decode_update_txtid("0xzz") is None
+    # offset of the string other than 32
+    assert decode_update_txtid(input[:35] + b"\x40" + input[36:]) is None
+    # truncated, or padding not made of zeros
+    assert decode_update_txtid(input[:-1]) is None
+    assert decode_update_txtid(input[:-1] + b"\x01") is None
+    assert decode_update_txtid(input[:68] + b"\xff" + input[69:]) is None
+
+
+def test_decode_contract_input_falls_back_to_web3(contract):
+    input = contract.encodeABI("transferOwnership", ["0x" + "11" * 20])
+    function, params = decode_contract_input(contract, input)
+    assert function.fn_name == "transferOwnership"
+    assert params["newOwner"] == Web3.toChecksumAddress("0x" + "11" * 20)
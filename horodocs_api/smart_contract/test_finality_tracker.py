@@ -0,0 +1,100 @@
+from collections import Counter
+from time import sleep
+
+import pytest
+from web3 import exceptions
+
+from smart_contract import finality_tracker, transaction_store
+from smart_contract.eth_interface import Eth
+from smart_contract.finality_tracker import FinalityTracker
+from smart_contract.transaction_store import TransactionStore
+from tree_logic.singleton import Singleton
+
+
+class FakeWeb3Eth:
+    """Stand-in for the eth module of web3, counting the requests made to the node."""
+
+    def __init__(self, head_block, finalized_block, transactions):
+        """
+        :param transactions: Block number of each transaction known by the node, None while it is pending
+        """
+        self.head_block = head_block
+        self.finalized_block = finalized_block
+        self.transactions = transactions
+        self.calls = Counter()
+
+    def get_block_number(self):
+        self.calls["get_block_number"] += 1
+        return self.head_block
+
+    def get_block(self, block_identifier):
+        self.calls["get_block"] += 1
+        assert block_identifier == "finalized"
+        return {"number": self.finalized_block}
+
+    def get_transaction(self, transaction_hash):
+        self.calls[transaction_hash] += 1
+        if transaction_hash not in self.transactions:
+            raise exceptions.TransactionNotFound(transaction_hash)
+        return {"blockNumber": self.transactions[transaction_hash]}
+
+
+class FakeWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+@pytest.fixture
+def fake_node(tmp_path, monkeypatch):
+    """Node with transactions finalized, not finalized, pending and unknown, and a transaction of the store."""
+    store = TransactionStore(str(tmp_path / "transactions.db"))
+    tx = {"hash": "0xe", "blockNumber": "50", "timeStamp": "0", "input": "0x"}
+    store.add_transactions([tx], lambda input: {}, 50)
+    monkeypatch.setattr(transaction_store, "current_store", store)
+    # polled only when the test asks for it
+    monkeypatch.setattr(finality_tracker, "FINALITY_POLL_INTERVAL", 3600)
+    fake_eth = FakeWeb3Eth(120, 100, {"0xa": 90, "0xb": 110, "0xc": None})
+    client = Eth.__new__(Eth)
+    client.w3 = FakeWeb3(fake_eth)
+    Singleton._instances.pop(FinalityTracker, None)
+    yield fake_eth, FinalityTracker(client)
+    Singleton._instances.pop(FinalityTracker, None)
+
+
+def check_all(tracker):
+    return {
+        transac_id: tracker.check_transaction_validation(transac_id)
+        for transac_id in ("0xa", "0xb", "0xc", "0xd", "0xe")
+    }
+
+
+def test_checks_are_answered_from_memory(fake_node):
+    fake_eth, tracker = fake_node
+    while tracker.finalized_block is None:
+        sleep(0.01)
+    for _ in range(3):
+        assert check_all(tracker) == {"0xa": 1, "0xb": 2, "0xc": -1, "0xd": 0, "0xe": 1}
+    # a block is requested once per transaction, the pending and unknown ones at each check
+    assert fake_eth.calls == {
+        "get_block_number": 1,
+        "get_block": 1,
+        "0xa": 1,
+        "0xb": 1,
+        "0xc": 3,
+        "0xd": 3,
+    }
+
+    fake_eth.transactions["0xc"] = 112
+    fake_eth.finalized_block = 115
+    tracker.poll()
+    for _ in range(3):
+        assert check_all(tracker) == {"0xa": 1, "0xb": 1, "0xc": 1, "0xd": 0, "0xe": 1}
+    assert fake_eth.calls == {
+        "get_block_number": 2,
+        "get_block": 2,
+        "0xa": 1,
+        "0xb": 1,
+        "0xc": 4,
+        "0xd": 6,
+    }
+    assert tracker.get_status()["known_transactions"] == 4
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from smart_contract.transaction_store import TransactionStore
+
+
+def decode_input(input):
+    """Decode the inputs of the test, the value sent to updateTxtid, as Eth.decode_input_tx."""
+    if not input.startswith("updateTxtid:"):
+        raise ValueError("Could not find any function with matching selector")
+    return None, {"newTxtid": input[len("updateTxtid:") :]}
+
+
+def make_transaction(tx_hash, block, hd=None):
+    return {
+        "hash": tx_hash,
+        "blockNumber": str(block),
+        "timeStamp": str(1000 + 10 * block),
+        "input": f"updateTxtid:cipher {tx_hash},{hd}, date" if hd else "0x",
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TransactionStore(str(tmp_path / "transactions.db"))
+
+
+def test_find_by_hd_gives_the_first_transaction(store):
+    transactions = [
+        make_transaction("0x3", 7, "ab"),
+        make_transaction("0x1", 5, "ab"),
+        make_transaction("0x2", 5, "ab"),
+        make_transaction("0x4", 6, "cd"),
+        make_transaction("0x5", 6),
+    ]
+    assert store.add_transactions(transactions, decode_input, 7) == 5
+    anchored_tree = store.find_by_hd("ab")
+    assert anchored_tree.transaction == transactions[1]
+    assert anchored_tree.cipher == "cipher 0x1"
+    assert anchored_tree.tree_date == " date"
+    assert store.find_by_hd("cd").transaction == transactions[3]
+    assert store.find_by_hd("ef") is None
+    # the transactions already known are ignored
+    assert store.add_transactions(transactions[:2], decode_input, 8) == 0
+    assert store.get_last_block() == 8
+
+
+def test_get_range_excludes_its_bounds(store):
+    transactions = [make_transaction(f"0x{block}", block) for block in (3, 1, 2, 4)]
+    store.add_transactions(transactions, decode_input, 4)
+    assert store.get_range(1010, 1040) == [transactions[2], transactions[0]]
+    assert store.get_range(0, 2000) == sorted(
+        transactions, key=lambda tx: int(tx["blockNumber"])
+    )
+    assert store.get_range(1040, 2000) == []
+
+
+def test_import_json(store, tmp_path):
+    path = tmp_path / "contract_transactions.json"
+    transactions = [make_transaction("0x1", 5, "ab"), make_transaction("0x2", 9)]
+    assert store.import_json(decode_input, str(path)) == 0
+    # the files written before the block cursor hold the whole history
+    path.write_text(json.dumps({"result": transactions}))
+    assert store.import_json(decode_input, str(path)) == 2
+    assert store.get_last_block() == 9
+    assert store.find_by_hd("ab").transaction == transactions[0]
+    # only imported in an empty store
+    path.write_text(json.dumps({"result": [make_transaction("0x3", 10)]}))
+    assert store.import_json(decode_input, str(path)) == 0
+    assert len(store) == 2
+
+
+def test_import_json_with_block_cursor(store, tmp_path):
+    path = tmp_path / "contract_transactions.json"
+    transactions = [make_transaction("0x1", 5, "ab")]
+    path.write_text(json.dumps({"result": transactions, "last_block": 12}))
+    assert store.import_json(decode_input, str(path)) == 1
+    assert store.get_last_block() == 12
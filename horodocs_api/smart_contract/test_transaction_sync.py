@@ -0,0 +1,72 @@
+import os
+from functools import partial
+
+import pytest
+from web3 import Web3
+
+from smart_contract.eth_interface import Eth, decode_contract_input
+from smart_contract.transaction_store import TransactionStore
+from smart_contract.transaction_sync import FakeEtherscan, TransactionSync
+
+#: Compiled smart contract, whose ABI decodes the inputs of the transactions
+CONTRACT_PATH = os.path.join(
+    os.path.dirname(__file__), "artifacts/contracts/horodatage.sol/Horodatage.json"
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TransactionStore(str(tmp_path / "transactions.db"))
+
+
+def make_sync(etherscan, store, page_size):
+    contract = Web3().eth.contract(abi=Eth.load_abi(CONTRACT_PATH))
+    return TransactionSync(
+        etherscan, store, partial(decode_contract_input, contract), page_size
+    )
+
+
+def assert_synchronised(etherscan, store):
+    """Check that the store holds every transaction of the FakeEtherscan, with the tree it anchors."""
+    assert len(store) == len(etherscan.transactions)
+    assert store.get_last_block() == int(etherscan.transactions[-1]["blockNumber"])
+    for i, tx in enumerate(etherscan.transactions):
+        anchored_tree = store.find_by_hd(i.to_bytes(16, "big").hex())
+        assert anchored_tree.transaction == tx
+        assert store.get_block_number(tx["hash"]) == int(tx["blockNumber"])
+
+
+def test_sync_pages_ending_inside_a_block(store):
+    etherscan = FakeEtherscan(25, transactions_per_block=3)
+    transaction_sync = make_sync(etherscan, store, page_size=10)
+    # the pages end in the blocks of the transactions 9 and 18, which are requested again
+    assert transaction_sync.sync() == 25
+    assert_synchronised(etherscan, store)
+    assert etherscan.requests == 3
+
+
+def test_sync_only_requests_the_new_blocks(store):
+    etherscan = FakeEtherscan(25, transactions_per_block=3)
+    transaction_sync = make_sync(etherscan, store, page_size=10)
+    transaction_sync.sync()
+    requests = etherscan.requests
+    assert transaction_sync.sync() == 0
+    etherscan.add_transactions(4)
+    assert transaction_sync.sync() == 4
+    assert_synchronised(etherscan, store)
+    assert etherscan.requests - requests == 2
+
+
+def test_sync_block_larger_than_a_page(store):
+    etherscan = FakeEtherscan(25, transactions_per_block=12)
+    transaction_sync = make_sync(etherscan, store, page_size=5)
+    assert transaction_sync.sync() == 25
+    assert_synchronised(etherscan, store)
+
+
+def test_sync_retries_rate_limited_requests(store):
+    etherscan = FakeEtherscan(25, transactions_per_block=3, rate_limit_every=3)
+    transaction_sync = make_sync(etherscan, store, page_size=10)
+    assert transaction_sync.sync() == 25
+    assert_synchronised(etherscan, store)
+    assert etherscan.requests == 4
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import sqlite3
+from threading import Lock, local
+
+logger = logging.getLogger("smart-contract-logger")
+
+#: Database of the transactions of the smart contract
+TRANSACTIONS_DB = "contract_transactions.db"
+
+#: File where the transactions were saved before the TransactionStore, imported into the database when it is empty
+TRANSACTIONS_FILE = "contract_transactions.json"
+
+
+class AnchoredTree:
+    """Transaction anchoring the root of a tree, with the values decoded from its input."""
+
+    __slots__ = ("transaction", "cipher", "hd", "tree_date")
+
+    def __init__(self, transaction, cipher, hd, tree_date) -> None:
+        """
+        :param transaction: Transaction, as given by Etherscan
+        :type transaction: Dict
+        :param cipher: LID of the tree, ciphered with the left part of the root
+        :type cipher: str
+        :param hd: Right part of the root, as hexadecimal
+        :type hd: str
+        :param tree_date: Time of closure of the tree
+        :type tree_date: str
+        """
+        self.transaction = transaction
+        self.cipher = cipher
+        self.hd = hd
+        self.tree_date = tree_date
+
+
+def decode_anchored_tree(tx, decode_input):
+    """Decode the values of the tree anchored by a transaction.
+
+    :param tx: Transaction, as given by Etherscan
+    :type tx: Dict
+    :param decode_input: Function decoding the input of a transaction, see Eth.decode_input_tx
+    :type decode_input: Callable
+    :return: cipher, hd and date of the tree, None for each if the transaction does not anchor a tree
+    :rtype: Tuple[str, str, str]
+    """
+    try:
+        decoded_value = decode_input(tx["input"])[1]["newTxtid"].split(",")
+    except (ValueError, KeyError):
+        # contract creation or call of another function
+        return None, None, None
+    if len(decoded_value) <= 2:
+        return None, None, None
+    return decoded_value[0], decoded_value[1], decoded_value[2]
+
+
+class TransactionStore:
+    """Transactions of the smart contract saved in a SQLite database, with the values of the trees they anchor decoded once when they are added.
+
+    The transactions are indexed by timestamp and by the right part of the root they anchor (hd), so the api never reads the whole history, at startup neither.
+    The database is in WAL mode : the requests read it while the synchronisation writes in it without blocking each other, and each write is atomic. Each thread has its own connection.
+    """
+
+    def __init__(self, path=TRANSACTIONS_DB) -> None:
+        """
+        Class initialisation. Will create the database if it does not exist.
+
+        :param path: File of the database, defaults to TRANSACTIONS_DB
+        :type path: str, optional
+        """
+        self.path = path
+        #: Connection of each thread
+        self.__local = local()
+        db = self.__get_db()
+        with db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS transactions (
+                    hash TEXT PRIMARY KEY,
+                    block INTEGER NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    cipher TEXT,
+                    hd TEXT,
+                    tree_date TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp);
+                CREATE INDEX IF NOT EXISTS transactions_hd ON transactions (hd);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    last_block INTEGER NOT NULL
+                );
+                """)
+
+    def __get_db(self):
+        """Get the connection of the current thread, opened at its first use."""
+        db = getattr(self.__local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            # with WAL, a power loss can lose the last commits but never corrupts the database, their blocks are synchronised again.
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.__local.db = db
+        return db
+
+    def add_transactions(self, transactions, decode_input, last_block):
+        """Add transactions and set the last block synchronised, in a single database transaction. The transactions already known are ignored.
+
+        :param transactions: Transactions, as given by Etherscan
+        :type transactions: List[Dict]
+        :param decode_input: Function decoding the input of a transaction, see Eth.decode_input_tx
+        :type decode_input: Callable
+        :param last_block: Last block whose transactions are all known
+        :type last_block: int
+        :return: Number of transactions added
+        :rtype: int
+        """
+        rows = [
+            (
+                tx["hash"],
+                int(tx["blockNumber"]),
+                int(tx["timeStamp"]),
+                *decode_anchored_tree(tx, decode_input),
+                json.dumps(tx),
+            )
+            for tx in transactions
+        ]
+        db = self.__get_db()
+        with db:
+            changes = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            nb_added = db.total_changes - changes
+            db.execute("INSERT OR REPLACE INTO sync_state VALUES (0, ?)", (last_block,))
+        return nb_added
+
+    def get_last_block(self):
+        """Get the last block synchronised.
+
+        :return: Last block whose transactions are all known, -1 before the first synchronisation
+        :rtype: int
+        """
+        row = self.__get_db().execute("SELECT last_block FROM sync_state").fetchone()
+        return row[0] if row is not None else -1
+
+    def get_range(self, start, end):
+        """Get the transactions strictly between two timestamps.
+
+        :param start: Start timestamp, excluded
+        :type start: int
+        :param end: End timestamp, excluded
+        :type end: int
+        :return: Transactions, as given by Etherscan, sorted by timestamp
+        :rtype: List[Dict]
+        """
+        rows = self.__get_db().execute(
+            "SELECT data FROM transactions WHERE timestamp > ? AND timestamp < ? ORDER BY timestamp, block",
+            (start, end),
+        )
+        return [json.loads(data) for data, in rows]
+
+    def get_block_number(self, transac_id):
+        """Get the block number of a transaction.
+
+        :param transac_id: Transaction's hash
+        :type transac_id: str
+        :return: Number of the block containing the transaction, None if it is not in the store
+        :rtype: int
+        """
+        row = (
+            self.__get_db()
+            .execute("SELECT block FROM transactions WHERE hash = ?", (transac_id,))
+            .fetchone()
+        )
+        return row[0] if row is not None else None
+
+    def find_by_hd(self, hd):
+        """Get the tree whose root has a right part. If several transactions anchor it, the first one is kept.
+
+        :param hd: Right part of the root, as hexadecimal
+        :type hd: str
+        :return: Tree anchored, None if no transaction anchors it
+        :rtype: AnchoredTree
+        """
+        row = (
+            self.__get_db()
+            .execute(
+                "SELECT data, cipher, hd, tree_date FROM transactions WHERE hd = ? ORDER BY block, rowid LIMIT 1",
+                (hd,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        data, cipher, hd, tree_date = row
+        return AnchoredTree(json.loads(data), cipher, hd, tree_date)
+
+    def import_json(self, decode_input, path=TRANSACTIONS_FILE):
+        """Import the transactions saved in a file before the TransactionStore, if the database is still empty.
+
+        :param decode_input: Function decoding the input of a transaction, see Eth.decode_input_tx
+        :type decode_input: Callable
+        :param path: File of the transactions, defaults to TRANSACTIONS_FILE
+        :type path: str, optional
+        :return: Number of transactions imported
+        :rtype: int
+        """
+        if self.get_last_block() >= 0 or not os.path.exists(path):
+            return 0
+        with open(path, "r") as openfile:
+            data = json.load(openfile)
+        transactions = data["result"]
+        # the files written before the block cursor existed hold the whole history.
+        last_block = data.get(
+            "last_block",
+            max((int(tx["blockNumber"]) for tx in transactions), default=-1),
+        )
+        nb_added = self.add_transactions(transactions, decode_input, last_block)
+        logger.info(f"{nb_added} transactions imported from {path}.")
+        return nb_added
+
+    def __len__(self):
+        return (
+            self.__get_db().execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        )
+
+
+#: Store used by the api, opened at its first use
+current_store = None
+store_lock = Lock()
+
+
+def get_transaction_store():
+    """Get the store of the transactions used by the api.
+
+    :return: Store of the transactions
+    :rtype: TransactionStore
+    """
+    global current_store
+    with store_lock:
+        if current_store is None:
+            current_store = TransactionStore()
+        return current_store
@@ -0,0 +1,185 @@
+import bisect
+import logging
+import os
+
+import requests
+from eth_abi import encode_abi
+from eth_utils import function_signature_to_4byte_selector
+from retry import retry
+
+from exceptions import EtherscanAPIException, EtherscanRateLimitException
+from settings import (
+    ETHERSCAN_PAGE_SIZE,
+    ETHERSCAN_RETRY_DELAY,
+    ETHERSCAN_RETRY_MAX_DELAY,
+    ETHERSCAN_RETRY_TRIES,
+)
+
+logger = logging.getLogger("smart-contract-logger")
+
+
+class TransactionSync:
+    """Synchronisation of the transactions of the smart contract from the Etherscan API into a TransactionStore.
+
+    Only the blocks after the last block synchronised are requested, by pages of :ref:`ETHERSCAN_PAGE_SIZE <constants>` transactions, so the whole history is never downloaded again and is not limited by the maximum number of results of Etherscan.
+    The requests rate limited or timed out are tried again with an exponential backoff (see :ref:`ETHERSCAN_RETRY_DELAY <constants>`).
+    """
+
+    def __init__(self, client, store, decode_input, page_size=ETHERSCAN_PAGE_SIZE):
+        """
+        :param client: Client of the Etherscan API, with a get_contract_transactions method as Eth. See FakeEtherscan for the tests.
+        :type client: Eth
+        :param store: Store where the transactions are added, with the last block synchronised
+        :type store: TransactionStore
+        :param decode_input: Function decoding the input of a transaction, see Eth.decode_input_tx
+        :type decode_input: Callable
+        :param page_size: Number of transactions per request, defaults to ETHERSCAN_PAGE_SIZE
+        :type page_size: int, optional
+        """
+        self.client = client
+        self.store = store
+        self.decode_input = decode_input
+        self.page_size = page_size
+
+    @retry(
+        (
+            EtherscanRateLimitException,
+            requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+        ),
+        tries=ETHERSCAN_RETRY_TRIES,
+        delay=ETHERSCAN_RETRY_DELAY,
+        max_delay=ETHERSCAN_RETRY_MAX_DELAY,
+        backoff=2,
+        logger=logger,
+    )
+    def __get_page(self, start_block, page):
+        """Request a page of transactions, tried again while rate limited."""
+        return self.client.get_contract_transactions(start_block, page, self.page_size)
+
+    def sync(self):
+        """Request the transactions of the blocks after the last block synchronised and add them to the store.
+
+        A full page may end in the middle of a block, so the next page starts again at its last block and the transactions already known are ignored by the store.
+        Each page is added with the last complete block in a single database transaction, so after a failed request the next synchronisation starts where this one stopped.
+
+        :return: Number of new transactions
+        :rtype: int
+        :raises EtherscanAPIException: if Etherscan gives an error, or is still rate limited after ETHERSCAN_RETRY_TRIES attempts
+        """
+        start_block = self.store.get_last_block() + 1
+        page = 1
+        nb_added = 0
+        while True:
+            txs = self.__get_page(start_block, page)
+            if len(txs) == 0:
+                break
+            last_block = int(txs[-1]["blockNumber"])
+            if len(txs) < self.page_size:
+                nb_added += self.store.add_transactions(
+                    txs, self.decode_input, last_block
+                )
+                break
+            if last_block > start_block:
+                nb_added += self.store.add_transactions(
+                    txs, self.decode_input, last_block - 1
+                )
+                start_block = last_block
+                page = 1
+            else:
+                # the whole page is in a single block
+                nb_added += self.store.add_transactions(
+                    txs, self.decode_input, start_block - 1
+                )
+                page += 1
+        return nb_added
+
+
+class FakeEtherscan:
+    """Stand-in for Eth.get_contract_transactions in the tests and benchmarks, answering like the txlist action of the Etherscan API without any network.
+
+    The transactions call updateTxtid with values formatted as the roots sent by SendTree. As Etherscan, no more than max_results transactions are given for a query and a request can be rate limited.
+    """
+
+    #: Selector of the updateTxtid function of the smart contract
+    UPDATE_TXTID_SELECTOR = function_signature_to_4byte_selector("updateTxtid(string)")
+
+    def __init__(
+        self,
+        nb_transactions=0,
+        transactions_per_block=1,
+        rate_limit_every=0,
+        max_results=10000,
+    ) -> None:
+        """
+        :param nb_transactions: Number of transactions already made to the smart contract
+        :type nb_transactions: int, optional
+        :param transactions_per_block: Number of transactions in each block
+        :type transactions_per_block: int, optional
+        :param rate_limit_every: One request out of rate_limit_every is rate limited, 0 to never rate limit
+        :type rate_limit_every: int, optional
+        :param max_results: Maximum number of transactions given for a query (page * offset)
+        :type max_results: int, optional
+        """
+        self.transactions_per_block = transactions_per_block
+        self.rate_limit_every = rate_limit_every
+        self.max_results = max_results
+        self.transactions = []
+        #: Block of each transaction, to find the first transaction of a block by bisection
+        self.__blocks = []
+        #: Number of requests received
+        self.requests = 0
+        self.add_transactions(nb_transactions)
+
+    @classmethod
+    def encode_input(cls, value):
+        """Encode the input of a call of updateTxtid.
+
+        :param value: Value sent to the smart contract
+        :type value: str
+        :return: Input of the transaction, as hexadecimal
+        :rtype: str
+        """
+        return (
+            "0x" + (cls.UPDATE_TXTID_SELECTOR + encode_abi(["string"], [value])).hex()
+        )
+
+    def add_transactions(self, nb_transactions):
+        """Add transactions to the smart contract, in new blocks.
+
+        :param nb_transactions: Number of transactions to add
+        :type nb_transactions: int
+        """
+        first_block = self.__blocks[-1] + 1 if len(self.__blocks) > 0 else 1000000
+        for j in range(nb_transactions):
+            i = len(self.transactions)
+            block = first_block + j // self.transactions_per_block
+            timestamp = 1700000000 + 12 * (block - 1000000)
+            hd = i.to_bytes(16, "big").hex()
+            value = f"{os.urandom(8).hex()},{hd}, 2023-11-14 22:13:20 (Europe/Zurich : CET+0100)"
+            self.transactions.append(
+                {
+                    "blockNumber": str(block),
+                    "timeStamp": str(timestamp),
+                    "hash": "0x" + i.to_bytes(32, "big").hex(),
+                    "input": self.encode_input(value),
+                    "isError": "0",
+                }
+            )
+            self.__blocks.append(block)
+
+    def get_contract_transactions(self, start_block=0, page=1, offset=10000):
+        """Answer like Eth.get_contract_transactions.
+
+        :return: Transactions of the blocks from start_block, sorted by block
+        :rtype: List[Dict]
+        :raises EtherscanRateLimitException: One request out of rate_limit_every
+        :raises EtherscanAPIException: If page * offset is above max_results
+        """
+        self.requests += 1
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            raise EtherscanRateLimitException("Max rate limit reached")
+        if page * offset > self.max_results:
+            raise EtherscanAPIException("Result window is too large.")
+        first = bisect.bisect_left(self.__blocks, start_block) + (page - 1) * offset
+        return self.transactions[first : first + offset]
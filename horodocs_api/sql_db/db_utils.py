@@ -56,6 +56,40 @@ def get_api_keys_db(db: Session, skip: int = 0, limit: int = 100):
     """
     return db.query(models.APIKeys).offset(skip).limit(limit).all()
 
+def is_express_api_key(db: Session, api_key: str):
+    """Check if an api_key can use the express lane
+
+    :param db: Database
+    :type db: Session
+    :param api_key: Value of the api_key
+    :type api_key: str
+    :return: True if the api_key is allowed to submit express leaves
+    :rtype: bool
+    """
+    return db.query(models.ExpressAPIKeys).filter(models.ExpressAPIKeys.value == api_key).first() is not None
+
+def set_express_api_key(db: Session, api_key: str, is_express: bool):
+    """Allow or forbid the express lane to an api_key
+
+    :param db: Database
+    :type db: Session
+    :param api_key: Value of the api_key
+    :type api_key: str
+    :param is_express: True to allow the express lane, False to forbid it
+    :type is_express: bool
+    :return: the api_key, None if it does not exist
+    :rtype: models.APIKeys
+    """
+    key = get_api_key_db(db, api_key)
+    if(key):
+        express_key = db.query(models.ExpressAPIKeys).filter(models.ExpressAPIKeys.value == api_key).first()
+        if(is_express and express_key is None):
+            db.add(models.ExpressAPIKeys(value=api_key))
+        elif(not is_express and express_key is not None):
+            db.delete(express_key)
+        db.commit()
+    return key
+
 def update_config(db: Session, config_name: str, new_value: int):
     """Update the value of config_name in the database with new_value
 
@@ -73,3 +107,28 @@ def update_config(db: Session, config_name: str, new_value: int):
         conf.value = new_value
         db.commit()
     return conf
+
+def add_archived_quittances(db: Session, quittances, archive: str):
+    """Register the quittances of a tree archive, so their proofs can be found
+
+    :param db: Database
+    :type db: Session
+    :param quittances: Quittances of the files of the archive
+    :type quittances: Set[str]
+    :param archive: Filename of the archive, in ARCHIVE_DIR
+    :type archive: str
+    """
+    db.bulk_save_objects([models.ArchivedQuittance(quittance=quittance, archive=archive) for quittance in quittances])
+    db.commit()
+
+def get_archives_of_quittance(db: Session, quittance: str):
+    """Get the archives holding files with a quittance
+
+    :param db: Database
+    :type db: Session
+    :param quittance: Quittance wanted
+    :type quittance: str
+    :return: Filenames of the archives, in ARCHIVE_DIR
+    :rtype: List[str]
+    """
+    return [archived.archive for archived in db.query(models.ArchivedQuittance).filter(models.ArchivedQuittance.quittance == quittance).all()]
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
 
 from .database import Base
 
@@ -9,8 +9,19 @@ class APIKeys(Base):
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
 
+class ExpressAPIKeys(Base):
+    __tablename__ = "express_api_keys"
+
+    value = Column(String, ForeignKey("api_keys.value"), primary_key=True)
+
 class Config(Base):
     __tablename__ = "config"
     name = Column(String, primary_key=True)
     value = Column(Integer)
 
+
+class ArchivedQuittance(Base):
+    __tablename__ = "archived_quittances"
+    id = Column(Integer, primary_key=True)
+    quittance = Column(String, index=True)
+    archive = Column(String)
@@ -5,6 +5,10 @@ class APIKeysItem(BaseModel):
     is_active: bool
     is_admin: bool
 
+class ExpressAPIKeyItem(BaseModel):
+    value: str
+    is_express: bool
+
 class ConfigItem(BaseModel):
     name: str
     value: int
\ No newline at end of file
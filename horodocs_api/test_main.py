@@ -0,0 +1,92 @@
+import importlib
+import os
+from threading import Thread
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from smart_contract.eth_interface import deactivate_horodating
+from sql_db import database, db_utils, models
+from sql_db.database import get_db
+from tree_logic import tree
+from tree_logic.singleton import Singleton
+from tree_logic.test_tree import make_leaf, make_subtree
+from tree_logic.tree import TreeBuilder, TreeManager
+from tree_logic.tree_archive import TreeArchive
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Client of the api on a database of the test, the daemons of the api not being started."""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'config.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setenv(
+        "CONTRACT_PATH",
+        os.path.join(
+            os.path.dirname(__file__),
+            "smart_contract/artifacts/contracts/horodatage.sol/Horodatage.json",
+        ),
+    )
+    monkeypatch.setattr(tree, "TREE_LOG_DIR", str(tmp_path / "tree_log"))
+    monkeypatch.setattr(tree, "ARCHIVE_DIR", str(tmp_path / "archives"))
+    monkeypatch.setattr(Thread, "start", lambda thread: None)
+    Singleton._instances.pop(TreeManager, None)
+    main = importlib.import_module("main")
+    monkeypatch.undo()
+    monkeypatch.setattr(main, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "archives", {})
+
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.APIKeys(value="key", is_active=True))
+    session.commit()
+    main.app.dependency_overrides[get_db] = lambda: session
+    yield TestClient(main.app), session, tmp_path
+    main.app.dependency_overrides.clear()
+    session.close()
+    Singleton._instances.pop(TreeManager, None)
+
+
+def test_proof_of_an_archived_quittance(client):
+    client, db, archive_dir = client
+    built_tree = TreeBuilder()
+    built_tree.add_leaves([make_leaf(0), make_subtree(10, 3), make_leaf(1)])
+    built_tree.finalize_tree()
+    infos = {"closing_time": "date", "lid": "lid", "version": 3, "root": "root"}
+    quittances = TreeArchive.write(str(archive_dir / "tree.archive"), built_tree, infos)
+    db_utils.add_archived_quittances(db, quittances, "tree.archive")
+
+    response = client.get("/proof/Q11", headers={"x-api-key": "key"})
+    assert response.status_code == 200
+    (proof,) = response.json()
+    receipts = {
+        record.quittance: receipt for record, *receipt in built_tree.get_receipts()
+    }
+    assert [proof["anterior_branches"], proof["posterior_branches"]] == [
+        [list(branch) for branch in branches] for branches in receipts["Q11"]
+    ]
+
+    response = client.get("/proof/Q99", headers={"x-api-key": "key"})
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Quittance not found."}
+
+
+def test_express_leaf_while_horodating_is_deactivated(client):
+    client, _, _ = client
+    leaf_infos = make_leaf(0, express=True)[1].dict()
+    deactivate_horodating.set()
+    try:
+        response = client.post(
+            "/add_leaf_tree/", json=leaf_infos, headers={"x-api-key": "key"}
+        )
+    finally:
+        deactivate_horodating.clear()
+    # the api key can't use the express lane, but the horodating is checked first
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Horodating not available for the moment."}
@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from ndjson_stream import NDJSONStreamingResponse
+from settings import MAX_NDJSON_LINE_SIZE
+
+
+async def submit_lines(lines, line_number):
+    """Acknowledge each non-empty line with its value, as submit_ndjson_lines with its quittance."""
+    acks = []
+    for i, line in enumerate(lines, start=line_number + 1):
+        if not line.strip():
+            continue
+        try:
+            acks.append({"line": i, "value": json.loads(line)["value"]})
+        except ValueError:
+            acks.append({"line": i, "error": "Invalid LeafInfos."})
+    return acks
+
+
+app = FastAPI()
+
+
+@app.post("/stream/")
+async def stream(request: Request):
+    return NDJSONStreamingResponse(request, submit_lines)
+
+
+def post_chunks(chunks):
+    """Post a body chunk by chunk as a server does : receive gives the next chunk, then waits for the end of the response to give the disconnection."""
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks
+    ]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+    response = {"body": b""}
+
+    async def receive():
+        if len(messages) > 0:
+            # let the response be sent meanwhile
+            await asyncio.sleep(0)
+            return messages.pop(0)
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        else:
+            response["body"] += message["body"]
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    async def post():
+        global response_complete
+        response_complete = asyncio.Event()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/stream/",
+            "raw_path": b"/stream/",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"content-type", b"application/x-ndjson")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), 10)
+
+    asyncio.run(post())
+    assert response["status"] == 200
+    assert response["headers"][b"content-type"] == b"application/x-ndjson"
+    return [json.loads(line) for line in response["body"].decode().splitlines()]
+
+
+def test_test_client():
+    body = "".join(json.dumps({"value": i}) + "\n" for i in range(10))
+    with TestClient(app) as client:
+        response = client.post("/stream/", content=body)
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"line": i + 1, "value": i} for i in range(10)
+    ]
+
+
+def test_each_line_is_acknowledged():
+    body = "".join(json.dumps({"value": i}) + "\n" for i in range(100)).encode()
+    # lines cut across chunks
+    chunks = [body[i : i + 7] for i in range(0, len(body), 7)]
+    assert post_chunks(chunks) == [{"line": i + 1, "value": i} for i in range(100)]
+
+
+def test_errors_are_acknowledged_per_line():
+    long_line = b'{"value": "' + b"a" * MAX_NDJSON_LINE_SIZE + b'"}'
+    chunks = [
+        b'{"value": 1}\n\nnot json\n',
+        long_line[: MAX_NDJSON_LINE_SIZE // 2],
+        long_line[MAX_NDJSON_LINE_SIZE // 2 :] + b"\n",
+        b'{"value": 2}\n{"value": 3}',
+    ]
+    assert post_chunks(chunks) == [
+        {"line": 1, "value": 1},
+        {"line": 3, "error": "Invalid LeafInfos."},
+        {"line": 4, "error": "Line too long."},
+        {"line": 5, "value": 2},
+        {"line": 6, "value": 3},
+    ]
+
+
+def test_long_line_in_a_single_chunk():
+    long_line = b'{"value": "' + b"a" * MAX_NDJSON_LINE_SIZE + b'"}'
+    chunks = [b'{"value": 1}\n' + long_line + b'\n{"value": 2}\n']
+    assert post_chunks(chunks) == [
+        {"line": 1, "value": 1},
+        {"line": 2, "error": "Line too long."},
+        {"line": 3, "value": 2},
+    ]
+
+
+def test_empty_body():
+    assert post_chunks([]) == []
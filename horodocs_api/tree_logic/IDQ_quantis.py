@@ -2,6 +2,11 @@ import requests
 from dotenv import load_dotenv
 import os
 
+dotenv_path = ".env"
+load_dotenv(dotenv_path)
+#: URL of the true random generator, read once
+server_url = os.environ.get("QUANTUM_GEN_URL")
+
 
 def get_true_random(nb_bytes, mode="b", timeout=1):
     """
@@ -18,10 +23,6 @@ def get_true_random(nb_bytes, mode="b", timeout=1):
     :raises ValueError: if the number of bytes is invalid or if the mode is not x or b
     :raises requests.ConnectionError: if the connection has an issue
     """
-    dotenv_path = ".env" 
-    load_dotenv(dotenv_path)
-    server_url = os.environ.get("QUANTUM_GEN_URL")
-
     if type(nb_bytes) != int or nb_bytes < 1 or nb_bytes > 128:
         raise ValueError("le nombre de byte doit être un entier entre 1 et 128")
 
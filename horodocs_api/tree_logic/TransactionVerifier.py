@@ -1,6 +1,6 @@
 from threading import Lock, Thread
 from time import sleep
-from smart_contract.eth_interface import Eth
+from smart_contract.finality_tracker import FinalityTracker
 from settings import TRANSACTION_VERIFIER_TIMING, EMAIL_ADMIN
 from .mail_sender import EmailMessage
 from gettext import gettext as _
@@ -45,10 +45,10 @@ class TransactionVerifier(Thread):
         self.__transactions_mail_link[transaction_id] = list(set(mails))
 
     def verify_transactions(self):
-        """Verify transactions on the blockchain ethereum. If transaction is valid, send an email to users and remove the transaction from memory."""
-        eth = Eth()
+        """Verify transactions on the blockchain ethereum. If transaction is valid, send an email to users and remove the transaction from memory. The finality is answered from memory by the FinalityTracker."""
+        finality_tracker = FinalityTracker()
         for t in self.__transactions_to_verify:
-            valid = eth.check_transaction_validation(t)
+            valid = finality_tracker.check_transaction_validation(t)
             if valid == 1 or valid == 0:
                 # print(f'Transaction validated, sending mails to {self.__transactions_mail_link}')
                 self.__send_mail(
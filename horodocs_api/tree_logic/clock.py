@@ -0,0 +1,195 @@
+import logging
+import statistics
+from datetime import datetime
+from threading import Thread
+from time import monotonic, sleep, time
+
+import ntplib
+
+from settings import (
+    CLOCK_MAX_SLEW,
+    CLOCK_STEP_THRESHOLD,
+    NTP_SERVERS,
+    NTP_SYNC_INTERVAL,
+    NTP_TIMEOUT,
+)
+
+from .metrics import Metrics
+from .singleton import Singleton
+
+logger = logging.getLogger("horodocs-api-logger")
+
+
+class ClockService(metaclass=Singleton):
+    """Clock of the api, synchronised with several NTP servers by a background thread. This class must be a Singleton to work correctly.
+
+    The time is the monotonic clock plus an offset, so reading it never waits for a server and never depends on the changes of the system clock.
+    At each synchronisation, the offset is the median of the offsets given by the servers and its uncertainty is the largest distance between the median and the interval of a server (its offset +- half its round trip).
+    A small correction is slewed at :ref:`CLOCK_MAX_SLEW <constants>` seconds per second so the time never goes back, a correction larger than :ref:`CLOCK_STEP_THRESHOLD <constants>` seconds is applied at once.
+    Until the first synchronisation, the offset is the one of the system clock.
+    """
+
+    def __init__(self, servers=NTP_SERVERS, client=None) -> None:
+        """
+        Class initialisation. Will start the thread synchronising the clock.
+
+        :param servers: NTP servers to query, defaults to NTP_SERVERS
+        :type servers: List[str], optional
+        :param client: Client querying the servers, defaults to an ntplib.NTPClient. See FakeNTPClient for the tests.
+        :type client: ntplib.NTPClient, optional
+        """
+        self.servers = servers
+        self.__client = client if client is not None else ntplib.NTPClient()
+        offset = time() - monotonic()
+        #: Correction being applied : (offset at the start, offset targeted, monotonic time of the start). Replaced at once so it is always read consistently.
+        self.__correction = (offset, offset, monotonic())
+        #: Uncertainty in seconds of the last synchronisation, None before the first one
+        self.uncertainty = None
+        #: Drift of the monotonic clock measured between the last two synchronisations, in parts per million
+        self.drift_ppm = None
+        #: Monotonic time of the last synchronisation, None before the first one
+        self.__last_sync = None
+        #: Offset measured by the last synchronisation
+        self.__last_offset = None
+
+        self.__syncer = Thread(target=self.__run, daemon=True)
+        self.__syncer.start()
+
+    def get_offset(self):
+        """Get the offset currently applied to the monotonic clock.
+
+        :return: Offset in seconds
+        :rtype: float
+        """
+        start_offset, target_offset, start = self.__correction
+        max_correction = CLOCK_MAX_SLEW * (monotonic() - start)
+        correction = target_offset - start_offset
+        return start_offset + max(-max_correction, min(max_correction, correction))
+
+    def timestamp(self):
+        """Get the current time.
+
+        :return: Timestamp, in seconds since the epoch
+        :rtype: float
+        """
+        return monotonic() + self.get_offset()
+
+    def now(self):
+        """Get the current time to the microsecond.
+
+        :return: Current local time
+        :rtype: datetime
+        """
+        return datetime.fromtimestamp(round(self.timestamp(), 6))
+
+    def sync(self):
+        """Query the NTP servers and correct the offset.
+
+        :return: True if at least one server responded
+        :rtype: bool
+        """
+        samples = []
+        for server in self.servers:
+            try:
+                response = self.__client.request(server, version=3, timeout=NTP_TIMEOUT)
+            except (ntplib.NTPException, OSError) as e:
+                logger.warning(f"The NTP server {server} did not respond : {e}")
+                continue
+            # the offset of ntplib is relative to the system clock, read right after the response.
+            samples.append((time() + response.offset - monotonic(), response.delay / 2))
+        if len(samples) == 0:
+            Metrics().increment("clock_sync_failures")
+            return False
+        offset = statistics.median(sample_offset for sample_offset, _ in samples)
+        uncertainty = max(
+            abs(sample_offset - offset) + half_delay
+            for sample_offset, half_delay in samples
+        )
+        now = monotonic()
+        if self.__last_sync is not None and now > self.__last_sync:
+            self.drift_ppm = (
+                (offset - self.__last_offset) / (now - self.__last_sync) * 1e6
+            )
+            Metrics().observe("clock_drift_ppm", self.drift_ppm)
+        current_offset = self.get_offset()
+        if (
+            self.__last_sync is None
+            or abs(offset - current_offset) > CLOCK_STEP_THRESHOLD
+        ):
+            self.__correction = (offset, offset, now)
+            Metrics().increment("clock_steps")
+        else:
+            self.__correction = (current_offset, offset, now)
+        Metrics().observe("clock_correction", offset - current_offset)
+        Metrics().observe("clock_uncertainty", uncertainty)
+        Metrics().observe("clock_servers", len(samples))
+        self.uncertainty = uncertainty
+        self.__last_sync = now
+        self.__last_offset = offset
+        return True
+
+    def get_status(self):
+        """Get the state of the synchronisation.
+
+        :return: synced, seconds since the last synchronisation, uncertainty and drift in parts per million (None before the first synchronisation)
+        :rtype: Dict
+        """
+        last_sync = self.__last_sync
+        return {
+            "synced": last_sync is not None,
+            "last_sync_age": monotonic() - last_sync if last_sync is not None else None,
+            "uncertainty": self.uncertainty,
+            "drift_ppm": self.drift_ppm,
+        }
+
+    def __run(self):
+        """Synchronise the clock every :ref:`NTP_SYNC_INTERVAL <constants>` seconds."""
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"The clock could not be synchronised : {e}")
+            sleep(NTP_SYNC_INTERVAL)
+
+
+class FakeNTPClient:
+    """Stand-in for ntplib.NTPClient in the tests, answering from the local clock without any network.
+
+    Each server answers with its own offset and round trip, or raises ntplib.NTPException if it is down.
+    """
+
+    def __init__(self, offsets=None, delays=None, down=()) -> None:
+        """
+        :param offsets: Offset in seconds of the time given by each server, 0 for the servers not given
+        :type offsets: Dict[str, float], optional
+        :param delays: Round trip in seconds of each server, 0 for the servers not given
+        :type delays: Dict[str, float], optional
+        :param down: Servers not responding
+        :type down: Iterable[str], optional
+        """
+        self.offsets = dict(offsets or {})
+        self.delays = dict(delays or {})
+        self.down = set(down)
+        #: Number of requests received by server
+        self.requests = {}
+
+    def request(self, host, version=2, port="ntp", timeout=5):
+        """Answer like ntplib.NTPClient.request.
+
+        :return: Response with the offset, delay and tx_time of the server
+        :rtype: ntplib.NTPStats
+        :raises ntplib.NTPException: If the server is down
+        """
+        self.requests[host] = self.requests.get(host, 0) + 1
+        if host in self.down:
+            raise ntplib.NTPException(f"No response received from {host}.")
+        offset = self.offsets.get(host, 0.0)
+        delay = self.delays.get(host, 0.0)
+        stats = ntplib.NTPStats()
+        now = time()
+        # timestamps of the exchange : origin, receive, transmit and destination.
+        stats.orig_timestamp = ntplib.system_to_ntp_time(now - delay)
+        stats.recv_timestamp = ntplib.system_to_ntp_time(now - delay / 2 + offset)
+        stats.tx_timestamp = ntplib.system_to_ntp_time(now - delay / 2 + offset)
+        stats.dest_timestamp = ntplib.system_to_ntp_time(now)
+        return stats
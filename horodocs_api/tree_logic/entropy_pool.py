@@ -0,0 +1,121 @@
+import binascii
+import logging
+import os
+from threading import Condition, Thread
+from time import sleep
+
+from exceptions import warn_admin
+from settings import ENTROPY_POOL_SIZE, ENTROPY_QRNG_RETRY_DELAY, WARN_ADMIN
+
+from .IDQ_quantis import get_true_random
+from .metrics import Metrics
+from .singleton import Singleton
+
+#: Maximum number of bytes given by the true random generator per request.
+QRNG_MAX_BYTES = 128
+
+logger = logging.getLogger("horodocs-api-logger")
+
+
+class EntropyPool(metaclass=Singleton):
+    """Random bytes for the salts and the LIDs, prefetched from the true random generator by a background thread. This class must be a Singleton to work correctly.
+
+    The bytes are always taken from the memory : the requests never wait for the generator. When the pool is below half of :ref:`ENTROPY_POOL_SIZE <constants>` bytes, the thread fills it again.
+    If the pool is empty, because the generator does not respond or can't keep up, the bytes are generated with os.urandom. The bytes given from the pool and from os.urandom are counted in the Metrics (entropy_qrng_bytes and entropy_fallback_bytes), see get_qrng_ratio.
+    """
+
+    def __init__(self, size=ENTROPY_POOL_SIZE) -> None:
+        """
+        Class initialisation. Will start the thread filling the pool.
+
+        :param size: Number of bytes kept in the pool, defaults to ENTROPY_POOL_SIZE
+        :type size: int, optional
+        """
+        self.size = size
+        self.__pool = bytearray()
+        #: Protects the pool, notified when the pool has to be filled
+        self.__refill_needed = Condition()
+
+        self.__refiller = Thread(target=self.__refill, daemon=True)
+        self.__refiller.start()
+
+    def get_bytes(self, nb_bytes):
+        """Take random bytes from the pool, or from os.urandom if the pool does not have enough. Never waits for the true random generator.
+
+        :param nb_bytes: Number of bytes wanted
+        :type nb_bytes: int
+        :return: Random bytes
+        :rtype: bytes
+        """
+        data = None
+        with self.__refill_needed:
+            if len(self.__pool) >= nb_bytes:
+                data = bytes(self.__pool[-nb_bytes:])
+                del self.__pool[-nb_bytes:]
+            if len(self.__pool) < self.size // 2:
+                self.__refill_needed.notify()
+        if data is None:
+            Metrics().increment("entropy_fallback_bytes", nb_bytes)
+            return os.urandom(nb_bytes)
+        Metrics().increment("entropy_qrng_bytes", nb_bytes)
+        return data
+
+    def get_hex(self, nb_bytes):
+        """Take random bytes, see get_bytes.
+
+        :param nb_bytes: Number of bytes wanted
+        :type nb_bytes: int
+        :return: Random bytes as hexadecimal
+        :rtype: str
+        """
+        return self.get_bytes(nb_bytes).hex()
+
+    def get_qrng_ratio(self):
+        """Get the part of the bytes given that came from the true random generator.
+
+        :return: Ratio between 0 and 1, None if no byte was given yet
+        :rtype: float
+        """
+        counters = Metrics().get_all()["counters"]
+        qrng_bytes = counters.get("entropy_qrng_bytes", 0)
+        total = qrng_bytes + counters.get("entropy_fallback_bytes", 0)
+        return qrng_bytes / total if total > 0 else None
+
+    def __refill(self):
+        """Fill the pool from the true random generator each time it is below half full.
+
+        While the generator does not respond or gives invalid bytes, it is requested again every :ref:`ENTROPY_QRNG_RETRY_DELAY <constants>` seconds and the admin is warned once.
+        """
+        failing = False
+        while True:
+            with self.__refill_needed:
+                while len(self.__pool) >= self.size // 2:
+                    self.__refill_needed.wait()
+            try:
+                while len(self.__pool) < self.size:
+                    block = binascii.a2b_hex(
+                        get_true_random(QRNG_MAX_BYTES, "x", 3).strip()
+                    )
+                    if len(block) != QRNG_MAX_BYTES:
+                        raise ValueError(
+                            f"{len(block)} bytes received instead of {QRNG_MAX_BYTES}."
+                        )
+                    with self.__refill_needed:
+                        self.__pool += block
+            except Exception as e:
+                # any error stops the thread otherwise, and the pool is never filled again
+                if not failing:
+                    failing = True
+                    logger.error(f"The true random generator does not respond : {e}")
+                    if WARN_ADMIN:
+                        try:
+                            warn_admin(e)
+                        except Exception as mail_error:
+                            logger.error(
+                                f"The admin could not be warned : {mail_error}"
+                            )
+                sleep(ENTROPY_QRNG_RETRY_DELAY)
+                continue
+            if failing:
+                failing = False
+                logger.warning("The true random generator responds again.")
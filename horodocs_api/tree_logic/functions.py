@@ -1,17 +1,15 @@
 import binascii
 import glob
 import hashlib
+import itertools
 import os
 import uuid
 import urllib
 import pyqrcode
-import ntplib
 import pytz
-from requests.exceptions import ConnectTimeout, ConnectionError, ReadTimeout
-from retry import retry
 from datetime import datetime
-from .IDQ_quantis import get_true_random
-from exceptions import warn_admin
+from .clock import ClockService
+from .entropy_pool import EntropyPool
 from gettext import gettext as _
 import gettext
 import re
@@ -22,7 +20,6 @@ from settings import (
     BUF_SIZE,
     TMP_URL_QRCODE,
     ACTUAL_VERSION,
-    WARN_ADMIN,
 )
 
 
@@ -38,11 +35,21 @@ def is_valid_sha256(s):
     return False
 
 
+#: Timezone of the dates of the receipts
+ZURICH_TIMEZONE = pytz.timezone("Europe/Zurich")
+
+#: Identifier of the process in the quittances, random so that several workers or a restart of the api never share their counters.
+QUITTANCE_NODE_ID = os.urandom(8)
+
+#: Counter of the quittances created by the process. next() on a count is atomic, no lock is needed.
+quittance_counter = itertools.count()
+
+
 def create_salt_and_quittance(time):
     """
     Return a random generated salt and a quittance depending on time.
 
-    The quittance is calculated from the sha 256 of the date in parameter. Then we take only the first 128 bits
+    The quittance is calculated from the sha 256 of the date in parameter, the identifier of the process and a counter, so each call returns a different quittance. Then we take only the first 128 bits
     Quittance example : 71-7AAA3-2296E5-ECD5E8-D7905D-E7
 
     Salt example : cf82e2987e6a1eea
@@ -52,27 +59,102 @@ def create_salt_and_quittance(time):
     :return: salt, quittance
     :rtype: str, str
 
+    """
+    return create_salts(1)[0], create_quittance(time)
+
+
+def create_quittance(time):
+    """
+    Return a unique quittance depending on time, see create_salt_and_quittance.
+
+    :param: time: Actual date
+    :type time: str
+    :return: quittance
+    :rtype: str
+
+    """
+    hashed_quitt_id = hash_sha256(
+        [
+            struct.pack(">d", time),
+            QUITTANCE_NODE_ID,
+            struct.pack(">Q", next(quittance_counter)),
+        ]
+    ).upper()
+    return "-".join(
+        (
+            hashed_quitt_id[:2],
+            hashed_quitt_id[3:8],
+            hashed_quitt_id[9:15],
+            hashed_quitt_id[16:22],
+            hashed_quitt_id[23:29],
+            hashed_quitt_id[30:32],
+        )
+    )
+
+
+def create_quittances(time, nb_quittances):
+    """
+    Return nb_quittances unique quittances depending on time, one per file of a batch. See create_quittance.
+
+    :param: time: Actual date
+    :type time: str
+    :param: nb_quittances: Number of quittances wanted
+    :type nb_quittances: int
+    :return: quittances
+    :rtype: List[str]
+
+    """
+    return [create_quittance(time) for _ in range(nb_quittances)]
+
+
+def create_salts(nb_salts):
+    """
+    Return nb_salts random generated salts, see create_salt_and_quittance.
+
+    The salts are taken from the EntropyPool, filled by blocks from the true random generator.
+
+    :param: nb_salts: Number of salts wanted
+    :type nb_salts: int
+    :return: salts
+    :rtype: List[str]
+
     """
     size = 16
-    hashed_quitt_id = hash_sha256([struct.pack(">d", time)])
-    try:
-        sel = get_true_random(size, "x", 3)
-    except (ConnectTimeout, ConnectionError, ReadTimeout) as e:  # backup
-        if WARN_ADMIN:
-            warn_admin(e)
-        sel = binascii.b2a_hex(os.urandom(size)).decode("utf-8")
-    hashed_quitt_id = list(hashed_quitt_id)
-    (
-        hashed_quitt_id[2],
-        hashed_quitt_id[8],
-        hashed_quitt_id[15],
-        hashed_quitt_id[22],
-        hashed_quitt_id[29],
-    ) = ("-", "-", "-", "-", "-")
-    hashed_quitt_id = hashed_quitt_id[:32]
-    hashed_quitt_id = "".join(hashed_quitt_id).upper()
-    quittance = hashed_quitt_id
-    return sel, quittance
+    random_hex = EntropyPool().get_hex(size * nb_salts)
+    return [random_hex[i * 2 * size : (i + 1) * 2 * size] for i in range(nb_salts)]
+
+
+def create_leaf(md5, sha256, date, timezone, salt):
+    """
+    Calculate the value of a new leaf of the tree and the file informations printed on its receipt.
+
+    The leaf is the SHA256 of the salt, the timestamp of the date, the MD5 and the SHA256 of the file.
+
+    :param md5: MD5 value of the submitted file.
+    :type md5: str
+    :param sha256: SHA256 value of the submitted file.
+    :type sha256: str
+    :param date: Date of the submission
+    :type date: datetime
+    :param timezone: Timezone of the date, as returned by get_now_time
+    :type timezone: str
+    :param salt: Salt of the leaf
+    :type salt: str
+    :return: leaf digest, file informations (salt, date for the filename, md5, sha256, readable date)
+    :rtype: bytes, tuple(str,str,str,str,str)
+
+    """
+    date_readable = f'{date.strftime("%Y-%m-%d %H:%M:%S")} ({timezone})'
+    date_filename = date_readable.replace(" ", "").replace(":", "")
+    leaf = hash_sha256_digest(
+        [
+            convert_hexstring_to_binary(salt),
+            struct.pack(">d", int(date.timestamp())),
+            convert_hexstring_to_binary(md5),
+            convert_hexstring_to_binary(sha256),
+        ]
+    )
+    return leaf, (salt, date_filename, md5, sha256, date_readable)
 
 
 def xor_string(s1, s2):
@@ -93,7 +175,19 @@ def xor_string(s1, s2):
 
 
 def bytes_xor(a, b):
-    return bytes(x ^ y for x, y in zip(a, b))
+    """Operate a xor between two binary values. The result is as long as the shortest value.
+
+    :param a: First value
+    :type a: bytes
+    :param b: Second value
+    :type b: bytes
+    :return: XOR generated
+    :rtype: bytes
+    """
+    size = min(len(a), len(b))
+    return (int.from_bytes(a[:size], "big") ^ int.from_bytes(b[:size], "big")).to_bytes(
+        size, "big"
+    )
 
 
 def convert_hexstring_to_binary(hexstring):
@@ -107,6 +201,22 @@ def convert_hexstring_to_binary(hexstring):
     return binascii.unhexlify(hexstring)
 
 
+def hash_sha256_digest(values):
+    """
+    Return the raw SHA256 digest of the binary values in parameters. This is the function used to hash the nodes of the tree, the hexadecimal form is only needed to display or send the values.
+
+    :param values: Binary values to hash.
+    :type values: List
+    :return: The SHA256 digest of val.
+    :rtype: bytes
+
+    """
+    sha256_hash = hashlib.sha256()
+    for binary_data in values:
+        sha256_hash.update(binary_data)
+    return sha256_hash.digest()
+
+
 def hash_sha256(values):
     """
     Return the SHA256 value of the binary values in parameters
@@ -117,10 +227,7 @@ def hash_sha256(values):
     :rtype: str
 
     """
-    sha256_hash = hashlib.sha256()
-    for binary_data in values:
-        sha256_hash.update(binary_data)
-    return sha256_hash.hexdigest()
+    return hash_sha256_digest(values).hex()
 
 
 def hash_file(file):
@@ -154,7 +261,15 @@ def get_hg_hd(data):
     return data[: len(data) // 2], data[len(data) // 2 :]
 
 
-def create_qr(md5, sha256, salt, timing, anterior_branches, posterior_branches):
+def create_qr(
+    md5,
+    sha256,
+    salt,
+    timing,
+    anterior_branches,
+    posterior_branches,
+    version=ACTUAL_VERSION,
+):
     """
     Create a qr code based on the parameters.
 
@@ -174,6 +289,8 @@ def create_qr(md5, sha256, salt, timing, anterior_branches, posterior_branches):
     :type anterior_branches: List[str]
     :param posterior_branches: List of the orange leaves in the Merkle Based Tree.
     :type posterior_branches: List[str]
+    :param version: Version of the layout of the tree, defaults to ACTUAL_VERSION
+    :type version: int, optional
     :return: (the qrcode, the qrcode filepath).
     :rtype: (QRCode, str)
 
@@ -187,7 +304,7 @@ def create_qr(md5, sha256, salt, timing, anterior_branches, posterior_branches):
         "date": timing,
         "anterior_branches": anterior_branches,
         "posterior_branches": posterior_branches,
-        "version": ACTUAL_VERSION,
+        "version": version,
     }
     qrcode_url_redirect = f"{WEB_URL}verification?{str(urllib.parse.urlencode(args))}"
 
@@ -251,19 +368,23 @@ def delete_tmp_files():
         os.remove(f)
 
 
-def calc_tree_root(leaves, file_value, tree_position, language):
+def calc_tree_root(leaves, file_value, tree_position, language, version=2):
     """
     Calculate the root of the merkle based tree from the file and leaves and make a small explanation of how it's done
 
     :param leaves: All leaves related to the file (orange and green). Needs to be sorted before this function.
     :type leaves: List[str]
-    :param file_value: A SHA256 hash of all file values
-    :type file_value: str
+    :param file_value: The SHA256 digest of all file values
+    :type file_value: bytes
     :param tree_position: Position of the file in the merkle based tree.
     :type tree_position: int
-    :return: root of the merkle based tree, text describing the process
-    :rtype: str, str
+    :param version: Version of the receipt, defaults to 2. Since version 3 the tree can have promoted nodes, see calc_promoted_tree_root.
+    :type version: int, optional
+    :return: root digest of the merkle based tree, text describing the process
+    :rtype: bytes, str
     """
+    if version >= 3:
+        return calc_promoted_tree_root(leaves, file_value, language)
     lang = gettext.translation("tree", localedir="locales", languages=[language])
     lang.install()
     _ = lang.gettext
@@ -271,60 +392,90 @@ def calc_tree_root(leaves, file_value, tree_position, language):
     if len(leaves) > 0:
         first_leaf = leaves[0]
         if first_leaf[1] < tree_position:
-            tree_root = hash_sha256(
-                [
-                    convert_hexstring_to_binary(first_leaf[2]),
-                    convert_hexstring_to_binary(file_value),
-                ]
+            tree_root = hash_sha256_digest(
+                [convert_hexstring_to_binary(first_leaf[2]), file_value]
             )
             text_recap_calc_root += _("Racine de l'arbre = SHA256({} + {})").format(
-                first_leaf[2], str(file_value)
+                first_leaf[2], file_value.hex()
             )
-            text_recap_calc_root += _("Résultat : {}\n").format(tree_root)
+            text_recap_calc_root += _("Résultat : {}\n").format(tree_root.hex())
         elif first_leaf[1] > tree_position:
-            tree_root = hash_sha256(
-                [
-                    convert_hexstring_to_binary(file_value),
-                    convert_hexstring_to_binary(first_leaf[2]),
-                ]
+            tree_root = hash_sha256_digest(
+                [file_value, convert_hexstring_to_binary(first_leaf[2])]
             )
             text_recap_calc_root += _("Racine de l'arbre = SHA256({} + {})\n").format(
-                str(file_value), first_leaf[2]
+                file_value.hex(), first_leaf[2]
             )
-            text_recap_calc_root += _("Résultat : {}\n").format(tree_root)
+            text_recap_calc_root += _("Résultat : {}\n").format(tree_root.hex())
         tree_position = tree_position // 2
         for leaf in leaves:
             if leaf[0] == 0:
                 continue
             if leaf[1] < tree_position:
                 old_tree_root = tree_root
-                tree_root = hash_sha256(
-                    [
-                        convert_hexstring_to_binary(leaf[2]),
-                        convert_hexstring_to_binary(tree_root),
-                    ]
+                tree_root = hash_sha256_digest(
+                    [convert_hexstring_to_binary(leaf[2]), tree_root]
                 )
                 text_recap_calc_root += _(
                     "Racine de l'arbre = SHA256({} + {})\n"
-                ).format(leaf[2], str(old_tree_root))
-                text_recap_calc_root += _("Résultat : {}\n").format(tree_root)
+                ).format(leaf[2], old_tree_root.hex())
+                text_recap_calc_root += _("Résultat : {}\n").format(tree_root.hex())
             elif leaf[1] > tree_position:
                 old_tree_root = tree_root
-                tree_root = hash_sha256(
-                    [
-                        convert_hexstring_to_binary(tree_root),
-                        convert_hexstring_to_binary(leaf[2]),
-                    ]
+                tree_root = hash_sha256_digest(
+                    [tree_root, convert_hexstring_to_binary(leaf[2])]
                 )
                 text_recap_calc_root += _(
                     "Racine de l'arbre = SHA256({} + {})\n"
-                ).format(str(old_tree_root), leaf[2])
-                text_recap_calc_root += _("Résultat : {}\n").format(tree_root)
+                ).format(old_tree_root.hex(), leaf[2])
+                text_recap_calc_root += _("Résultat : {}\n").format(tree_root.hex())
             tree_position = tree_position // 2
     else:
-        tree_root = str(file_value)
+        tree_root = file_value
         text_recap_calc_root += _("Une seule valeur dans l'arbre.\n")
-        text_recap_calc_root += _("Racine de l'arbre = {}\n").format(tree_root)
+        text_recap_calc_root += _("Racine de l'arbre = {}\n").format(tree_root.hex())
+    return tree_root, text_recap_calc_root
+
+
+def calc_promoted_tree_root(leaves, file_value, language):
+    """
+    Calculate the root of a merkle based tree of version 3 from the file and leaves and make a small explanation of how it's done.
+
+    The last node of an odd level is promoted to the next level, so a file can have no leaf at some levels and its position can't be deduced from its first leaf.
+    The side of each leaf is given by its index instead : an even index is on the left of the calculated node, an odd one on its right.
+
+    :param leaves: All leaves related to the file (orange and green). Needs to be sorted before this function.
+    :type leaves: List[str]
+    :param file_value: The SHA256 digest of all file values
+    :type file_value: bytes
+    :return: root digest of the merkle based tree, text describing the process
+    :rtype: bytes, str
+    """
+    lang = gettext.translation("tree", localedir="locales", languages=[language])
+    lang.install()
+    _ = lang.gettext
+    text_recap_calc_root = ""
+    tree_root = file_value
+    if len(leaves) == 0:
+        text_recap_calc_root += _("Une seule valeur dans l'arbre.\n")
+        text_recap_calc_root += _("Racine de l'arbre = {}\n").format(tree_root.hex())
+    for leaf in leaves:
+        old_tree_root = tree_root
+        if leaf[1] % 2 == 0:
+            tree_root = hash_sha256_digest(
+                [convert_hexstring_to_binary(leaf[2]), tree_root]
+            )
+            text_recap_calc_root += _("Racine de l'arbre = SHA256({} + {})\n").format(
+                leaf[2], old_tree_root.hex()
+            )
+        else:
+            tree_root = hash_sha256_digest(
+                [tree_root, convert_hexstring_to_binary(leaf[2])]
+            )
+            text_recap_calc_root += _("Racine de l'arbre = SHA256({} + {})\n").format(
+                old_tree_root.hex(), leaf[2]
+            )
+        text_recap_calc_root += _("Résultat : {}\n").format(tree_root.hex())
     return tree_root, text_recap_calc_root
 
 
@@ -349,20 +500,15 @@ def reformate_date(date):
     return f'{tmp_date[0]}-{tmp_date[1]}-{tmp_date2[0]} {tmp_date2[1]}:{tmp_date2[2]}:{tmp_date2[3]} ({tmp[1].replace("U", " : U")}'
 
 
-@retry()
 def get_now_time():
-    """Get actual time from ntp server.
-
-    Use a retry wrapper to make sure that the ntp server responds to us. It can very rarely not.
+    """Get actual time from the ClockService, synchronised with the ntp servers in the background.
 
     :return: Actual time
     :rtype: datetime
     :return: timezone of the time
     :rtype: str
     """
-    ntp_client = ntplib.NTPClient()
-    response = ntp_client.request("pool.ntp.org")
-    ts = datetime.fromtimestamp(response.tx_time)
-    tz = pytz.timezone("Europe/Zurich").localize(datetime.now()).strftime("%z")
+    ts = ClockService().now()
+    tz = ZURICH_TIMEZONE.localize(ts).strftime("%z")
     formatted_tz = f"Europe/Zurich : UTC{tz}"
     return ts, formatted_tz
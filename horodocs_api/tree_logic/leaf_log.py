@@ -0,0 +1,185 @@
+import os
+import struct
+import zlib
+
+#: Header of a record of the log : size of the payload and CRC32 of the payload.
+RECORD_HEADER = struct.Struct(">II")
+
+#: Header of a checkpoint : magic, size of the log covered by the checkpoint and number of levels.
+CHECKPOINT_HEADER = struct.Struct(">8sQI")
+
+#: Header of each level of a checkpoint : size of the level in bytes.
+LEVEL_HEADER = struct.Struct(">Q")
+
+CHECKPOINT_MAGIC = b"HDTCKPT1"
+
+
+class LeafLog:
+    """Append-only log of the leaves accepted by a generation of the tree, with a checkpoint of the levels of the tree.
+
+    Each record is its payload prefixed by its size and its CRC32, so a record partially written by a crash is detected and dropped.
+    The records are only written by append, which syncs the file once for all the records given, so a group of submissions costs a single fsync.
+    The checkpoint holds the levels of the tree when the log had a given size : the records up to that size don't have to be hashed again.
+    """
+
+    def __init__(self, directory, generation) -> None:
+        """
+        :param directory: Folder of the logs
+        :type directory: str
+        :param generation: Number of the generation of the tree, increasing at each rotation
+        :type generation: int
+        """
+        self.generation = generation
+        self.path = os.path.join(directory, f"tree_{generation:08d}.log")
+        self.checkpoint_path = os.path.join(directory, f"tree_{generation:08d}.ckpt")
+
+        #: Number of records appended since the last checkpoint
+        self.nb_records_since_checkpoint = 0
+
+        self.__directory = directory
+        self.__file = None
+        #: Size of the valid records of the log, None until the log is read or opened
+        self.__size = None
+
+    @staticmethod
+    def get_generations(directory):
+        """Get the generations having a log in a folder.
+
+        :param directory: Folder of the logs
+        :type directory: str
+        :return: Generations, oldest first
+        :rtype: List[int]
+        """
+        generations = []
+        for filename in os.listdir(directory):
+            if filename.startswith("tree_") and filename.endswith(".log"):
+                generations.append(int(filename[5:-4]))
+        return sorted(generations)
+
+    def read_records(self):
+        """Iterate over the valid records of the log. The iteration stops at the first record partially written or corrupted.
+
+        :return: Iterator of (size of the log up to the end of the record, payload)
+        :rtype: Iterator[Tuple[int, bytes]]
+        """
+        self.__size = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as log_file:
+            while True:
+                header = log_file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                size, crc = RECORD_HEADER.unpack(header)
+                payload = log_file.read(size)
+                if len(payload) < size or zlib.crc32(payload) != crc:
+                    break
+                self.__size += RECORD_HEADER.size + size
+                yield self.__size, payload
+
+    def read_checkpoint(self):
+        """Read the checkpoint of the log.
+
+        :return: Size of the log covered by the checkpoint and levels of the tree (see TreeBuilder.get_levels), (0, None) if there is no checkpoint
+        :rtype: int, List[bytes]
+        :raises ValueError: If the checkpoint is corrupted
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return 0, None
+        with open(self.checkpoint_path, "rb") as checkpoint_file:
+            header = checkpoint_file.read(CHECKPOINT_HEADER.size)
+            if len(header) < CHECKPOINT_HEADER.size:
+                raise ValueError(f"Checkpoint {self.checkpoint_path} is corrupted.")
+            magic, log_size, nb_levels = CHECKPOINT_HEADER.unpack(header)
+            if magic != CHECKPOINT_MAGIC:
+                raise ValueError(f"Checkpoint {self.checkpoint_path} is corrupted.")
+            levels = []
+            for _ in range(nb_levels):
+                level_header = checkpoint_file.read(LEVEL_HEADER.size)
+                if len(level_header) < LEVEL_HEADER.size:
+                    raise ValueError(f"Checkpoint {self.checkpoint_path} is corrupted.")
+                (size,) = LEVEL_HEADER.unpack(level_header)
+                level = checkpoint_file.read(size)
+                if len(level) < size:
+                    raise ValueError(f"Checkpoint {self.checkpoint_path} is corrupted.")
+                levels.append(level)
+        return log_size, levels
+
+    def open(self):
+        """Open the log to append records. The records following the last valid one are removed."""
+        if self.__size is None:
+            for _ in self.read_records():
+                pass
+        self.__file = open(self.path, "ab")
+        self.__file.truncate(self.__size)
+        self.__sync()
+
+    def append(self, payloads):
+        """Append records to the log and sync them to the disk, with a single fsync.
+
+        :param payloads: Payloads of the records
+        :type payloads: List[bytes]
+        :raises OSError: If the records could not be written. The log is then left as it was before.
+        """
+        data = b"".join(
+            RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+            for payload in payloads
+        )
+        try:
+            self.__file.write(data)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        except OSError:
+            # a partial record would hide all the following ones.
+            self.__file.truncate(self.__size)
+            raise
+        self.__size += len(data)
+        self.nb_records_since_checkpoint += len(payloads)
+
+    def write_checkpoint(self, levels):
+        """Write the checkpoint of the log. The previous checkpoint is replaced atomically.
+
+        :param levels: Levels of the tree holding all the records of the log, see TreeBuilder.get_levels
+        :type levels: List[bytes]
+        """
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as checkpoint_file:
+            checkpoint_file.write(
+                CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, self.__size, len(levels))
+            )
+            for level in levels:
+                checkpoint_file.write(LEVEL_HEADER.pack(len(level)))
+                checkpoint_file.write(level)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self.__sync_directory()
+        self.nb_records_since_checkpoint = 0
+
+    def close(self):
+        """Close the log, its files are kept."""
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def remove(self):
+        """Close the log and delete its files."""
+        self.close()
+        for path in (self.path, self.checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.__sync_directory()
+
+    def __sync(self):
+        """Sync the log file and the creation of the file."""
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__sync_directory()
+
+    def __sync_directory(self):
+        """Sync the folder of the logs, so the created, replaced or removed files survive a crash."""
+        fd = os.open(self.__directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,101 @@
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+
+from settings import TREE_HASH_POOL, TREE_HASH_WORKERS, TREE_HASH_MIN_PAIRS
+
+from .node_store import DIGEST_SIZE
+from .singleton import Singleton
+
+#: Size in bytes of a pair of nodes, the value hashed to obtain their parent.
+PAIR_SIZE = 2 * DIGEST_SIZE
+
+
+def hash_pairs(children):
+    """Hash the consecutive pairs of nodes of a level.
+
+    :param children: Raw digests of the nodes, concatenated. Their number must be even.
+    :type children: bytes
+    :return: Raw digests of the parents, concatenated
+    :rtype: bytes
+    """
+    sha256 = hashlib.sha256
+    return b"".join(
+        sha256(children[k : k + PAIR_SIZE]).digest()
+        for k in range(0, len(children), PAIR_SIZE)
+    )
+
+
+class LevelHasher(metaclass=Singleton):
+    """Hash the levels of the tree, in chunks across a pool of workers when a level is big enough.
+
+    The pool is configured by TREE_HASH_POOL, TREE_HASH_WORKERS and TREE_HASH_MIN_PAIRS and is only started on the first level big enough to use it.
+    hashlib only releases the GIL for inputs of more than 2047 bytes, and a pair of nodes is 64 bytes, so a pool of threads only helps with a Python build that has no GIL : the processes pool is the default.
+    """
+
+    def __init__(
+        self,
+        mode=TREE_HASH_POOL,
+        workers=TREE_HASH_WORKERS,
+        min_pairs=TREE_HASH_MIN_PAIRS,
+    ) -> None:
+        """
+        :param mode: "process", "thread" or None to always hash serially, defaults to TREE_HASH_POOL
+        :type mode: str, optional
+        :param workers: Number of workers of the pool, defaults to TREE_HASH_WORKERS
+        :type workers: int, optional
+        :param min_pairs: Minimum number of pairs in a level to use the pool, defaults to TREE_HASH_MIN_PAIRS
+        :type min_pairs: int, optional
+        :raises ValueError: If the mode is unknown
+        """
+        if mode not in ("process", "thread", None):
+            raise ValueError(f"Unknown hashing pool {mode}.")
+        self.mode = mode
+        self.workers = workers
+        self.min_pairs = min_pairs
+        self.__pool = None
+        self.__pool_mutex = Lock()
+
+    def hash_level(self, children):
+        """Hash the consecutive pairs of nodes of a level, with the pool if there are at least min_pairs pairs.
+
+        :param children: Raw digests of the nodes, concatenated. Their number must be even.
+        :type children: bytes
+        :return: Raw digests of the parents, concatenated, in the same order as the pairs
+        :rtype: bytes
+        """
+        nb_pairs = len(children) // PAIR_SIZE
+        if self.mode is None or self.workers < 2 or nb_pairs < self.min_pairs:
+            return hash_pairs(children)
+        # one chunk per worker, cut on a pair boundary.
+        chunk_size = -(-nb_pairs // self.workers) * PAIR_SIZE
+        chunks = [
+            children[k : k + chunk_size] for k in range(0, len(children), chunk_size)
+        ]
+        return b"".join(self.__get_pool().map(hash_pairs, chunks))
+
+    def shutdown(self):
+        """Stop the workers of the pool, a new pool is started if a big level has to be hashed again."""
+        with self.__pool_mutex:
+            if self.__pool is not None:
+                self.__pool.shutdown()
+                self.__pool = None
+
+    def __get_pool(self):
+        """Get the pool of workers, starting it if needed.
+
+        :return: Pool of workers
+        :rtype: concurrent.futures.Executor
+        """
+        with self.__pool_mutex:
+            if self.__pool is None:
+                if self.mode == "process":
+                    # the api runs several threads, the workers are spawned rather than forked from it.
+                    self.__pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                else:
+                    self.__pool = ThreadPoolExecutor(max_workers=self.workers)
+            return self.__pool
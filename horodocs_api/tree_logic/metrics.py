@@ -0,0 +1,63 @@
+from threading import Lock
+
+from .singleton import Singleton
+
+
+class Metrics(metaclass=Singleton):
+    """Counters and summaries of the values observed by the api, shared by all the threads. This class must be a Singleton to work correctly.
+
+    A summary keeps the number of observations, their sum, minimum, maximum and the last one, so it never grows with the number of observations.
+    """
+
+    def __init__(self) -> None:
+        self.__mutex = Lock()
+        self.__counters = {}
+        self.__summaries = {}
+
+    def increment(self, name, value=1):
+        """Increment a counter, created at 0 if needed.
+
+        :param name: Name of the counter
+        :type name: str
+        :param value: Increment, defaults to 1
+        :type value: int, optional
+        """
+        with self.__mutex:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        """Add an observation to a summary, created if needed.
+
+        :param name: Name of the summary
+        :type name: str
+        :param value: Value observed
+        :type value: float
+        """
+        with self.__mutex:
+            summary = self.__summaries.get(name)
+            if summary is None:
+                self.__summaries[name] = {
+                    "count": 1,
+                    "sum": value,
+                    "min": value,
+                    "max": value,
+                    "last": value,
+                }
+            else:
+                summary["count"] += 1
+                summary["sum"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+                summary["last"] = value
+
+    def get_all(self):
+        """Get a copy of all the counters and summaries, with the mean of each summary.
+
+        :return: counters and summaries by name
+        :rtype: Dict[str, Dict]
+        """
+        with self.__mutex:
+            summaries = {}
+            for name, summary in self.__summaries.items():
+                summaries[name] = dict(summary, mean=summary["sum"] / summary["count"])
+            return {"counters": dict(self.__counters), "summaries": summaries}
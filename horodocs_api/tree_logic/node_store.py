@@ -0,0 +1,243 @@
+#: Size in bytes of a node of the tree (a raw SHA256 digest).
+DIGEST_SIZE = 32
+
+
+class NodeStore:
+    """Compact storage of the nodes of a Merkle based tree.
+
+    Each level of the tree is stored in one contiguous bytearray holding the raw 32 bytes digests of its nodes, the node (level, index) being at the offset index * DIGEST_SIZE of its level.
+    Nodes are always added at the end of their level, which is how the tree is built.
+    """
+
+    def __init__(self) -> None:
+        #: Levels of the tree, levels[0] being the leaves.
+        self.__levels = []
+
+    def clear(self):
+        """Remove all the nodes of the store."""
+        self.__levels = []
+
+    def append(self, level, digest):
+        """Add a node at the end of a level.
+
+        :param level: Level of the node
+        :type level: int
+        :param digest: Raw SHA256 digest of the node
+        :type digest: bytes
+        :return: Index of the node in its level
+        :rtype: int
+        :raises ValueError: if the digest is not DIGEST_SIZE long or if the level is not reachable
+        """
+        if len(digest) != DIGEST_SIZE:
+            raise ValueError(f"A node must be a {DIGEST_SIZE} bytes digest.")
+        if level > len(self.__levels):
+            raise ValueError(
+                f"Level {level} can't be created before level {level - 1}."
+            )
+        if level == len(self.__levels):
+            self.__levels.append(bytearray())
+        index = len(self.__levels[level]) // DIGEST_SIZE
+        self.__levels[level] += digest
+        return index
+
+    def extend(self, level, digests):
+        """Add several nodes at the end of a level.
+
+        :param level: Level of the nodes
+        :type level: int
+        :param digests: Raw digests of the nodes, concatenated
+        :type digests: bytes
+        :return: Index of the first node added in its level
+        :rtype: int
+        :raises ValueError: if the digests are not a multiple of DIGEST_SIZE long or if the level is not reachable
+        """
+        if len(digests) % DIGEST_SIZE != 0:
+            raise ValueError(f"Nodes must be {DIGEST_SIZE} bytes digests.")
+        if level > len(self.__levels):
+            raise ValueError(
+                f"Level {level} can't be created before level {level - 1}."
+            )
+        if level == len(self.__levels):
+            self.__levels.append(bytearray())
+        index = len(self.__levels[level]) // DIGEST_SIZE
+        self.__levels[level] += digests
+        return index
+
+    def get_nodes(self, level, start, stop):
+        """Get the concatenated digests of the nodes of a level from start (included) to stop (excluded).
+
+        :param level: Level of the nodes
+        :type level: int
+        :param start: Index of the first node
+        :type start: int
+        :param stop: Index following the last node
+        :type stop: int
+        :return: Raw digests of the nodes
+        :rtype: bytes
+        """
+        if level >= len(self.__levels):
+            return b""
+        return bytes(self.__levels[level][start * DIGEST_SIZE : stop * DIGEST_SIZE])
+
+    def get(self, level, index):
+        """Get the digest of the node (level, index)
+
+        :param level: Level of the node
+        :type level: int
+        :param index: Index of the node in its level
+        :type index: int
+        :return: Raw digest of the node
+        :rtype: bytes
+        :raises KeyError: if the node does not exist
+        """
+        return bytes(self.__get_slice(level, index))
+
+    def get_hex(self, level, index):
+        """Get the hexadecimal digest of the node (level, index), as written in the receipts.
+
+        :param level: Level of the node
+        :type level: int
+        :param index: Index of the node in its level
+        :type index: int
+        :return: Hexadecimal digest of the node
+        :rtype: str
+        :raises KeyError: if the node does not exist
+        """
+        return self.__get_slice(level, index).hex()
+
+    def get_pair(self, level, index):
+        """Get the concatenated digests of the nodes (level, index) and (level, index + 1), which is the value hashed to obtain their parent.
+
+        :param level: Level of the nodes
+        :type level: int
+        :param index: Index of the left node, must be even
+        :type index: int
+        :return: Both raw digests, left one first
+        :rtype: bytes
+        :raises KeyError: if one of the nodes does not exist
+        """
+        offset = index * DIGEST_SIZE
+        if level < len(self.__levels) and index >= 0 and index % 2 == 0:
+            pair = self.__levels[level][offset : offset + 2 * DIGEST_SIZE]
+            if len(pair) == 2 * DIGEST_SIZE:
+                return bytes(pair)
+        raise KeyError((level, index))
+
+    def get_siblings_hex(self, index, depth):
+        """Get the hexadecimal digests of the siblings of the leaf index and of its parents, which are its branches. A node without sibling (promoted, see TreeBuilder.finalize_tree) has no branch at its level.
+
+        The levels are read in a single call, as the branches of every leaf are extracted when a tree is closed.
+
+        :param index: Index of the leaf
+        :type index: int
+        :param depth: Number of levels to go through
+        :type depth: int
+        :return: (level, index, hexadecimal digest) of each sibling, from the leaves up
+        :rtype: List[Tuple[int, int, str]]
+        """
+        siblings = []
+        for level, nodes in enumerate(self.__levels[:depth]):
+            j = (index >> level) ^ 1
+            offset = j * DIGEST_SIZE
+            if offset < len(nodes):
+                siblings.append((level, j, nodes[offset : offset + DIGEST_SIZE].hex()))
+        return siblings
+
+    def __get_slice(self, level, index):
+        """Slice the node (level, index) out of its level.
+
+        :raises KeyError: if the node does not exist
+        """
+        offset = index * DIGEST_SIZE
+        if level < len(self.__levels) and index >= 0:
+            node = self.__levels[level][offset : offset + DIGEST_SIZE]
+            if len(node) == DIGEST_SIZE:
+                return node
+        raise KeyError((level, index))
+
+    def level_size(self, level):
+        """Get the number of nodes in a level
+
+        :param level: Level wanted
+        :type level: int
+        :return: Number of nodes
+        :rtype: int
+        """
+        if level >= len(self.__levels):
+            return 0
+        return len(self.__levels[level]) // DIGEST_SIZE
+
+    def get_nb_levels(self):
+        """Get the number of levels containing at least one node.
+
+        :return: Number of levels
+        :rtype: int
+        """
+        return len(self.__levels)
+
+    def get_nbytes(self):
+        """Get the number of bytes used by the digests of the store.
+
+        :return: Number of bytes
+        :rtype: int
+        """
+        return sum(len(level) for level in self.__levels)
+
+    def __iter__(self):
+        """Iterate over all the nodes, level by level.
+
+        :return: Iterator of (level, index, digest)
+        :rtype: Iterator[Tuple[int, int, bytes]]
+        """
+        for level in range(len(self.__levels)):
+            for index in range(self.level_size(level)):
+                yield level, index, self.get(level, index)
+
+
+class TreeBranches:
+    """Branches (anterior and posterior) of all the leaves of a complete tree, see TreeBuilder.is_complete.
+
+    The branches are read from the store when they are asked for : only the siblings of the leaf are converted to hexadecimal, the levels are never copied.
+    """
+
+    def __init__(self, store, depth, nb_leaves) -> None:
+        """
+        :param store: Nodes of the tree
+        :type store: NodeStore
+        :param depth: Depth of the tree
+        :type depth: int
+        :param nb_leaves: Number of leaves to iterate on
+        :type nb_leaves: int
+        """
+        self.__store = store
+        self.__depth = depth
+        self.__nb_leaves = nb_leaves
+
+    def get_branches(self, n):
+        """Get the branches associated to the n leaf, in the same format as TreeBuilder.get_anterior_branches and TreeBuilder.get_posterior_branches
+
+        :param n: Indice of the leaf
+        :type n: int
+        :return: Anterior branches, posterior branches
+        :rtype: List[Tuple[int, int, str]], List[Tuple[int, int, str]]
+        """
+        anterior_branches = []
+        posterior_branches = []
+        for branch in self.__store.get_siblings_hex(n, self.__depth):
+            if branch[1] % 2 == 0:
+                anterior_branches.append(branch)
+            else:
+                posterior_branches.append(branch)
+        return anterior_branches, posterior_branches
+
+    def __len__(self):
+        return self.__nb_leaves
+
+    def __iter__(self):
+        """Iterate over the branches of all the leaves, in the order of the leaves.
+
+        :return: Iterator of (anterior branches, posterior branches)
+        :rtype: Iterator[Tuple[List, List]]
+        """
+        for n in range(self.__nb_leaves):
+            yield self.get_branches(n)
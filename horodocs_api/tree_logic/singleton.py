@@ -1,3 +1,6 @@
+from threading import RLock
+
+
 class Singleton(type):
     """Single class allows to make a class unique. Has to be used as a metaclass parameter by another class.
     
@@ -8,10 +11,15 @@ class Singleton(type):
         b = ClassA()
         
     This class makes it that in this example a = b.
+
+    The first calls made by several threads at once create a single instance : the creation holds a lock, reentrant as the initialisation of a singleton can use another one.
     """
 
     _instances = {}
+    _lock = RLock()
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+            with cls._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
         return cls._instances[cls]
\ No newline at end of file
@@ -0,0 +1,62 @@
+from time import sleep, time
+
+import pytest
+
+from tree_logic.clock import ClockService, FakeNTPClient
+from tree_logic.singleton import Singleton
+
+SERVERS = ["a", "b", "c"]
+
+
+@pytest.fixture
+def start_clock():
+    """Start a new ClockService on a FakeNTPClient, once its first synchronisation is done."""
+
+    def start_clock(client):
+        Singleton._instances.pop(ClockService, None)
+        clock = ClockService(SERVERS, client)
+        while not clock.get_status()["synced"]:
+            sleep(0.01)
+        return clock
+
+    yield start_clock
+    Singleton._instances.pop(ClockService, None)
+
+
+def test_offset_is_the_median_of_the_servers(start_clock):
+    client = FakeNTPClient(
+        offsets={"a": 10, "b": 10.2, "c": 50}, delays={"a": 0.02, "b": 0.02}
+    )
+    clock = start_clock(client)
+    assert clock.timestamp() - time() == pytest.approx(10.2, abs=0.01)
+    # the server c is the furthest from the median
+    assert clock.uncertainty == pytest.approx(39.8, abs=0.01)
+    assert client.requests == {"a": 1, "b": 1, "c": 1}
+
+
+def test_sync_without_the_servers_down(start_clock):
+    client = FakeNTPClient(offsets={"a": 5, "b": 5}, down=["c"])
+    clock = start_clock(client)
+    assert clock.timestamp() - time() == pytest.approx(5, abs=0.01)
+    client.down = set(SERVERS)
+    assert not clock.sync()
+    assert clock.timestamp() - time() == pytest.approx(5, abs=0.01)
+
+
+def test_small_correction_is_slewed(start_clock):
+    client = FakeNTPClient(offsets={server: 1 for server in SERVERS})
+    clock = start_clock(client)
+    before = clock.timestamp()
+    client.offsets = {server: 1 - 0.1 for server in SERVERS}
+    assert clock.sync()
+    # the clock is corrected by 0.5 ms per second, it never goes back
+    assert clock.timestamp() >= before
+    assert clock.timestamp() - time() == pytest.approx(1, abs=0.01)
+
+
+def test_large_correction_is_stepped(start_clock):
+    client = FakeNTPClient(offsets={server: 1 for server in SERVERS})
+    clock = start_clock(client)
+    client.offsets = {server: -1 for server in SERVERS}
+    assert clock.sync()
+    assert clock.timestamp() - time() == pytest.approx(-1, abs=0.01)
@@ -0,0 +1,103 @@
+from threading import Event
+from time import sleep
+
+import pytest
+
+from tree_logic import entropy_pool
+from tree_logic.entropy_pool import QRNG_MAX_BYTES, EntropyPool
+from tree_logic.metrics import Metrics
+from tree_logic.singleton import Singleton
+
+
+class FakeQRNG:
+    """Stand-in for get_true_random, giving the blocks 0, 1, 2... or raising the errors given first."""
+
+    def __init__(self, answers=(), fail_after=None):
+        """
+        :param answers: Errors to raise, or payloads to give, before the valid blocks
+        :param fail_after: Number of valid blocks after which the generator does not respond anymore
+        """
+        self.answers = list(answers)
+        self.fail_after = fail_after
+        self.nb_blocks = 0
+        self.calls = 0
+        #: Set at the end of the test, the thread of its pool then waits forever
+        self.stopped = Event()
+
+    def __call__(self, nb_bytes, mode="b", timeout=1):
+        if self.stopped.is_set():
+            Event().wait()
+        self.calls += 1
+        if len(self.answers) > 0:
+            answer = self.answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+        if self.fail_after is not None and self.nb_blocks >= self.fail_after:
+            raise OSError("No response.")
+        self.nb_blocks += 1
+        return bytes([self.nb_blocks]).hex() * nb_bytes + "\n"
+
+
+@pytest.fixture
+def start_pool(monkeypatch):
+    """Start a new EntropyPool on a FakeQRNG, with new Metrics."""
+    monkeypatch.setattr(entropy_pool, "ENTROPY_QRNG_RETRY_DELAY", 0.01)
+    monkeypatch.setattr(entropy_pool, "WARN_ADMIN", False)
+    fakes = []
+
+    def start_pool(fake, size):
+        fakes.append(fake)
+        monkeypatch.setattr(entropy_pool, "get_true_random", fake)
+        Singleton._instances.pop(EntropyPool, None)
+        Singleton._instances.pop(Metrics, None)
+        return EntropyPool(size)
+
+    yield start_pool
+    for fake in fakes:
+        fake.stopped.set()
+    # the threads retrying call the fake again before it is removed
+    sleep(0.05)
+    Singleton._instances.pop(EntropyPool, None)
+    Singleton._instances.pop(Metrics, None)
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_bytes_are_taken_from_the_pool(start_pool):
+    fake = FakeQRNG()
+    pool = start_pool(fake, 2 * QRNG_MAX_BYTES)
+    wait_for(lambda: fake.nb_blocks == 2)
+    assert pool.get_qrng_ratio() is None
+    assert pool.get_bytes(32) == bytes([2]) * 32
+    assert pool.get_hex(QRNG_MAX_BYTES) == (bytes([1]) * 32 + bytes([2]) * 96).hex()
+    assert pool.get_qrng_ratio() == 1
+
+
+def test_bytes_fall_back_to_urandom(start_pool):
+    fake = FakeQRNG(fail_after=2)
+    pool = start_pool(fake, 2 * QRNG_MAX_BYTES)
+    wait_for(lambda: fake.nb_blocks == 2)
+    assert pool.get_bytes(200) == bytes([1]) * 72 + bytes([2]) * 128
+    # 56 bytes are left in the pool
+    data = pool.get_bytes(100)
+    assert len(data) == 100 and data != bytes([1]) * 100
+    assert pool.get_qrng_ratio() == 2 / 3
+    # the generator is requested again
+    calls = fake.calls
+    wait_for(lambda: fake.calls > calls)
+
+
+def test_pool_is_filled_again_after_errors(start_pool):
+    errors = [ValueError("Invalid."), OSError("Reset."), "not hexadecimal", "00ff"]
+    fake = FakeQRNG(errors)
+    pool = start_pool(fake, QRNG_MAX_BYTES)
+    wait_for(lambda: fake.nb_blocks == 1)
+    assert fake.calls == len(errors) + 1
+    assert pool.get_bytes(QRNG_MAX_BYTES) == bytes([1]) * QRNG_MAX_BYTES
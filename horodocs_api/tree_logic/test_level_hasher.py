@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from tree_logic.level_hasher import PAIR_SIZE, LevelHasher, hash_pairs
+
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+@pytest.mark.parametrize("nb_pairs", [4, 7, 1001])
+def test_pool_hashes_as_serial(mode, nb_pairs):
+    children = os.urandom(nb_pairs * PAIR_SIZE)
+    # a new hasher, not the one of the api
+    hasher = object.__new__(LevelHasher)
+    hasher.__init__(mode, workers=3, min_pairs=4)
+    try:
+        assert hasher.hash_level(children) == hash_pairs(children)
+    finally:
+        hasher.shutdown()
+
+
+def test_unknown_pool():
+    with pytest.raises(ValueError):
+        LevelHasher.__init__(object.__new__(LevelHasher), "fork")
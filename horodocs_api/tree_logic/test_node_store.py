@@ -0,0 +1,37 @@
+import pytest
+
+from tree_logic.node_store import DIGEST_SIZE, NodeStore, TreeBranches
+from tree_logic.test_tree import make_leaf
+from tree_logic.tree import TreeBuilder
+
+
+def make_tree(nb_leaves, version):
+    tree = TreeBuilder(version)
+    tree.add_leaves([make_leaf(i) for i in range(nb_leaves)])
+    tree.finalize_tree()
+    return tree
+
+
+@pytest.mark.parametrize(
+    "nb_leaves, version", [(1, 3), (7, 3), (12, 3), (16, 3), (5, 2), (8, 2)]
+)
+def test_branches_of_all_leaves_are_the_branches_of_each_leaf(nb_leaves, version):
+    tree = make_tree(nb_leaves, version)
+    branches = tree.get_all_branches()
+    assert len(branches) == nb_leaves
+    for n, (anterior_branches, posterior_branches) in enumerate(branches):
+        assert anterior_branches == tree.get_anterior_branches(n)
+        assert posterior_branches == tree.get_posterior_branches(n)
+
+
+def test_promoted_node_has_no_branch_at_its_level():
+    store = NodeStore()
+    store.extend(0, bytes(range(3 * DIGEST_SIZE)))
+    store.extend(1, bytes(2 * DIGEST_SIZE))
+    branches = TreeBranches(store, 2, 3)
+    # the leaf 2 has no sibling, it is promoted to the level 1
+    assert branches.get_branches(2) == ([(1, 0, "00" * DIGEST_SIZE)], [])
+    assert branches.get_branches(1) == (
+        [(0, 0, bytes(range(DIGEST_SIZE)).hex())],
+        [(1, 1, "00" * DIGEST_SIZE)],
+    )
@@ -0,0 +1,318 @@
+import os
+
+import pytest
+
+from exceptions import ContractCommunicationException
+from tree_logic import tree
+from tree_logic.functions import calc_tree_root
+from tree_logic.level_hasher import PAIR_SIZE, LevelHasher
+from tree_logic.singleton import Singleton
+from tree_logic.tree import (
+    LeafInfos,
+    LeafRecordStore,
+    SendTree,
+    TreeBuilder,
+    TreeManager,
+)
+
+
+def make_leaf(i, express=False):
+    leaf_infos = LeafInfos(
+        md5_value="a" * 32,
+        sha256_value="b" * 64,
+        case_number="case",
+        file_id=f"file {i}",
+        investigator="investigator",
+        email_user="user@example.com",
+        comments="",
+        want_ancrage_informations=True,
+        language="fr",
+        express=express,
+    )
+    return (
+        i.to_bytes(32, "big"),
+        leaf_infos,
+        f"Q{i}",
+        ("salt", "date", "md5", "sha256", "root"),
+    )
+
+
+def make_subtree(first, nb_leaves):
+    subtree = TreeBuilder()
+    subtree.add_leaves([make_leaf(i) for i in range(first, first + nb_leaves)])
+    subtree.finalize_tree()
+    return subtree
+
+
+def make_subtree_v2(first, nb_leaves):
+    """Sub-tree logged before the version 3, completed with random nodes."""
+    subtree = TreeBuilder(2)
+    subtree.add_leaves([make_leaf(i) for i in range(first, first + nb_leaves)])
+    subtree.finalize_tree()
+    return subtree
+
+
+@pytest.mark.parametrize("nb_leaves", [1, 2, 5, 11])
+def test_receipts_of_version_3_give_the_root(nb_leaves, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(tree.__file__)))
+    leaves = [make_leaf(i) for i in range(nb_leaves)]
+    # sub-trees of odd sizes, with promoted nodes in the sub-tree and in the tree
+    leaves[1:1] = [make_subtree(100, 3), make_subtree_v2(200, 3), make_subtree(300, 1)]
+    built_tree = TreeBuilder(3)
+    built_tree.add_leaves(leaves)
+    built_tree.finalize_tree()
+    quittances = []
+    for record, anterior_branches, posterior_branches in built_tree.get_receipts():
+        quittances.append(record.quittance)
+        file_value = int(record.quittance[1:]).to_bytes(32, "big")
+        branches = sorted(anterior_branches + posterior_branches)
+        root, _ = calc_tree_root(branches, file_value, None, "fr", version=3)
+        assert root == built_tree.get_root()
+    assert len(quittances) == nb_leaves + 7
+
+
+def get_quittances(leaves):
+    """Quittances of the leaves, the ones of the files of the sub-trees included, in order."""
+    quittances = []
+    for leaf in leaves:
+        if isinstance(leaf, TreeBuilder):
+            quittances += get_quittances(leaf.get_leaves())
+        else:
+            quittances.append(leaf[2])
+    return quittances
+
+
+def test_records_of_leaves_and_subtrees_spill(monkeypatch):
+    monkeypatch.setattr(LeafRecordStore.__init__, "__defaults__", (4,))
+    # a sub-tree larger than the threshold has already spilled its records
+    leaves = [make_leaf(0), make_subtree(100, 3), make_leaf(1), make_subtree(200, 6)]
+    leaves += [make_leaf(i) for i in range(2, 5)] + [make_subtree(300, 2)]
+    built_tree = TreeBuilder()
+    for leaf in leaves:
+        built_tree.add_leaves([leaf])
+        assert built_tree.get_nb_records_in_memory() <= 4
+    assert all(
+        leaf.get_nb_records_in_memory() == 0
+        for leaf in leaves[:-1]
+        if isinstance(leaf, TreeBuilder)
+    )
+    restored = list(built_tree.get_leaves())
+    assert [leaf for leaf in restored if isinstance(leaf, TreeBuilder)] == [
+        leaf for leaf in leaves if isinstance(leaf, TreeBuilder)
+    ]
+    assert get_quittances(restored) == get_quittances(leaves)
+    built_tree.finalize_tree()
+    assert [record.quittance for record, _, _ in built_tree.get_receipts()] == (
+        get_quittances(leaves)
+    )
+    built_tree.release()
+
+
+@pytest.fixture
+def start_manager(tmp_path, monkeypatch):
+    """Start a new TreeManager on the logs of the test, as the api does at startup."""
+    monkeypatch.setattr(tree, "TREE_LOG_DIR", str(tmp_path / "tree_log"))
+    monkeypatch.setattr(tree, "ARCHIVE_DIR", str(tmp_path / "archives"))
+    monkeypatch.setattr(tree, "TREE_CHECKPOINT_INTERVAL", 10)
+
+    def start_manager():
+        Singleton._instances.pop(TreeManager, None)
+        return TreeManager()
+
+    yield start_manager
+    Singleton._instances.pop(TreeManager, None)
+
+
+def submit(manager, leaves):
+    """Submit the leaves one by one, each one being written before the next one."""
+    for leaf in leaves:
+        manager.submit_leaves([leaf]).result(timeout=10)
+
+
+def get_log_path():
+    return os.path.join(tree.TREE_LOG_DIR, "tree_00000000.log")
+
+
+def assert_restored(manager, leaves):
+    """Check that the current tree holds the leaves, with the levels of a tree built from them."""
+    restored = manager.rotate_tree()
+    expected = TreeBuilder()
+    expected.add_leaves(leaves)
+    assert restored.get_nb_elems() == len(leaves)
+    assert restored.get_levels() == expected.get_levels()
+    assert [leaf[2] for leaf in restored.get_leaves() if isinstance(leaf, tuple)] == [
+        leaf[2] for leaf in leaves if isinstance(leaf, tuple)
+    ]
+
+
+def test_restore_from_checkpoint_and_log(start_manager):
+    leaves = [make_leaf(i) for i in range(15)] + [make_subtree(100, 5)]
+    leaves += [make_leaf(i) for i in range(15, 25)]
+    submit(start_manager(), leaves)
+    assert os.path.exists(get_log_path().replace(".log", ".ckpt"))
+    assert_restored(start_manager(), leaves)
+
+
+def test_restore_without_checkpoint_hashes_whole_levels(start_manager, monkeypatch):
+    monkeypatch.setattr(tree, "TREE_CHECKPOINT_INTERVAL", 1000)
+    leaves = [make_leaf(i) for i in range(40)]
+    submit(start_manager(), leaves)
+    hasher = LevelHasher()
+    hash_level = hasher.hash_level
+    nb_pairs = []
+
+    def count_pairs(children):
+        nb_pairs.append(len(children) // PAIR_SIZE)
+        return hash_level(children)
+
+    monkeypatch.setattr(hasher, "hash_level", count_pairs)
+    manager = start_manager()
+    # the leaves are hashed in one level, not by batches of the leaf writer
+    assert nb_pairs[:2] == [20, 10]
+    assert_restored(manager, leaves)
+
+
+def test_restore_drops_torn_tail(start_manager):
+    leaves = [make_leaf(i) for i in range(25)]
+    submit(start_manager(), leaves)
+    with open(get_log_path(), "ab") as log_file:
+        # record header announcing a payload that was never written
+        log_file.write(b"\x00\x00\x01\x00\x12\x34")
+    manager = start_manager()
+    submit(manager, [make_leaf(25)])
+    assert_restored(manager, leaves + [make_leaf(25)])
+
+
+@pytest.mark.parametrize("cut", [0.5, 0.95])
+def test_restore_ignores_checkpoint_beyond_log(start_manager, cut):
+    leaves = [make_leaf(i) for i in range(25)]
+    submit(start_manager(), leaves)
+    # the log loses records covered by the checkpoint
+    with open(get_log_path(), "r+b") as log_file:
+        log_file.truncate(int(os.path.getsize(get_log_path()) * cut))
+    manager = start_manager()
+    nb_leaves = manager.get_nb_elems()
+    assert 0 < nb_leaves < 25
+    assert_restored(manager, leaves[:nb_leaves])
+
+
+def test_restore_ignores_checkpoint_of_another_log(start_manager):
+    submit(start_manager(), [make_leaf(i) for i in range(10)])
+    checkpoint_path = get_log_path().replace(".log", ".ckpt")
+    with open(checkpoint_path, "rb") as checkpoint_file:
+        checkpoint = checkpoint_file.read()
+    os.remove(get_log_path())
+    os.remove(checkpoint_path)
+    # same sizes of records, other leaves
+    leaves = [(b"\xff" + leaf[0][1:], *leaf[1:]) for leaf in map(make_leaf, range(10))]
+    submit(start_manager(), leaves[:9])
+    with open(checkpoint_path, "wb") as checkpoint_file:
+        checkpoint_file.write(checkpoint)
+    submit(start_manager(), leaves[9:])
+    assert_restored(start_manager(), leaves)
+
+
+def test_restored_express_leaves_keep_the_express_close(start_manager):
+    manager = start_manager()
+    submit(manager, [make_leaf(0), make_subtree(10, 3)])
+    assert not manager.has_express_leaves()
+    assert not start_manager().has_express_leaves()
+    submit(start_manager(), [make_leaf(1, express=True)])
+    assert start_manager().has_express_leaves()
+
+
+def test_leaves_of_a_tree_not_sent_go_back_to_the_current_tree(
+    start_manager, monkeypatch
+):
+    manager = start_manager()
+    closed_leaves = [make_leaf(0, express=True), make_subtree(10, 3), make_leaf(1)]
+    submit(manager, closed_leaves)
+
+    def send_root_to_chain(root_value, want_ancrage_infos):
+        # the next leaf arrives while the closed tree is sent
+        submit(manager, [make_leaf(2)])
+        raise ContractCommunicationException("Not enough ether.")
+
+    monkeypatch.setattr(manager, "send_root_to_chain", send_root_to_chain)
+    SendTree().close_tree(manager)
+    assert manager.has_express_leaves()
+    assert os.listdir(tree.TREE_LOG_DIR) == ["tree_00000001.log"]
+    # the leaves are sent with the next tree, after a restart too
+    assert_restored(start_manager(), [make_leaf(2)] + closed_leaves)
+
+
+class FakeManager:
+    """Tree seen by the scheduler."""
+
+    def __init__(self, nb_elems=1, express=False, oldest_leaf_age=0):
+        self.nb_elems = nb_elems
+        self.express = express
+        self.oldest_leaf_age = oldest_leaf_age
+
+    def get_nb_elems(self):
+        return self.nb_elems
+
+    def has_express_leaves(self):
+        return self.express
+
+    def get_oldest_leaf_age(self):
+        return self.oldest_leaf_age
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """SendTree whose trees have a maximum age of 10 minutes and take 60 seconds to be sent."""
+    monkeypatch.setattr(SendTree, "get_close_period", staticmethod(lambda: 600))
+    monkeypatch.setattr(
+        SendTree, "get_expected_send_duration", staticmethod(lambda: 60)
+    )
+    monkeypatch.setattr(tree, "TREE_CLOSE_TARGET_LATENCY", None)
+    scheduler = SendTree()
+    # first check, setting the next close at 600
+    assert scheduler.get_close_reason(FakeManager(), 1) is None
+    return scheduler
+
+
+def test_close_at_max_age_aligned_to_the_clock(scheduler):
+    assert scheduler.get_close_reason(FakeManager(), 599) is None
+    assert scheduler.get_close_reason(FakeManager(), 600) == "max_age"
+    assert scheduler.get_close_reason(FakeManager(), 601) is None
+    assert scheduler.get_close_reason(FakeManager(), 1200) == "max_age"
+
+
+def test_close_at_max_leaves(scheduler, monkeypatch):
+    monkeypatch.setattr(tree, "TREE_CLOSE_MAX_LEAVES", 10)
+    assert scheduler.get_close_reason(FakeManager(nb_elems=9), 2) is None
+    assert scheduler.get_close_reason(FakeManager(nb_elems=10), 2) == "max_leaves"
+
+
+def test_express_closes_are_limited_per_hour(scheduler, monkeypatch):
+    monkeypatch.setattr(tree, "EXPRESS_CLOSES_PER_HOUR", 2)
+    manager = FakeManager(express=True)
+    for now in (2, 3):
+        assert scheduler.get_close_reason(manager, now) == "express"
+        # done by SendTree.run when it closes the tree
+        scheduler._SendTree__express_closes.append(now)
+    assert scheduler.get_close_reason(manager, 4) is None
+    # the first express close is one hour old
+    assert not scheduler.can_close_express(3601.5)
+    assert scheduler.can_close_express(3602)
+
+
+@pytest.mark.parametrize(
+    "target_latency, oldest_leaf_age, reason",
+    [
+        (None, 599, None),
+        (300, 239, None),
+        (300, 240, "target_latency"),
+        # not below the maximum age, the longer trees are kept
+        (600, 599, None),
+        (1800, 599, None),
+    ],
+)
+def test_close_at_target_latency(
+    scheduler, monkeypatch, target_latency, oldest_leaf_age, reason
+):
+    monkeypatch.setattr(tree, "TREE_CLOSE_TARGET_LATENCY", target_latency)
+    manager = FakeManager(oldest_leaf_age=oldest_leaf_age)
+    assert scheduler.get_close_reason(manager, 2) == reason
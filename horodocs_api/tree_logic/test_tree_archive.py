@@ -0,0 +1,80 @@
+import pytest
+
+from tree_logic.test_tree import make_leaf, make_subtree, make_subtree_v2
+from tree_logic.tree import TreeBuilder
+from tree_logic.tree_archive import TreeArchive
+
+
+def make_tree(version):
+    """Tree with files and sub-trees, whose sizes give promoted nodes since the version 3."""
+    built_tree = TreeBuilder(version)
+    leaves = [make_leaf(i) for i in range(5)]
+    leaves[1:1] = [make_subtree_v2(100, 3), make_subtree_v2(200, 1)]
+    if version >= 3:
+        leaves[4:4] = [make_subtree(300, 5), make_subtree(400, 2)]
+    built_tree.add_leaves(leaves)
+    built_tree.finalize_tree()
+    return built_tree
+
+
+def write_archive(path, built_tree):
+    infos = {
+        "closing_time": "2023-11-14 22:13:20 (Europe/Zurich : CET+0100)",
+        "lid": "0123-4567-89ab-cdef",
+        "version": built_tree.version,
+        "root": built_tree.get_root().hex(),
+    }
+    return TreeArchive.write(str(path), built_tree, infos), TreeArchive(str(path))
+
+
+@pytest.mark.parametrize("version", [2, 3])
+def test_proofs_of_the_archive_are_the_receipts(tmp_path, version):
+    built_tree = make_tree(version)
+    quittances, archive = write_archive(tmp_path / "tree.archive", built_tree)
+    receipts = list(built_tree.get_receipts())
+    assert quittances == {record.quittance for record, _, _ in receipts}
+    assert archive.infos["root"] == built_tree.get_root().hex()
+    for record, anterior_branches, posterior_branches in receipts:
+        expected = {
+            "salt": record.salt,
+            "md5": record.md5_value,
+            "sha256": record.sha256_value,
+            "date": record.date_filename,
+            "anterior_branches": anterior_branches,
+            "posterior_branches": posterior_branches,
+            "version": version,
+            "closing_time": "2023-11-14 22:13:20 (Europe/Zurich : CET+0100)",
+        }
+        assert archive.find_by_quittance(record.quittance) == [expected]
+        leaf = int(record.quittance[1:]).to_bytes(32, "big")
+        assert archive.find_by_leaf(leaf) == [expected]
+    assert archive.find_by_quittance("Q999") == []
+    assert archive.find_by_leaf(b"\xff" * 32) == []
+    archive.close()
+
+
+def test_files_sharing_a_quittance(tmp_path):
+    built_tree = TreeBuilder()
+    leaves = [make_leaf(i) for i in range(4)]
+    leaves[3] = (leaves[3][0], leaves[3][1], "Q1", leaves[3][3])
+    built_tree.add_leaves(leaves)
+    built_tree.finalize_tree()
+    quittances, archive = write_archive(tmp_path / "tree.archive", built_tree)
+    assert quittances == {"Q0", "Q1", "Q2"}
+    branches = [
+        (proof["anterior_branches"], proof["posterior_branches"])
+        for proof in archive.find_by_quittance("Q1")
+    ]
+    assert sorted(branches) == sorted(
+        (anterior_branches, posterior_branches)
+        for record, anterior_branches, posterior_branches in built_tree.get_receipts()
+        if record.quittance == "Q1"
+    )
+    archive.close()
+
+
+def test_file_is_not_an_archive(tmp_path):
+    path = tmp_path / "tree.archive"
+    path.write_bytes(bytes(128))
+    with pytest.raises(ValueError):
+        TreeArchive(str(path))
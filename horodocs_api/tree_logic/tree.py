@@ -1,37 +1,59 @@
-import binascii
 import datetime
+import json
+import logging
 import os
 import queue
+from collections import deque
+from itertools import count
+from concurrent.futures import Future
+import sqlite3
 from threading import Lock, Thread
-from time import sleep
+from time import monotonic, sleep, time
 from typing import Optional
 
 from pydantic import BaseModel
-from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
 
-from settings import ACTUAL_VERSION, EMAIL_ADMIN, START_WORKING_DAY, END_WORKING_DAY
+from settings import (
+    ACTUAL_VERSION,
+    EMAIL_ADMIN,
+    START_WORKING_DAY,
+    END_WORKING_DAY,
+    LEAF_QUEUE_MAX_SIZE,
+    LEAF_WRITER_MAX_BATCH,
+    LEAF_WRITER_FLUSH_INTERVAL,
+    TREE_LOG_DIR,
+    TREE_CHECKPOINT_INTERVAL,
+    ARCHIVE_DIR,
+    LEAF_METADATA_SPILL_THRESHOLD,
+    TREE_CLOSE_MAX_LEAVES,
+    EXPRESS_CLOSES_PER_HOUR,
+    TREE_CLOSE_TARGET_LATENCY,
+    TREE_SCHEDULER_POLL_INTERVAL,
+)
 from smart_contract.eth_interface import Eth
-from sql_db.database import engine
-from sqlalchemy.orm import sessionmaker
+from sql_db.database import SessionLocal
 
-from sql_db.db_utils import get_config
+from sql_db.db_utils import add_archived_quittances, get_config
 
 from .functions import (
     bytes_xor,
     create_qr,
     delete_tmp_files,
-    find_next_power_of_2,
     get_hg_hd,
     get_now_time,
-    hash_sha256,
     is_power_of_2,
     xor_string,
     convert_hexstring_to_binary,
 )
-from .IDQ_quantis import get_true_random
+from .entropy_pool import EntropyPool
+from .leaf_log import LeafLog
+from .level_hasher import LevelHasher
+from .metrics import Metrics
 from .mail_sender import EmailMessage
+from .node_store import DIGEST_SIZE, NodeStore, TreeBranches
 from .PdfCreator import PdfCreator
 from .singleton import Singleton
+from .tree_archive import TreeArchive
 from .TransactionVerifier import TransactionVerifier
 from exceptions import ContractCommunicationException
 from smart_contract.eth_interface import deactivate_horodating
@@ -39,9 +61,10 @@ from gettext import gettext as _
 import gettext
 from pathlib import Path
 
-#: Mutex used to remove concurrencies issues.
+#: Mutex used to remove concurrencies issues. Protects the swap of the current tree and the leaves added to it.
 tree_mutex = Lock()
-# waiting_list_mutex = Lock()
+
+logger = logging.getLogger("horodocs-api-logger")
 
 
 class LeafInfos(BaseModel):
@@ -55,73 +78,259 @@ class LeafInfos(BaseModel):
     want_ancrage_informations: bool
     language: str
     password: Optional[str]
+    #: Close the tree early so the receipt is sent within a minute, only for the API keys allowed to use the express lane
+    express: bool = False
+
+
+class LeafRecord:
+    """Informations kept for a submitted file until its receipt is sent : the fields of its LeafInfos, its quittance and the file informations of its receipt.
+
+    The record only has slots, the MD5 and SHA256 being shared by the LeafInfos and the file informations are kept once.
+    """
+
+    __slots__ = tuple(LeafInfos.__fields__) + (
+        "quittance",
+        "salt",
+        "date_filename",
+        "date_readable",
+    )
+
+    def __init__(self, leaf_infos, quittance, file_infos) -> None:
+        """
+        :param leaf_infos: All the data contained in the form submitted by the user
+        :type leaf_infos: LeafInfos
+        :param quittance: Quittance ramdomly generated
+        :type quittance: str
+        :param file_infos: File informations, see create_leaf
+        :type file_infos: tuple(str,str,str,str,str)
+        """
+        for field in LeafInfos.__fields__:
+            setattr(self, field, getattr(leaf_infos, field))
+        self.quittance = quittance
+        self.salt, self.date_filename, _, _, self.date_readable = file_infos
+
+    @staticmethod
+    def get_values(record):
+        """Get the values of the slots of a record, to store it in a database.
+
+        :param record: Record, or None
+        :type record: LeafRecord
+        :return: Values in the order of the slots, all None for None
+        :rtype: tuple
+        """
+        if record is None:
+            return (None,) * len(LeafRecord.__slots__)
+        return tuple(getattr(record, slot) for slot in LeafRecord.__slots__)
+
+    @staticmethod
+    def from_values(values):
+        """Build back a record from the values of its slots, see get_values.
+
+        :param values: Values in the order of the slots
+        :type values: tuple
+        :return: Record, or None if the values are the ones of None
+        :rtype: LeafRecord
+        """
+        if values[LeafRecord.__slots__.index("quittance")] is None:
+            return None
+        record = LeafRecord.__new__(LeafRecord)
+        for slot, value in zip(LeafRecord.__slots__, values):
+            setattr(record, slot, value)
+        return record
+
+    def get_leaf_infos(self):
+        """Get back the data submitted by the user.
+
+        :return: Data submitted by the user
+        :rtype: LeafInfos
+        """
+        return LeafInfos(
+            **{field: getattr(self, field) for field in LeafInfos.__fields__}
+        )
+
+    def get_file_infos(self):
+        """Get back the file informations of the receipt.
+
+        :return: File informations (salt, date for the filename, md5, sha256, readable date), see create_leaf
+        :rtype: tuple(str,str,str,str,str)
+        """
+        return (
+            self.salt,
+            self.date_filename,
+            self.md5_value,
+            self.sha256_value,
+            self.date_readable,
+        )
+
+
+class LeafRecordStore:
+    """Records of the leaves of a tree, by position : the LeafRecord of a file, the TreeBuilder of a sub-tree or None for an element without user infos.
+
+    Above :ref:`LEAF_METADATA_SPILL_THRESHOLD <constants>` records in memory, the records of the sub-trees included, the records are moved to a temporary SQLite database, deleted when the store is closed.
+    The records of the sub-trees are moved to the same database, each store having its own id in it. The memory used by the records is then bounded whatever the number of leaves and of sub-trees.
+    """
+
+    #: Ids of the stores in the databases of the records
+    store_ids = count()
+
+    def __init__(self, spill_threshold=LEAF_METADATA_SPILL_THRESHOLD) -> None:
+        """
+        :param spill_threshold: Maximum number of records kept in memory, defaults to LEAF_METADATA_SPILL_THRESHOLD
+        :type spill_threshold: int, optional
+        """
+        self.spill_threshold = spill_threshold
+        #: Records following the ones moved to the database
+        self.__records = []
+        #: Sub-trees by position
+        self.__subtrees = {}
+        #: Sub-trees whose records are still in memory, and their number of records
+        self.__subtrees_in_memory = []
+        self.__nb_subtree_records = 0
+        #: Temporary database of the records moved out of memory, None until needed
+        self.__db = None
+        #: True if the database was created by this store, which closes it
+        self.__owns_db = False
+        #: Id of the records of this store in the database
+        self.__store_id = next(LeafRecordStore.store_ids)
+        #: Number of records in the database, their positions are 0 to nb_spilled - 1
+        self.__nb_spilled = 0
+
+    def extend(self, records):
+        """Add records after the others.
+
+        :param records: Records of the next leaves
+        :type records: List[LeafRecord or None]
+        """
+        self.__records += records
+        if self.get_nb_in_memory() > self.spill_threshold:
+            self.spill()
+
+    def set_subtree(self, position, subtree):
+        """Set the record of a leaf added without user infos to its sub-tree.
+
+        :param position: Position of the leaf
+        :type position: int
+        :param subtree: Sub-tree whose root is the leaf
+        :type subtree: TreeBuilder
+        """
+        self.__subtrees[position] = subtree
+        self.__subtrees_in_memory.append(subtree)
+        self.__nb_subtree_records += subtree.get_nb_records_in_memory()
+        if self.get_nb_in_memory() > self.spill_threshold:
+            self.spill()
 
+    def get_nb_in_memory(self):
+        """Get the number of records kept in memory, the ones of the sub-trees included.
 
-class TreeBuilder(metaclass=Singleton):
-    """Class containing all the logic behind the Merkle Based Tree. This class must be a Singleton to work correctly."""
+        :return: Number of records
+        :rtype: int
+        """
+        return len(self.__records) + self.__nb_subtree_records
+
+    def spill(self, db=None):
+        """Move the records in memory, and the ones of the sub-trees, to the database.
+
+        :param db: Database of the records of the tree containing this one, used if this store has no database yet. Defaults to a new database.
+        :type db: sqlite3.Connection, optional
+        """
+        if self.__db is None:
+            if db is None:
+                # an empty filename is a private database on disk, deleted when it is closed.
+                db = sqlite3.connect("", check_same_thread=False)
+                db.execute(
+                    f"CREATE TABLE records (store INTEGER, position INTEGER, {', '.join(LeafRecord.__slots__)}, PRIMARY KEY (store, position))"
+                )
+                self.__owns_db = True
+            self.__db = db
+        placeholders = ", ".join("?" * (len(LeafRecord.__slots__) + 2))
+        self.__db.executemany(
+            f"INSERT INTO records VALUES ({placeholders})",
+            (
+                (self.__store_id, position, *LeafRecord.get_values(record))
+                for position, record in enumerate(self.__records, self.__nb_spilled)
+            ),
+        )
+        self.__db.commit()
+        self.__nb_spilled += len(self.__records)
+        self.__records = []
+        for subtree in self.__subtrees_in_memory:
+            subtree.spill_records(self.__db)
+        self.__subtrees_in_memory = []
+        self.__nb_subtree_records = 0
 
-    #: Number of elements in the current tree
-    __nb_elements = 0
+    def __iter__(self):
+        """Iterate over the records in the order of the leaves, the records of the database are read as the iteration goes.
 
-    #: Differents parts of the tree
-    __parts = {}
+        :return: Iterator of the records
+        :rtype: Iterator[LeafRecord or TreeBuilder or None]
+        """
+        position = 0
+        if self.__db is not None:
+            for row in self.__db.execute(
+                "SELECT * FROM records WHERE store = ? ORDER BY position",
+                (self.__store_id,),
+            ):
+                yield self.__subtrees.get(position, LeafRecord.from_values(row[2:]))
+                position += 1
+        for record in self.__records:
+            yield self.__subtrees.get(position, record)
+            position += 1
 
-    #: Associate a leaf to an email and other user infos. email_leaf_association[leaf] = (email, leaf_infos, file_infos, quittance)
-    __email_leaf_association = {}
+    def __len__(self):
+        return self.__nb_spilled + len(self.__records)
 
-    #: List containing emails, filename, case_number and file_id of people wanting update of the verification and validation of the transaction.
-    want_ancrage_infos = []
+    def close(self):
+        """Delete the database of the records, if any, and the ones of the sub-trees."""
+        for subtree in self.__subtrees.values():
+            subtree.release()
+        if self.__db is not None and self.__owns_db:
+            self.__db.close()
+        self.__db = None
 
-    waiting_list = queue.Queue()
+
+class TreeBuilder:
+    """Class containing all the logic behind the Merkle Based Tree. Each instance is one generation of the tree : the TreeManager fills it and swaps it with a fresh one when it is closed."""
 
     locale_dir = Path("locales")
     gettext.bindtextdomain("horodocs_api", locale_dir)
     gettext.textdomain("horodocs_api")
 
-    def __init__(self) -> None:
+    def __init__(self, version=ACTUAL_VERSION) -> None:
         """
-        Class initialisation. Will start another thread for the Transaction Verifier.
+        Class initialisation, the tree is empty.
+
+        :param version: Version of the layout of the tree, defaults to ACTUAL_VERSION. Up to version 2 the tree is completed with random nodes to 2^n elements, since version 3 the last node of an odd level is promoted to the next level, see finalize_tree.
+        :type version: int, optional
         """
-        self.transaction_verifier = TransactionVerifier()
-        self.transaction_verifier.daemon = True
-        self.transaction_verifier.start()
+        #: Version of the layout of the tree, written in the receipts
+        self.version = version
 
-    def clear_tree(self):
-        """Clear the current tree"""
+        #: Number of elements in the tree
         self.__nb_elements = 0
-        self.__parts = {}
+
+        #: Number of submitted leaves, the random nodes completing the tree excluded
+        self.__nb_leaves = 0
+
+        #: Differents parts of the tree, stored as raw digests level by level.
+        self.__parts = NodeStore()
+
+        #: What each submitted leaf is, by position : the LeafRecord of a file, the TreeBuilder of a sub-tree or None for an element without user infos.
+        self.__leaf_records = LeafRecordStore()
+
+        #: List containing emails, filename, case_number and file_id of people wanting update of the verification and validation of the transaction.
         self.want_ancrage_infos = []
 
-    def add_waiting_elem(
-        self, element, email, leaf_infos: LeafInfos, quittance, file_infos
-    ):
-        self.waiting_list.put((element, email, leaf_infos, quittance, file_infos))
-
-    def transfer_waiting_elem_to_tree(self):
-        # print(f"Transfering {self.waiting_list.qsize()} elements to tree...")
-        while not self.waiting_list.empty():
-            wl = self.waiting_list.get()
-            hash_signature = wl[0]
-            leaf_infos = wl[2]
-            quittance = wl[3]
-            file_data = wl[4]
-            self.add_elem(
-                hash_signature, leaf_infos.email_user, leaf_infos, quittance, file_data
-            )
-            if leaf_infos.want_ancrage_informations:
-                self.add_mail_ancrage(
-                    leaf_infos.email_user,
-                    quittance,
-                    leaf_infos.case_number,
-                    leaf_infos.file_id,
-                    leaf_infos.language,
-                )
+        #: Once finalized, the tree can not receive new elements anymore.
+        self.__finalized = False
+
+        #: Random nodes added to complete the tree when it is finalized.
+        self.__padding = []
 
     def add_elem(self, element, email, leaf_infos: LeafInfos, quittance, file_infos):
         """Add a new element to the current tree
 
-        :param element: Hash to add the tree
-        :type element: str
+        :param element: SHA256 digest to add the tree
+        :type element: bytes
         :param email: Email of the user linked to the tree
         :type email: str
         :param file_data: All the data contained in the form submitted by the user
@@ -132,19 +341,171 @@ class TreeBuilder(metaclass=Singleton):
         :type file_infos: tuple(str,str,str,str,str)
         :return: Index of the newly added value in the tree
         :rtype: int
+        :raises ValueError: If the tree is already finalized
+        """
+        return self.add_elems([(element, email, leaf_infos, quittance, file_infos)])
+
+    def add_elems(self, elements):
+        """Add several elements to the current tree. The leaves are appended together and their parents are calculated level by level in one pass.
+
+        :param elements: Elements to add, each one being the parameters of add_elem : (element, email, leaf_infos, quittance, file_infos). The roots of sub-trees have no leaf_infos.
+        :type elements: List[Tuple[bytes, str, LeafInfos, str, tuple]]
+        :return: Index of the first added value in the tree
+        :rtype: int
+        :raises ValueError: If the tree is already finalized
         """
+        if self.__finalized:
+            raise ValueError("The tree is finalized, no element can be added to it.")
         n = self.__nb_elements
-        self.__parts[(0, n)] = element
-        self.__email_leaf_association[element] = (
-            email,
-            leaf_infos,
-            file_infos,
-            quittance,
-        )
-        self.__calc_tree()
-        self.__nb_elements += 1
+        self.__parts.extend(0, b"".join(elem[0] for elem in elements))
+        self.__add_records(elements)
+        self.__nb_elements += len(elements)
+        self.__nb_leaves += len(elements)
+        self.__calc_tree(0)
         return n
 
+    def __add_records(self, elements):
+        """Keep the user infos of the elements added, see add_elems.
+
+        :param elements: Elements added to the tree
+        :type elements: List[Tuple[bytes, str, LeafInfos, str, tuple]]
+        """
+        self.__leaf_records.extend(
+            [
+                (
+                    LeafRecord(leaf_infos, quittance, file_infos)
+                    if leaf_infos is not None
+                    else None
+                )
+                for _, _, leaf_infos, quittance, file_infos in elements
+            ]
+        )
+
+    def add_leaves(self, leaves):
+        """Add submitted leaves to the current tree and keep the people wanting update of the anchoring.
+
+        A leaf can also be a finalized sub-tree (TreeBuilder) : its root becomes the leaf and the receipts of its files contain both the sub-tree and the tree branches, see get_receipts.
+
+        :param leaves: Leaves to add, see TreeManager.submit_leaves
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+        :raises ValueError: If the tree is already finalized
+        """
+        n = self.__nb_leaves
+        self.add_elems(self.__get_elements(leaves))
+        self.__set_subtrees(n, leaves)
+
+    def __get_elements(self, leaves):
+        """Get the elements corresponding to submitted leaves, keeping the people wanting update of the anchoring.
+
+        :param leaves: Leaves to add, see TreeManager.submit_leaves
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+        :return: Elements to add, see add_elems
+        :rtype: List[Tuple[bytes, str, LeafInfos, str, tuple]]
+        :raises ValueError: If the tree is already finalized
+        """
+        if self.__finalized:
+            raise ValueError("The tree is finalized, no element can be added to it.")
+        elements = []
+        for leaf in leaves:
+            if isinstance(leaf, TreeBuilder):
+                self.want_ancrage_infos += leaf.want_ancrage_infos
+                elements.append((leaf.get_root(), None, None, None, None))
+            else:
+                element, leaf_infos, quittance, file_infos = leaf
+                elements.append(
+                    (element, leaf_infos.email_user, leaf_infos, quittance, file_infos)
+                )
+                if leaf_infos.want_ancrage_informations:
+                    self.add_mail_ancrage(
+                        leaf_infos.email_user,
+                        quittance,
+                        leaf_infos.case_number,
+                        leaf_infos.file_id,
+                        leaf_infos.language,
+                    )
+        return elements
+
+    def __set_subtrees(self, n, leaves):
+        """Keep the sub-trees among leaves added from the position n.
+
+        :param n: Position of the first leaf
+        :type n: int
+        :param leaves: Leaves added, see TreeManager.submit_leaves
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+        """
+        for position, leaf in enumerate(leaves, start=n):
+            if isinstance(leaf, TreeBuilder):
+                self.__leaf_records.set_subtree(position, leaf)
+
+    def restore(self, levels, leaves):
+        """Restore an empty tree from its levels, without calculating them again. Used to restore a tree from a checkpoint, see LeafLog.
+
+        :param levels: Levels of the tree, see get_levels
+        :type levels: List[bytes]
+        :param leaves: Leaves of the tree, in the order they were added. See TreeManager.submit_leaves
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+        :raises ValueError: If the tree is not empty or if the leaves are not the ones of the levels
+        """
+        if self.__nb_elements > 0:
+            raise ValueError("Only an empty tree can be restored.")
+        elements = self.__get_elements(leaves)
+        if len(levels) == 0 or b"".join(elem[0] for elem in elements) != levels[0]:
+            raise ValueError("The leaves don't match the levels of the tree.")
+        for level, nodes in enumerate(levels):
+            self.__parts.extend(level, nodes)
+        self.__add_records(elements)
+        self.__set_subtrees(0, leaves)
+        self.__nb_elements = len(elements)
+        self.__nb_leaves = len(elements)
+
+    def get_levels(self):
+        """Get a copy of all the levels of the tree.
+
+        :return: Raw digests of the nodes of each level, concatenated, starting with the leaves
+        :rtype: List[bytes]
+        """
+        return [
+            self.__parts.get_nodes(level, 0, self.__parts.level_size(level))
+            for level in range(self.__parts.get_nb_levels())
+        ]
+
+    def get_leaves(self):
+        """Iterate over the submitted leaves of the tree, in the format of TreeManager.submit_leaves.
+
+        :return: Iterator of the leaves of the tree, in the order they were added
+        :rtype: Iterator[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+        """
+        for n, record in enumerate(self.__leaf_records):
+            if isinstance(record, LeafRecord):
+                yield (
+                    self.__parts.get(0, n),
+                    record.get_leaf_infos(),
+                    record.quittance,
+                    record.get_file_infos(),
+                )
+            else:
+                yield record
+
+    def get_nb_records_in_memory(self):
+        """Get the number of records of the leaves kept in memory, see LeafRecordStore.
+
+        :return: Number of records
+        :rtype: int
+        """
+        return self.__leaf_records.get_nb_in_memory()
+
+    def spill_records(self, db=None):
+        """Move the records of the leaves kept in memory to disk, see LeafRecordStore.spill.
+
+        :param db: Database of the records of the tree containing this one, defaults to a new database
+        :type db: sqlite3.Connection, optional
+        """
+        self.__leaf_records.spill(db)
+
+    def release(self):
+        """Free the records of the leaves kept on disk, the ones of the sub-trees included, once the receipts are sent."""
+        self.__leaf_records.close()
+
     def add_mail_ancrage(self, mail, id_file, case_number, file_id, language):
         """Add the mail-filename association to the list of people wanting update
 
@@ -175,7 +536,7 @@ class TreeBuilder(metaclass=Singleton):
         while j > 0:
             if j % 2 == 1:
                 j = j - 1
-                vals.append((i, j, self.__parts[(i, j)]))
+                vals.append((i, j, self.__parts.get_hex(i, j)))
             j = j // 2
             i = i + 1
         return vals
@@ -187,21 +548,35 @@ class TreeBuilder(metaclass=Singleton):
         :type n: int
         :return: All the associated posterior branches
         :rtype: List[str]
-        :raises ValueError: If the tree has not 2^n number of elements
+        :raises ValueError: If the tree is not complete, see is_complete
         """
-        if is_power_of_2(self.__nb_elements):
+        if self.is_complete():
             vals = []
             j = n
-            for i in range(self.__get_tree_depth()):
-                if j % 2 == 0:
-                    j = j + 1
-                    vals.append((i, j, self.__parts[(i, j)]))
-                j = (j - 1) // 2
+            for i in range(self.get_tree_depth()):
+                # the last node of an odd level has no posterior branch, it is promoted.
+                if j % 2 == 0 and j + 1 < self.__parts.level_size(i):
+                    vals.append((i, j + 1, self.__parts.get_hex(i, j + 1)))
+                j = j // 2
 
             return vals
         else:
             raise ValueError(
-                "The tree has not 2^n number of elements, complete the tree before using this function."
+                "The tree is not complete, finalize the tree before using this function."
+            )
+
+    def get_all_branches(self):
+        """Get the anterior and posterior branches of all the leaves in one go.
+
+        :return: Branches of every leaf, see TreeBranches.get_branches
+        :rtype: TreeBranches
+        :raises ValueError: If the tree is not complete, see is_complete
+        """
+        if self.is_complete():
+            return TreeBranches(self.__parts, self.get_tree_depth(), self.__nb_leaves)
+        else:
+            raise ValueError(
+                "The tree is not complete, finalize the tree before using this function."
             )
 
     def get_nb_elems(self):
@@ -212,55 +587,145 @@ class TreeBuilder(metaclass=Singleton):
         """
         return self.__nb_elements
 
-    def __calc_tree(self):
-        """Update the tree with the new calculated leaves and subleaves."""
-        i = 0
-        j = self.__nb_elements
+    def __calc_tree(self, level):
+        """Update the tree with the new calculated leaves and subleaves.
 
-        while (j % 2) == 1:
-            self.__parts[(i + 1, (j - 1) // 2)] = hash_sha256(
-                [
-                    convert_hexstring_to_binary(self.__parts[(i, j - 1)]),
-                    convert_hexstring_to_binary(self.__parts[(i, j)]),
-                ]
-            )
-            j = (j - 1) // 2
+        Calculate all the parents of the complete pairs of nodes which don't have one yet, starting at level.
+
+        :param level: Lowest level where nodes have been added
+        :type level: int
+        """
+        i = level
+        while True:
+            first_parent = self.__parts.level_size(i + 1)
+            last_parent = self.__parts.level_size(i) // 2
+            if first_parent >= last_parent:
+                break
+            children = self.__parts.get_nodes(i, 2 * first_parent, 2 * last_parent)
+            self.__parts.extend(i + 1, LevelHasher().hash_level(children))
             i = i + 1
 
-    def __get_tree_depth(self):
-        """Get the depth of the tree
+    def get_tree_depth(self):
+        """Get the depth of the tree, the number of levels above the leaves once the tree is complete.
 
         :return: Depth of the tree
         :rtype: int
         """
-        depth = 0
-        j = self.__nb_elements
-        # on compte le nombre de décalage de bits pour obtenir la profondeur.
-        while j > 1:
-            depth += 1
-            j = j >> 1  # on decale tous les bits de j vers la droite (ex: 1000 -> 0100)
-        return depth
+        # number of bits of the highest index, log2 of the number of elements rounded up.
+        return max(self.__nb_elements - 1, 0).bit_length()
 
-    def finalize_tree(self):
-        """Finalize the tree. Make sure that the tree has 2^n number of elements by completing the missing leaves with random values."""
-        tree_final_size = find_next_power_of_2(self.__nb_elements)
-        for _ in range(self.__nb_elements, tree_final_size):
-            self.add_elem(str(binascii.b2a_hex(os.urandom(32))), None, None, None, None)
+    def is_complete(self):
+        """Check if the root and the branches of the tree can be calculated : the tree has 2^n elements, or it is a finalized tree of version 3 or more.
+
+        :return: True if the tree is complete
+        :rtype: bool
+        """
+        if is_power_of_2(self.__nb_elements):
+            return True
+        return self.version >= 3 and self.__finalized and self.__nb_elements > 0
+
+    def finalize_tree(self, padding=None):
+        """Finalize the tree, no element can be added to it anymore.
+
+        Up to version 2, make sure that the tree has 2^n number of elements by completing the missing leaves with random values.
+        Instead of adding random leaves one by one, each missing subtree is replaced by a single random node placed at the highest level possible.
+        For example, a tree of 5 leaves is completed by a random leaf (level 0) and a random node at level 1, which stands for the leaves 6 and 7.
+        The branches of the real leaves are computed as usual, those random nodes being seen as any other node of the tree.
+
+        Since version 3, the tree is not completed : the last node of each odd level is promoted to the next level as it is, which gives the same root as RFC 6962 (without its prefixes).
+        For example, with 5 leaves the leaf 4 is promoted up to level 2 and the root is SHA256(node (2, 0) + leaf 4). The promoted nodes have no sibling, so no branch, at the levels they skip.
+
+        :param padding: Random nodes to use, to finalize again a tree already finalized once (see get_padding), defaults to None
+        :type padding: List[bytes], optional
+        :raises ValueError: If the padding given does not complete the tree
+        """
+        self.__finalized = True
+        if self.version >= 3:
+            if padding:
+                raise ValueError("A tree of version 3 has no padding.")
+            level = 0
+            while self.__parts.level_size(level) > 1:
+                size = self.__parts.level_size(level)
+                if size % 2 == 1:
+                    self.__parts.append(level + 1, self.__parts.get(level, size - 1))
+                    self.__calc_tree(level + 1)
+                level += 1
+            return
+        padding = iter(padding) if padding is not None else None
+        while self.__nb_elements > 0 and not is_power_of_2(self.__nb_elements):
+            # the lowest bit set gives the size of the biggest subtree that can be completed at once.
+            level = (self.__nb_elements & -self.__nb_elements).bit_length() - 1
+            if padding is None:
+                node = os.urandom(DIGEST_SIZE)
+            else:
+                node = next(padding, None)
+                if node is None:
+                    raise ValueError("The padding does not complete the tree.")
+            self.__padding.append(node)
+            self.__parts.append(level, node)
+            self.__calc_tree(level)
+            self.__nb_elements += 1 << level
+
+    def get_padding(self):
+        """Get the random nodes completing the tree, see finalize_tree.
+
+        :return: Random nodes, in the order they were added
+        :rtype: List[bytes]
+        """
+        return list(self.__padding)
 
     def get_root(self):
         """Get the root of the current merkle based tree.
 
-        :raises ValueError: If the tree has not 2^n number of elements
-        :return: Value of the root
-        :rtype: str
+        :raises ValueError: If the tree is not complete, see is_complete
+        :return: Digest of the root
+        :rtype: bytes
         """
-        if is_power_of_2(self.__nb_elements):
-            return self.__parts[(self.__get_tree_depth(), 0)]
+        if self.is_complete():
+            return self.__parts.get(self.get_tree_depth(), 0)
         else:
             raise ValueError(
-                "The tree has not 2^n number of elements, complete the tree before using this function."
+                "The tree is not complete, finalize the tree before using this function."
             )
 
+    def get_receipts(self):
+        """Iterate over all the submitted files of the tree with their branches.
+
+        The files of a sub-tree get the branches of the sub-tree followed by the branches of the tree, whose levels are shifted by the depth of the sub-tree.
+        Those branches are the ones of the file in a single tree where the sub-tree would replace its root, so the sub-tree indexes are shifted too and the usual calculation of the root applies.
+
+        :return: Iterator of (record, anterior branches, posterior branches)
+        :rtype: Iterator[Tuple[LeafRecord, List, List]]
+        :raises ValueError: If the tree is not complete, see is_complete
+        """
+        branches = self.get_all_branches()
+        # the random nodes completing the tree are placed after the submitted leaves, they have no receipt.
+        for n, (record, (anterior_branches, posterior_branches)) in enumerate(
+            zip(self.__leaf_records, branches)
+        ):
+            if isinstance(record, TreeBuilder):
+                subtree = record
+                depth = subtree.get_tree_depth()
+                anterior_branches = [(l + depth, i, h) for l, i, h in anterior_branches]
+                posterior_branches = [
+                    (l + depth, i, h) for l, i, h in posterior_branches
+                ]
+                for sub_record, sub_anterior, sub_posterior in subtree.get_receipts():
+                    # the sub-tree nodes of level l are shifted by the n sub-trees of 2^(depth-l) nodes on their left.
+                    sub_anterior = [
+                        (l, i + (n << depth - l), h) for l, i, h in sub_anterior
+                    ]
+                    sub_posterior = [
+                        (l, i + (n << depth - l), h) for l, i, h in sub_posterior
+                    ]
+                    yield (
+                        sub_record,
+                        sub_anterior + anterior_branches,
+                        sub_posterior + posterior_branches,
+                    )
+            elif record is not None:
+                yield record, anterior_branches, posterior_branches
+
     def send_pdfs(self, time2, lid):
         """Create and send the pdf quittance to all the users related to the tree.
 
@@ -270,48 +735,37 @@ class TreeBuilder(metaclass=Singleton):
         :type time2: str
         :param lid: LID generated for all the pdf of this tree
         :type lid: str
-        :raises ValueError: If the tree has not 2^n number of elements
+        :raises ValueError: If the tree is not complete, see is_complete
         """
-        if is_power_of_2(self.__nb_elements):
-            for n in range(self.__nb_elements):
-                leaf = self.__parts[(0, n)]
-                anterior_branches = self.get_anterior_branches(n)
-                posterior_branches = self.get_posterior_branches(n)
-                infos_tree = self.__email_leaf_association[leaf]
-                email = infos_tree[0]
-                if email == None:  # if randomly completed, there is no email
-                    continue
-                file_data = infos_tree[2]
-                leaf_infos = infos_tree[1]
-                quittance = infos_tree[3]
+        if self.is_complete():
+            for record, anterior_branches, posterior_branches in self.get_receipts():
                 lang = gettext.translation(
-                    "tree", localedir="locales", languages=[leaf_infos.language]
+                    "tree", localedir="locales", languages=[record.language]
                 )
                 lang.install()
                 _ = lang.gettext
                 pdf_filename = _("Registre_Quittance_{}_{}.pdf").format(
-                    file_data[1], quittance
+                    record.date_filename, record.quittance
                 )
                 qr_code, qr_name = create_qr(
-                    file_data[2],
-                    file_data[3],
-                    file_data[0],
-                    file_data[1],
+                    record.md5_value,
+                    record.sha256_value,
+                    record.salt,
+                    record.date_filename,
                     anterior_branches,
                     posterior_branches,
+                    self.version,
                 )
                 pdf_builder = PdfCreator(
-                    file_name=quittance,
-                    language=leaf_infos.language,
-                    password=leaf_infos.password,
+                    file_name=record.quittance,
+                    language=record.language,
+                    password=record.password,
                 )
                 pdf_builder.add_title(_("QUITTANCE DE L'HORODATAGE AVEC CODE QR"))
                 pdf_builder.add_qr_code(qr_name, qr_code.data)
                 pdf_builder.add_category(_("Informations sur le fichier horodaté :"))
-                pdf_builder.add_horodatage_trace(file_data[4])
-                pdf_builder.add_empreintes_trace(
-                    leaf_infos.md5_value, leaf_infos.sha256_value
-                )
+                pdf_builder.add_horodatage_trace(record.date_readable)
+                pdf_builder.add_empreintes_trace(record.md5_value, record.sha256_value)
                 pdf_builder.add_information_rect(
                     _(
                         "Lors d’une vérification, assurez-vous que la date et les empreintes numériques du fichier correspondent à celles qui sont imprimées ci-dessus."
@@ -320,10 +774,10 @@ class TreeBuilder(metaclass=Singleton):
 
                 pdf_builder.add_category(_("Informations générales :"))
                 pdf_builder.add_informations_trace(
-                    leaf_infos.case_number,
-                    leaf_infos.file_id,
-                    leaf_infos.investigator,
-                    leaf_infos.comments,
+                    record.case_number,
+                    record.file_id,
+                    record.investigator,
+                    record.comments,
                 )
 
                 pdf_builder.add_category(_("Enregistrement dans la blockchain :"))
@@ -340,10 +794,10 @@ class TreeBuilder(metaclass=Singleton):
                     _(
                         "Les informations techniques suivantes permettent de retrouver cet horodatage dans la blockchain soit manuellement, soit via la programmation d’un autre système de vérification indépendant."
                     ),
-                    file_data[0],
+                    record.salt,
                     anterior_branches,
                     posterior_branches,
-                    ACTUAL_VERSION,
+                    self.version,
                 )
                 pdf_builder.add_information_rect(
                     _(
@@ -352,121 +806,686 @@ class TreeBuilder(metaclass=Singleton):
                 )
                 pdf = pdf_builder.build_pdf()
 
-                subject = _("Votre quittance pour le fichier {}").format(
-                    leaf_infos.file_id
-                )
+                subject = _("Votre quittance pour le fichier {}").format(record.file_id)
                 message = _(
                     "Bonjour, vous trouverez en pièce-jointe le pdf correspondant à l'horodatage de votre fichier ayant pour identifiant {}, appartenant au cas {} et fait le {}.\nLe système de vérification peut mettre jusqu'à 5 min pour retrouver votre quittance.\n Nous vous remercions de votre confiance.\n\n L'équipe Horodatage ESC.\n Cet email est envoyé automatiquement, merci de ne pas y répondre."
-                ).format(leaf_infos.file_id, leaf_infos.case_number, file_data[4])
+                ).format(record.file_id, record.case_number, record.date_readable)
 
-                recipient = email
+                recipient = record.email_user
                 email_message = EmailMessage(subject, message, EMAIL_ADMIN, recipient)
                 email_message.attach(filename=pdf_filename, content=pdf.read())
                 email_message.send()
         else:
             raise ValueError(
-                "The tree has not 2^n number of elements, complete the tree before using this function."
+                "The tree is not complete, finalize the tree before using this function."
+            )
+
+    def __str__(self):
+        """Used to print the tree in the console
+
+        :return: Constructed string of the tree
+        :rtype: str
+        """
+        build_str = ""
+        for level, index, digest in self.__parts:
+            if level == 0:
+                build_str += f"{index} = {digest.hex()}\n"
+            else:
+                build_str += f"{(level, index)} = {digest.hex()}\n"
+        return build_str
+
+
+def is_express_leaf(leaf):
+    """Check if a submitted leaf, or one of the files of a sub-tree, is in the express lane.
+
+    :param leaf: Leaf, see TreeManager.submit_leaves
+    :type leaf: Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder
+    :return: True if the leaf asks for an early close of the tree
+    :rtype: bool
+    """
+    if isinstance(leaf, TreeBuilder):
+        return any(is_express_leaf(subtree_leaf) for subtree_leaf in leaf.get_leaves())
+    return leaf is not None and leaf[1].express
+
+
+def leaf_to_json(leaf):
+    """Convert a submitted leaf to a JSON serializable value.
+
+    :param leaf: Leaf, see TreeManager.submit_leaves
+    :type leaf: Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder
+    :return: Leaf as a dict
+    :rtype: Dict
+    """
+    if isinstance(leaf, TreeBuilder):
+        return {
+            "subtree": [
+                leaf_to_json(subtree_leaf) for subtree_leaf in leaf.get_leaves()
+            ],
+            "padding": [node.hex() for node in leaf.get_padding()],
+            "version": leaf.version,
+        }
+    element, leaf_infos, quittance, file_infos = leaf
+    return {
+        "leaf": element.hex(),
+        "infos": leaf_infos.dict(),
+        "quittance": quittance,
+        "file": list(file_infos),
+    }
+
+
+def leaf_from_json(value):
+    """Convert back a leaf converted by leaf_to_json. A sub-tree is built and finalized again.
+
+    :param value: Leaf as a dict
+    :type value: Dict
+    :return: Leaf, see TreeManager.submit_leaves
+    :rtype: Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder
+    """
+    if "subtree" in value:
+        # the sub-trees logged before the version 3 were completed with random nodes.
+        subtree = TreeBuilder(value.get("version", 2))
+        subtree.add_leaves([leaf_from_json(leaf) for leaf in value["subtree"]])
+        subtree.finalize_tree([bytes.fromhex(node) for node in value["padding"]])
+        return subtree
+    return (
+        bytes.fromhex(value["leaf"]),
+        LeafInfos(**value["infos"]),
+        value["quittance"],
+        tuple(value["file"]),
+    )
+
+
+def encode_leaf(leaf):
+    """Encode a submitted leaf as the payload of a record of the LeafLog.
+
+    :param leaf: Leaf, see TreeManager.submit_leaves
+    :type leaf: Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder
+    :return: Payload
+    :rtype: bytes
+    """
+    return json.dumps(leaf_to_json(leaf)).encode("utf-8")
+
+
+def decode_leaf(payload):
+    """Decode the payload of a record of the LeafLog.
+
+    :param payload: Payload, see encode_leaf
+    :type payload: bytes
+    :return: Leaf, see TreeManager.submit_leaves
+    :rtype: Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder
+    """
+    return leaf_from_json(json.loads(payload))
+
+
+class TreeManager(metaclass=Singleton):
+    """Hold the tree currently receiving the leaves. This class must be a Singleton to work correctly.
+
+    When a tree is closed, it is swapped with a fresh TreeBuilder under the tree_mutex, so the new leaves go to the new tree right away while the closed one is finalized, anchored and sent without any lock.
+    Each tree has a LeafLog in :ref:`TREE_LOG_DIR <constants>` where its leaves are written before being added to it. The log is removed once the receipts of the tree are sent, the leaves of the logs left by a crash are added to the tree at startup.
+    """
+
+    def __init__(self) -> None:
+        """
+        Class initialisation. Will start another thread for the Transaction Verifier.
+        """
+        self.transaction_verifier = TransactionVerifier()
+        self.transaction_verifier.daemon = True
+        self.transaction_verifier.start()
+
+        os.makedirs(TREE_LOG_DIR, exist_ok=True)
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        #: Tree receiving the new leaves and its log
+        self.__tree, self.__log = self.__restore_tree()
+        #: Monotonic time at which the current tree received its first leaf and sum of the times at which its leaves were added, to know how long they waited. The restored leaves are counted from the startup.
+        self.__first_leaf_time = monotonic()
+        self.__leaf_times_sum = self.__first_leaf_time * self.__tree.get_nb_elems()
+        #: Monotonic time at which the current tree received its first express leaf, None if it has none. The restored express leaves are counted from the startup, so they still close the tree early.
+        self.__first_express_time = (
+            self.__first_leaf_time
+            if any(is_express_leaf(leaf) for leaf in self.__tree.get_leaves())
+            else None
+        )
+
+        #: Logs of the closed trees whose receipts are not sent yet. closed_logs[tree] = LeafLog
+        self.__closed_logs = {}
+        #: Times of the closed trees whose receipts are not sent yet, to know how long their leaves waited for their receipts. closed_times[tree] = (first leaf time, first express leaf time)
+        self.__closed_times = {}
+
+        #: Leaves submitted and not yet added to the tree, can be filled by any thread.
+        self.leaf_queue = queue.Queue(maxsize=LEAF_QUEUE_MAX_SIZE)
+
+        self.leaf_writer = LeafWriter(self)
+        self.leaf_writer.daemon = True
+        self.leaf_writer.start()
+
+    def __restore_tree(self):
+        """Restore the tree from the logs left in :ref:`TREE_LOG_DIR <constants>`.
+
+        The most recent log is the one of the tree receiving the leaves : the tree is restored from its checkpoint and the following records in a single pass over the log. The leaves that are not covered by the checkpoint are added at once, so the levels of a tree restored without checkpoint are hashed by the LevelHasher pool.
+        The older logs are the ones of closed trees whose receipts were not sent, their leaves are added to the restored tree and written to its log.
+
+        :return: The tree receiving the leaves and its log, opened
+        :rtype: TreeBuilder, LeafLog
+        """
+        generations = LeafLog.get_generations(TREE_LOG_DIR)
+        tree = TreeBuilder()
+        if len(generations) == 0:
+            log = LeafLog(TREE_LOG_DIR, 0)
+            log.open()
+            return tree, log
+
+        log = LeafLog(TREE_LOG_DIR, generations[-1])
+        try:
+            checkpoint_size, levels = log.read_checkpoint()
+        except ValueError as e:
+            logger.error(f"{e} The tree is restored from its log only.")
+            checkpoint_size, levels = 0, None
+        checkpoint_leaves = []
+        leaves = []
+        for size, payload in log.read_records():
+            leaf = decode_leaf(payload)
+            if levels is not None:
+                if size < checkpoint_size:
+                    checkpoint_leaves.append(leaf)
+                    continue
+                if size == checkpoint_size:
+                    checkpoint_leaves.append(leaf)
+                tree = self.__restore_checkpoint(
+                    levels, checkpoint_leaves, size == checkpoint_size
+                )
+                levels = None
+                if size == checkpoint_size:
+                    continue
+            leaves.append(leaf)
+        if levels is not None:
+            # the log ends before the checkpoint
+            tree = self.__restore_checkpoint(levels, checkpoint_leaves, False)
+        # all the leaves at once : each level is hashed in one go, with the LevelHasher pool if it is big enough.
+        tree.add_leaves(leaves)
+        log.open()
+
+        for generation in generations[:-1]:
+            closed_log = LeafLog(TREE_LOG_DIR, generation)
+            payloads = [payload for _, payload in closed_log.read_records()]
+            log.append(payloads)
+            tree.add_leaves([decode_leaf(payload) for payload in payloads])
+            closed_log.remove()
+        logger.warning(f"Tree restored with {tree.get_nb_elems()} leaves.")
+        return tree, log
+
+    def __restore_checkpoint(self, levels, leaves, covered):
+        """Restore a tree from the checkpoint of its log, or from its leaves alone if the checkpoint is not the one of the log.
+
+        The checkpoint is only used if a record of the log ends where the checkpoint does and if the leaves of those records are the ones of its first level. Otherwise the log was cut before the checkpoint, by a torn tail, or written again, and the levels are calculated from the leaves.
+
+        :param levels: Levels of the checkpoint, see LeafLog.read_checkpoint
+        :type levels: List[bytes]
+        :param leaves: Leaves of the records covered by the checkpoint
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple] or TreeBuilder]
+        :param covered: True if a record of the log ends where the checkpoint does
+        :type covered: bool
+        :return: The tree holding the leaves
+        :rtype: TreeBuilder
+        """
+        tree = TreeBuilder()
+        if covered:
+            try:
+                tree.restore(levels, leaves)
+                return tree
+            except ValueError as e:
+                logger.error(f"{e} The tree is restored from its log only.")
+        else:
+            logger.error(
+                "The log ends before its checkpoint. The tree is restored from its log only."
             )
+        tree.add_leaves(leaves)
+        return tree
+
+    def submit_leaves(self, leaves):
+        """Submit new leaves. They are only queued, the leaf writer writes them to the log and adds them to the current tree. Leaves submitted together are always added together.
+
+        If :ref:`LEAF_QUEUE_MAX_SIZE <constants>` submissions are already waiting, blocks until the leaf writer frees some space.
+
+        :param leaves: Leaves to add, each one being (element, leaf_infos, quittance, file_infos) with element the SHA256 digest to add to the tree, leaf_infos the data submitted by the user, quittance the quittance ramdomly generated and file_infos the different file information used to calculate the hash of the added data. A leaf can also be a finalized sub-tree, see TreeBuilder.add_leaves
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple(str,str,str,str,str)] or TreeBuilder]
+        :return: Future done once the leaves are written to the log and added to the tree. Its exception is set if they could not be.
+        :rtype: concurrent.futures.Future
+        """
+        written = Future()
+        self.leaf_queue.put((leaves, written))
+        return written
+
+    def add_leaves(self, leaves):
+        """Write a batch of leaves to the log, with a single fsync, and add them to the current tree. Should only be called by the leaf writer.
+
+        Every :ref:`TREE_CHECKPOINT_INTERVAL <constants>` leaves, the levels of the tree are saved in the checkpoint of the log.
+
+        :param leaves: Leaves to add, see submit_leaves
+        :type leaves: List[Tuple[bytes, LeafInfos, str, tuple]]
+        :raises OSError: If the leaves could not be written to the log, they are not added to the tree.
+        """
+        payloads = [encode_leaf(leaf) for leaf in leaves]
+        express = any(is_express_leaf(leaf) for leaf in leaves)
+        tree_mutex.acquire()
+        try:
+            self.__log.append(payloads)
+            now = monotonic()
+            if self.__tree.get_nb_elems() == 0:
+                self.__first_leaf_time = now
+            if express and self.__first_express_time is None:
+                self.__first_express_time = now
+            self.__tree.add_leaves(leaves)
+            self.__leaf_times_sum += now * len(leaves)
+            if self.__log.nb_records_since_checkpoint >= TREE_CHECKPOINT_INTERVAL:
+                self.__log.write_checkpoint(self.__tree.get_levels())
+        finally:
+            tree_mutex.release()
+
+    def get_nb_elems(self):
+        """Get the number of elements in the current tree.
+
+        :return: Number of elements in the tree
+        :rtype: int
+        """
+        return self.__tree.get_nb_elems()
+
+    def get_oldest_leaf_age(self):
+        """Get the time for which the oldest leaf of the current tree has been waiting.
+
+        :return: Age in seconds, 0 if the tree is empty
+        :rtype: float
+        """
+        first_leaf_time = self.__first_leaf_time
+        if first_leaf_time is None or self.__tree.get_nb_elems() == 0:
+            return 0
+        return monotonic() - first_leaf_time
+
+    def has_express_leaves(self):
+        """Check if the current tree has leaves submitted in the express lane.
+
+        :return: True if an express leaf waits for the close of the tree
+        :rtype: bool
+        """
+        return self.__first_express_time is not None
+
+    def rotate_tree(self):
+        """Replace the current tree by an empty one, with a new log. The lock is only held during the swap.
+
+        The size of the closed tree and the time its leaves waited for the close are observed in the Metrics : tree_size, leaf_max_wait, leaf_mean_wait and express_leaf_wait for the trees with express leaves.
+
+        :return: The previous tree, which does not receive leaves anymore. release_tree must be called once its receipts are sent.
+        :rtype: TreeBuilder
+        """
+        new_tree = TreeBuilder()
+        new_log = LeafLog(TREE_LOG_DIR, self.__log.generation + 1)
+        new_log.open()
+        tree_mutex.acquire()
+        try:
+            closed_tree, self.__tree = self.__tree, new_tree
+            closed_log, self.__log = self.__log, new_log
+            first_leaf_time, self.__first_leaf_time = self.__first_leaf_time, None
+            leaf_times_sum, self.__leaf_times_sum = self.__leaf_times_sum, 0
+            first_express_time, self.__first_express_time = (
+                self.__first_express_time,
+                None,
+            )
+        finally:
+            tree_mutex.release()
+        closed_log.close()
+        self.__closed_logs[closed_tree] = closed_log
+        nb_elems = closed_tree.get_nb_elems()
+        if nb_elems > 0:
+            now = monotonic()
+            Metrics().observe("tree_size", nb_elems)
+            Metrics().observe("leaf_max_wait", now - first_leaf_time)
+            Metrics().observe("leaf_mean_wait", now - leaf_times_sum / nb_elems)
+            if first_express_time is not None:
+                Metrics().observe("express_leaf_wait", now - first_express_time)
+            self.__closed_times[closed_tree] = (first_leaf_time, first_express_time)
+        return closed_tree
+
+    def archive_tree(self, tree, closing_time, lid):
+        """Write a finalized tree to its archive in :ref:`ARCHIVE_DIR <constants>` and register its quittances, so the proofs of its files can be found again, see TreeArchive.
+
+        :param tree: Finalized tree
+        :type tree: TreeBuilder
+        :param closing_time: Time of closure of the tree
+        :type closing_time: str
+        :param lid: LID of the pdfs of the tree
+        :type lid: str
+        :return: Filename of the archive
+        :rtype: str
+        """
+        root = tree.get_root()
+        filename = f"tree_{root.hex()}.archive"
+        quittances = TreeArchive.write(
+            os.path.join(ARCHIVE_DIR, filename),
+            tree,
+            {
+                "closing_time": closing_time,
+                "lid": lid,
+                "version": tree.version,
+                "root": root.hex(),
+            },
+        )
+        db = SessionLocal()
+        try:
+            add_archived_quittances(db, quittances, filename)
+        finally:
+            db.close()
+        return filename
+
+    def release_tree(self, tree):
+        """Remove the log of a closed tree whose receipts are sent and free its records.
+
+        The time the leaves of the tree waited for their receipts is observed in the Metrics : receipt_max_latency, and express_receipt_latency for the trees with express leaves.
+
+        :param tree: Tree returned by rotate_tree
+        :type tree: TreeBuilder
+        """
+        self.__closed_logs.pop(tree).remove()
+        tree.release()
+        first_leaf_time, first_express_time = self.__closed_times.pop(
+            tree, (None, None)
+        )
+        now = monotonic()
+        if first_leaf_time is not None:
+            Metrics().observe("receipt_max_latency", now - first_leaf_time)
+        if first_express_time is not None:
+            Metrics().observe("express_receipt_latency", now - first_express_time)
+
+    def requeue_tree(self, tree):
+        """Add the leaves of a closed tree whose root could not be sent back to the current tree, so they are sent with it, and free the closed tree.
+
+        As for the logs of the closed trees found at startup, the leaves are written to the log of the current tree before the log of the closed tree is removed. They keep the time they were first added, so the tree is closed for them as soon as possible.
+
+        :param tree: Tree returned by rotate_tree
+        :type tree: TreeBuilder
+        :raises OSError: If the leaves could not be written to the log of the current tree, the log of the closed tree is kept and they are restored at startup.
+        """
+        closed_log = self.__closed_logs[tree]
+        payloads = [payload for _, payload in closed_log.read_records()]
+        leaves = [decode_leaf(payload) for payload in payloads]
+        first_leaf_time, first_express_time = self.__closed_times.get(
+            tree, (monotonic(), None)
+        )
+        tree_mutex.acquire()
+        try:
+            self.__log.append(payloads)
+            if self.__tree.get_nb_elems() == 0:
+                self.__first_leaf_time = first_leaf_time
+            else:
+                self.__first_leaf_time = min(self.__first_leaf_time, first_leaf_time)
+            if first_express_time is not None:
+                if self.__first_express_time is None:
+                    self.__first_express_time = first_express_time
+                else:
+                    self.__first_express_time = min(
+                        self.__first_express_time, first_express_time
+                    )
+            self.__tree.add_leaves(leaves)
+            self.__leaf_times_sum += first_leaf_time * len(leaves)
+            if self.__log.nb_records_since_checkpoint >= TREE_CHECKPOINT_INTERVAL:
+                self.__log.write_checkpoint(self.__tree.get_levels())
+        finally:
+            tree_mutex.release()
+        del self.__closed_logs[tree]
+        self.__closed_times.pop(tree, None)
+        closed_log.remove()
+        tree.release()
+        logger.warning(f"{len(leaves)} leaves added back to the current tree.")
 
-    def send_root_to_chain(self, root_value):
-        """Send the current tree root to the smartcontract
+    def send_root_to_chain(self, root_value, want_ancrage_infos):
+        """Send a tree root to the smartcontract
 
         :param root_value: root of the tree
         :type root_value: str
+        :param want_ancrage_infos: People of the tree wanting update of the verification and validation of the transaction, see TreeBuilder.want_ancrage_infos
+        :type want_ancrage_infos: List[Tuple[str,str,str,str,str]]
         """
         blockchain_publique = Eth()
         self.hash_transaction = blockchain_publique.send_new_value(root_value)
         self.transaction_verifier.mutex.acquire()
         try:
             self.transaction_verifier.add_transaction(
-                self.hash_transaction, self.want_ancrage_infos
+                self.hash_transaction, want_ancrage_infos
             )
         finally:
             self.transaction_verifier.mutex.release()
 
-    def __str__(self):
-        """Used to print the tree in the console
 
-        :return: Constructed string of the tree
-        :rtype: str
+class LeafWriter(Thread):
+    """Thread class running in background, the only one adding leaves to the tree.
+
+    It waits for submitted leaves in the queue of the TreeManager and adds them by batches of at most :ref:`LEAF_WRITER_MAX_BATCH <constants>` leaves, unless a single submission is bigger.
+    Once a first submission is received, the writer waits at most :ref:`LEAF_WRITER_FLUSH_INTERVAL <constants>` seconds for the others.
+    All the submissions of a batch are written to the log with a single fsync before being acknowledged.
+    """
+
+    def __init__(self, manager):
+        super(LeafWriter, self).__init__()
+        self.manager = manager
+
+    def get_batch(self):
+        """Wait for the next batch of leaves.
+
+        :return: Leaves to add to the tree and the futures of their submissions
+        :rtype: List[Tuple[bytes, LeafInfos, str, tuple]], List[concurrent.futures.Future]
         """
-        keys = self.__parts.keys()
-        build_str = ""
-        for k in keys:
-            if k[0] == 0:
-                build_str += f"{k[1]} = {self.__parts[k]}\n"
+        leaves, written = self.manager.leaf_queue.get()
+        batch = list(leaves)
+        futures = [written]
+        flush_time = monotonic() + LEAF_WRITER_FLUSH_INTERVAL
+        while len(batch) < LEAF_WRITER_MAX_BATCH:
+            timeout = flush_time - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                leaves, written = self.manager.leaf_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch += leaves
+            futures.append(written)
+        return batch, futures
+
+    def run(self):
+        while True:
+            batch, futures = self.get_batch()
+            try:
+                self.manager.add_leaves(batch)
+            except Exception as e:
+                logger.critical(
+                    f"{len(batch)} leaves could not be added to the tree : {e}"
+                )
+                for written in futures:
+                    written.set_exception(e)
             else:
-                build_str += f"{k} = {self.__parts[k]}\n"
-        return build_str
+                for written in futures:
+                    written.set_result(len(batch))
 
 
 class SendTree(Thread):
-    """Thread class running in background used to close the current tree and create a new one every x minutes depending on the time of day and a database value."""
+    """Thread class running in background used to close the current tree, send it to the smart contract and send its receipts.
+
+    A tree is closed on whichever comes first :
+
+    * its maximum age, the day, night or weekend config of the database in minutes. The closes are aligned to the wall clock, with 10 minutes the trees are closed at :00, :10, :20...
+    * :ref:`TREE_CLOSE_MAX_LEAVES <constants>` leaves,
+    * its oldest leaf about to wait more than :ref:`TREE_CLOSE_TARGET_LATENCY <constants>` seconds for its receipt, the time to send the receipts being the mean of the previous trees. Only when the target is set and below the maximum age.
+    * an express leaf, at most :ref:`EXPRESS_CLOSES_PER_HOUR <constants>` times per hour. Past this limit, the express leaves wait for the other conditions.
+    """
+
+    def __init__(self) -> None:
+        super(SendTree, self).__init__()
+        #: Times of the express closes of the last hour, oldest first
+        self.__express_closes = deque()
+        #: Maximum age of the trees and timestamp of the next close for it, set at the first check
+        self.__period = None
+        self.__next_close = None
 
     def run(self):
-        """Run class where the tree is stored. The tree is then finalized and send to the smart contract."""
-        tree = TreeBuilder()
-        SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        """Check every :ref:`TREE_SCHEDULER_POLL_INTERVAL <constants>` seconds if the tree has to be closed, and close it."""
+        manager = TreeManager()
         while True:
-            today = datetime.datetime.today()
-            dayoftheweek = today.weekday()
-            if dayoftheweek < 5:  # mon-fri
-                if (
-                    today.hour < START_WORKING_DAY and today.hour > END_WORKING_DAY
-                ):  # at night
-                    sleep(int(get_config(SessionLocal(), "night_config").value) * 60)
-                else:
-                    sleep(int(get_config(SessionLocal(), "day_config").value) * 60)
-            else:  # weekend
-                sleep(int(get_config(SessionLocal(), "weekend_config").value) * 60)
+            sleep(TREE_SCHEDULER_POLL_INTERVAL)
+            now = time()
+            reason = self.get_close_reason(manager, now)
+            if reason is None or manager.get_nb_elems() == 0:
+                continue
             if deactivate_horodating.is_set():
-                print("can't send tree for now...")
+                if reason == "max_age":
+                    print("can't send tree for now...")
                 continue
-            tree_mutex.acquire()
+            if reason == "express":
+                self.__express_closes.append(now)
+            Metrics().increment(f"trees_closed_{reason}")
+            self.close_tree(manager)
+
+    def get_close_reason(self, manager, now):
+        """Get the condition closing the tree now, see SendTree. The maximum age is checked first, so the closes stay aligned to the wall clock.
+
+        :param manager: Manager of the tree
+        :type manager: TreeManager
+        :param now: Current timestamp
+        :type now: float
+        :return: "max_age", "max_leaves", "express", "target_latency", or None if the tree does not have to be closed
+        :rtype: str
+        """
+        if self.__next_close is None or now >= self.__next_close:
+            first_check = self.__next_close is None
+            self.__period = self.get_close_period()
+            self.__next_close = self.get_next_close(now, self.__period)
+            if not first_check:
+                return "max_age"
+        if manager.get_nb_elems() >= TREE_CLOSE_MAX_LEAVES:
+            return "max_leaves"
+        if manager.has_express_leaves() and self.can_close_express(now):
+            return "express"
+        if self.is_target_latency_reached(manager, self.__period):
+            return "target_latency"
+        return None
+
+    def is_target_latency_reached(self, manager, period):
+        """Check if the oldest leaf of the tree is about to wait more than :ref:`TREE_CLOSE_TARGET_LATENCY <constants>` seconds for its receipt, the time to send the receipts being the mean of the previous trees.
+
+        The target is off when it is None. It is ignored when it is not below the maximum age of the trees, so the longer night and weekend trees are kept.
+
+        :param manager: Manager of the tree
+        :type manager: TreeManager
+        :param period: Maximum age of the trees, in seconds
+        :type period: int
+        :return: True if the tree has to be closed for its oldest leaf
+        :rtype: bool
+        """
+        if TREE_CLOSE_TARGET_LATENCY is None or TREE_CLOSE_TARGET_LATENCY >= period:
+            return False
+        return (
+            manager.get_oldest_leaf_age() + self.get_expected_send_duration()
+            >= TREE_CLOSE_TARGET_LATENCY
+        )
+
+    def can_close_express(self, now):
+        """Check if an express close is allowed, less than :ref:`EXPRESS_CLOSES_PER_HOUR <constants>` express closes being done in the last hour.
+
+        :param now: Current timestamp
+        :type now: float
+        :return: True if the tree can be closed for an express leaf
+        :rtype: bool
+        """
+        while self.__express_closes and self.__express_closes[0] <= now - 3600:
+            self.__express_closes.popleft()
+        return len(self.__express_closes) < EXPRESS_CLOSES_PER_HOUR
+
+    @staticmethod
+    def get_close_period():
+        """Get the maximum age of the trees at the current time, from the config of the database.
+
+        :return: Maximum age in seconds
+        :rtype: int
+        """
+        today = datetime.datetime.today()
+        if today.weekday() >= 5:
+            config_name = "weekend_config"
+        elif today.hour < START_WORKING_DAY or today.hour >= END_WORKING_DAY:
+            config_name = "night_config"
+        else:
+            config_name = "day_config"
+        db = SessionLocal()
+        try:
+            return int(get_config(db, config_name).value) * 60
+        finally:
+            db.close()
+
+    @staticmethod
+    def get_next_close(now, period):
+        """Get the next close time aligned to the wall clock : the next multiple of the period.
+
+        :param now: Current timestamp
+        :type now: float
+        :param period: Maximum age of the trees, in seconds
+        :type period: int
+        :return: Timestamp of the next close
+        :rtype: float
+        """
+        return (now // period + 1) * period
+
+    @staticmethod
+    def get_expected_send_duration():
+        """Get the expected time between the close of a tree and the sending of its receipts, the mean of the previous trees.
+
+        :return: Expected duration in seconds, 0 before the first tree
+        :rtype: float
+        """
+        summary = Metrics().get_all()["summaries"].get("tree_send_duration")
+        return summary["mean"] if summary is not None else 0
+
+    def close_tree(self, manager):
+        """Close the current tree, then finalize it, send its root to the smart contract, archive it and send its receipts.
+
+        If the root can't be sent to the smart contract, the leaves go back to the current tree and are sent with it, see TreeManager.requeue_tree.
+
+        :param manager: Manager of the tree
+        :type manager: TreeManager
+        """
+        # the new leaves go to a fresh tree while this one is closed.
+        tree = manager.rotate_tree()
+        start = monotonic()
+        try:
+            print("Finalizing tree...")
+            tree.finalize_tree()
+            root = tree.get_root()
+
+            ts, tz = get_now_time()
+            t2 = f'{ts.strftime("%Y-%m-%d %H:%M:%S")} ({tz})'
+            hg, hd = get_hg_hd(root)
+            lid = EntropyPool().get_hex(8)
+            # cipher_text = xor_string(int(hg, 16), lid)
+            hgg, hgd = get_hg_hd(hg)
+            cipher_text = bytes_xor(hgg, hgd)
+            cipher_text = bytes_xor(cipher_text, convert_hexstring_to_binary(lid)).hex()
+            lid = "-".join(lid[i : i + 4] for i in range(0, len(lid), 4))
             try:
-                if tree.get_nb_elems() > 0:
-                    print("Finalizing tree...")
-                    tree.finalize_tree()
-                    root = tree.get_root()
-
-                    ts, tz = get_now_time()
-                    t2 = f'{ts.strftime("%Y-%m-%d %H:%M:%S")} ({tz})'
-                    hg, hd = get_hg_hd(root)
-                    try:
-                        lid = get_true_random(8, mode="x")
-                    except (ConnectTimeout, ConnectionError, ReadTimeout) as e:
-                        lid = binascii.b2a_hex(os.urandom(8)).decode("utf-8")
-                    # cipher_text = xor_string(int(hg, 16), lid)
-                    hgg, hgd = get_hg_hd(hg)
-                    cipher_text = bytes_xor(
-                        convert_hexstring_to_binary(hgg),
-                        convert_hexstring_to_binary(hgd),
-                    )
-                    cipher_text = bytes_xor(
-                        cipher_text, convert_hexstring_to_binary(lid)
-                    ).hex()
-                    lid = "-".join(lid[i : i + 4] for i in range(0, len(lid), 4))
-                    try:
-                        tree.send_root_to_chain(f"{cipher_text},{hd}, {t2}")
-                    except ContractCommunicationException:
-                        continue
-                    tree.send_pdfs(t2, lid)
-            finally:
-                delete_tmp_files()
-                tree.clear_tree()
-                tree.transfer_waiting_elem_to_tree()
-                tree_mutex.release()
+                manager.send_root_to_chain(
+                    f"{cipher_text},{hd.hex()}, {t2}", tree.want_ancrage_infos
+                )
+            except ContractCommunicationException:
+                # the leaves are sent with the next tree
+                manager.requeue_tree(tree)
+                return
+            try:
+                manager.archive_tree(tree, t2, lid)
+            except Exception as e:
+                logger.critical(f"The tree {root.hex()} could not be archived : {e}")
+            tree.send_pdfs(t2, lid)
+            manager.release_tree(tree)
+            Metrics().observe("tree_send_duration", monotonic() - start)
+        finally:
+            delete_tmp_files()
 
 
 if __name__ == "__main__":
     tree = TreeBuilder()
-    tree2 = TreeBuilder()
-    leaves_to_test = [0, 3, 9, 14, 27]
-    for i in range(32):
-        tree.add_elem(f"{i}")
-        # if(i in leaves_to_test):
-        # print(tree2.get_anterior_branches(i))
+    for i in range(27):
+        tree.add_elem(os.urandom(32), None, None, None, None)
     tree.finalize_tree()
-    # for i in leaves_to_test:
-    #     print(tree.get_posterior_branches(i))
-    print(tree2)
+    print(tree)
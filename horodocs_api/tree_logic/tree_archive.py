@@ -0,0 +1,325 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+from .node_store import DIGEST_SIZE
+
+ARCHIVE_MAGIC = b"HDTARCH1"
+
+#: Header of an archive : magic, number of sections, number of entries, then the offsets of the sections table, of the index by leaf, of the index by quittance and of the tree infos, and the size of the tree infos.
+ARCHIVE_HEADER = struct.Struct(">8sIQQQQQI")
+
+#: A section is a tree stored in the archive : the tree itself or one of its sub-trees. Position of its root in the tree (0 for the tree), offset of its levels table and number of levels.
+SECTION = struct.Struct(">QQI")
+
+#: A level of a section : offset of its nodes and number of nodes.
+LEVEL = struct.Struct(">QQ")
+
+#: An entry of an index : key, section and position of the leaf, offset and size of the JSON infos of the file.
+ENTRY = struct.Struct(f">{DIGEST_SIZE}sIQQI")
+
+
+def get_quittance_key(quittance):
+    """Get the key of a quittance in the index by quittance of the archives.
+
+    :param quittance: Quittance
+    :type quittance: str
+    :return: SHA256 digest of the quittance
+    :rtype: bytes
+    """
+    return hashlib.sha256(quittance.encode("utf-8")).digest()
+
+
+class TreeArchive:
+    """Immutable file holding a closed tree, read through a memory map.
+
+    The archive contains the levels of the tree and of its sub-trees as packed digests, and two sorted indexes of the files : by leaf digest and by quittance.
+    Finding the branches of a file only reads the O(log n) index entries and nodes it needs, so the archives are never loaded in memory.
+    """
+
+    def __init__(self, path) -> None:
+        """
+        :param path: Path of the archive
+        :type path: str
+        :raises ValueError: If the file is not an archive
+        """
+        self.path = path
+        with open(path, "rb") as archive_file:
+            self.__map = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            self.__nb_sections,
+            self.__nb_entries,
+            self.__sections_offset,
+            self.__leaf_index_offset,
+            self.__quittance_index_offset,
+            infos_offset,
+            infos_size,
+        ) = ARCHIVE_HEADER.unpack_from(self.__map, 0)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a tree archive.")
+        #: Infos of the tree : closing_time, lid, version and root.
+        self.infos = json.loads(self.__map[infos_offset : infos_offset + infos_size])
+
+    @staticmethod
+    def write(path, tree, infos):
+        """Write a finalized tree to an archive. The file is written aside and renamed, so an archive is always complete.
+
+        :param path: Path of the archive
+        :type path: str
+        :param tree: Finalized tree
+        :type tree: TreeBuilder
+        :param infos: Infos of the tree, kept in the archive
+        :type infos: Dict
+        :return: Quittances of the files of the archive
+        :rtype: Set[str]
+        """
+        sections = [(0, tree.get_levels())]
+        leaf_index = []
+        quittance_index = []
+        quittances = set()
+        # the infos of the files are written aside as the leaves are read, their offsets are relative to the first one until the size of the levels is known.
+        files_infos = tempfile.TemporaryFile()
+        data_size = 0
+        for section, position, leaf in TreeArchive.__iter_files(tree, sections):
+            element, _, quittance, file_infos = leaf
+            file_data = json.dumps(
+                {"quittance": quittance, "file": list(file_infos)}
+            ).encode("utf-8")
+            files_infos.write(file_data)
+            leaf_index.append((element, section, position, data_size, len(file_data)))
+            quittance_index.append(
+                (
+                    get_quittance_key(quittance),
+                    section,
+                    position,
+                    data_size,
+                    len(file_data),
+                )
+            )
+            quittances.add(quittance)
+            data_size += len(file_data)
+
+        infos_data = json.dumps(infos).encode("utf-8")
+        sections_offset = ARCHIVE_HEADER.size + len(infos_data)
+        levels_offset = sections_offset + len(sections) * SECTION.size
+        nodes_offset = levels_offset + sum(
+            len(levels) * LEVEL.size for _, levels in sections
+        )
+        sections_table = []
+        levels_table = []
+        for root_position, levels in sections:
+            sections_table.append(
+                SECTION.pack(root_position, levels_offset, len(levels))
+            )
+            levels_offset += len(levels) * LEVEL.size
+            for nodes in levels:
+                levels_table.append(LEVEL.pack(nodes_offset, len(nodes) // DIGEST_SIZE))
+                nodes_offset += len(nodes)
+        leaf_index_offset = nodes_offset
+        quittance_index_offset = leaf_index_offset + len(leaf_index) * ENTRY.size
+        data_offset = quittance_index_offset + len(quittance_index) * ENTRY.size
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as archive_file:
+            archive_file.write(
+                ARCHIVE_HEADER.pack(
+                    ARCHIVE_MAGIC,
+                    len(sections),
+                    len(leaf_index),
+                    sections_offset,
+                    leaf_index_offset,
+                    quittance_index_offset,
+                    ARCHIVE_HEADER.size,
+                    len(infos_data),
+                )
+            )
+            archive_file.write(infos_data)
+            archive_file.write(b"".join(sections_table))
+            archive_file.write(b"".join(levels_table))
+            for _, levels in sections:
+                for nodes in levels:
+                    archive_file.write(nodes)
+            # the entries start with their key, sorting them sorts by key.
+            for index in (leaf_index, quittance_index):
+                index.sort()
+                for key, section, position, offset, size in index:
+                    archive_file.write(
+                        ENTRY.pack(key, section, position, data_offset + offset, size)
+                    )
+            files_infos.seek(0)
+            shutil.copyfileobj(files_infos, archive_file)
+            files_infos.close()
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        os.replace(tmp_path, path)
+        return quittances
+
+    @staticmethod
+    def __iter_files(tree, sections):
+        """Iterate over the files of a tree and of its sub-trees, adding the levels of the sub-trees to the sections.
+
+        :return: Iterator of (section, position of the leaf in the section, leaf)
+        :rtype: Iterator[Tuple[int, int, Tuple[bytes, LeafInfos, str, tuple]]]
+        """
+        for position, leaf in enumerate(tree.get_leaves()):
+            if isinstance(leaf, tuple):
+                yield 0, position, leaf
+            elif leaf is not None:
+                sections.append((position, leaf.get_levels()))
+                for subtree_position, subtree_leaf in enumerate(leaf.get_leaves()):
+                    yield len(sections) - 1, subtree_position, subtree_leaf
+
+    def find_by_quittance(self, quittance):
+        """Get the proofs of all the files having a quittance.
+
+        :param quittance: Quittance of the files
+        :type quittance: str
+        :return: Proofs of the files, see get_proof
+        :rtype: List[Dict]
+        """
+        return [
+            self.get_proof(entry)
+            for entry in self.__find(
+                self.__quittance_index_offset, get_quittance_key(quittance)
+            )
+        ]
+
+    def find_by_leaf(self, leaf):
+        """Get the proofs of the files whose leaf has a digest.
+
+        :param leaf: Digest of the leaf
+        :type leaf: bytes
+        :return: Proofs of the files, see get_proof
+        :rtype: List[Dict]
+        """
+        return [
+            self.get_proof(entry)
+            for entry in self.__find(self.__leaf_index_offset, leaf)
+        ]
+
+    def get_proof(self, entry):
+        """Get the proof of a file, in the format of the arguments of its QR code.
+
+        :param entry: Entry of the file in an index
+        :type entry: Tuple[bytes, int, int, int, int]
+        :return: salt, md5, sha256, date, anterior_branches, posterior_branches and version of the file, and the closing time of the tree
+        :rtype: Dict
+        """
+        _, section, position, _, _ = entry
+        file_infos = json.loads(self.__get_file_data(entry))["file"]
+        anterior_branches, posterior_branches = self.get_branches(section, position)
+        return {
+            "salt": file_infos[0],
+            "md5": file_infos[2],
+            "sha256": file_infos[3],
+            "date": file_infos[1],
+            "anterior_branches": anterior_branches,
+            "posterior_branches": posterior_branches,
+            "version": self.infos["version"],
+            "closing_time": self.infos["closing_time"],
+        }
+
+    def get_branches(self, section, position):
+        """Get the branches of a leaf, reading only the nodes needed. The branches of a leaf of a sub-tree go through the sub-tree then the tree, as in TreeBuilder.get_receipts.
+
+        :param section: Section of the leaf, 0 for the tree
+        :type section: int
+        :param position: Position of the leaf in its section
+        :type position: int
+        :return: Anterior branches, posterior branches
+        :rtype: List[Tuple[int, int, str]], List[Tuple[int, int, str]]
+        """
+        root_position, levels_offset, nb_levels = self.__get_section(section)
+        anterior_branches, posterior_branches = self.__get_section_branches(
+            levels_offset, nb_levels, position
+        )
+        if section > 0:
+            depth = nb_levels - 1
+            # same positions and levels as if the sub-tree replaced its root in the tree.
+            anterior_branches = [
+                (l, i + (root_position << depth - l), h)
+                for l, i, h in anterior_branches
+            ]
+            posterior_branches = [
+                (l, i + (root_position << depth - l), h)
+                for l, i, h in posterior_branches
+            ]
+            _, tree_levels_offset, tree_nb_levels = self.__get_section(0)
+            tree_anterior, tree_posterior = self.__get_section_branches(
+                tree_levels_offset, tree_nb_levels, root_position
+            )
+            anterior_branches += [(l + depth, i, h) for l, i, h in tree_anterior]
+            posterior_branches += [(l + depth, i, h) for l, i, h in tree_posterior]
+        return anterior_branches, posterior_branches
+
+    def close(self):
+        """Unmap the archive."""
+        self.__map.close()
+
+    def __get_section(self, section):
+        """Read a section of the archive.
+
+        :raises KeyError: If the section does not exist
+        """
+        if section >= self.__nb_sections:
+            raise KeyError(section)
+        return SECTION.unpack_from(
+            self.__map, self.__sections_offset + section * SECTION.size
+        )
+
+    def __get_section_branches(self, levels_offset, nb_levels, position):
+        """Read the branches of a leaf in a section."""
+        anterior_branches = []
+        posterior_branches = []
+        for level in range(nb_levels - 1):
+            nodes_offset, nb_nodes = LEVEL.unpack_from(
+                self.__map, levels_offset + level * LEVEL.size
+            )
+            j = (position >> level) ^ 1
+            if j >= nb_nodes:
+                # promoted node, without sibling at this level.
+                continue
+            node = self.__map[
+                nodes_offset + j * DIGEST_SIZE : nodes_offset + (j + 1) * DIGEST_SIZE
+            ]
+            if j % 2 == 0:
+                anterior_branches.append((level, j, node.hex()))
+            else:
+                posterior_branches.append((level, j, node.hex()))
+        return anterior_branches, posterior_branches
+
+    def __find(self, index_offset, key):
+        """Binary search of all the entries of an index having a key.
+
+        :return: Entries found
+        :rtype: List[Tuple[bytes, int, int, int, int]]
+        """
+        low, high = 0, self.__nb_entries
+        while low < high:
+            middle = (low + high) // 2
+            if self.__get_key(index_offset, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        while low < self.__nb_entries and self.__get_key(index_offset, low) == key:
+            entries.append(
+                ENTRY.unpack_from(self.__map, index_offset + low * ENTRY.size)
+            )
+            low += 1
+        return entries
+
+    def __get_key(self, index_offset, n):
+        """Read the key of the n entry of an index."""
+        offset = index_offset + n * ENTRY.size
+        return self.__map[offset : offset + DIGEST_SIZE]
+
+    def __get_file_data(self, entry):
+        """Read the JSON infos of the file of an entry."""
+        _, _, _, data_offset, data_size = entry
+        return self.__map[data_offset : data_offset + data_size]